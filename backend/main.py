@@ -1,23 +1,31 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from services.stock_monitor import StockMonitor
 from services.alert_service import AlertService
-from services.stock_scanner import StockScanner
+from services.alert_scheduler import AlertScheduler
+from services.alert_rules import AlertRuleEngine, RuleError, RuleNotFoundError, FEATURES as ALERT_FEATURES, DIRECTIONS
+from services.stock_scanner import StockScanner, load_universe
+from services.screen_query import QueryError
+from services.fundamentals import fundamentals
+from services.backtest_jobs import BacktestJobRunner
+from services.signal_stats import signal_statistics, HORIZONS
+from services import param_sweep
 from services.stock_analyzer import StockAnalyzer
+from services.market_data import get_provider
+from services.async_data import http_client, run_blocking, run_cpu
+import asyncio
 import logging
 import sys
 from pydantic import BaseModel
-from typing import Optional, List, Dict
-import yfinance as yf
-import requests
-import time
+from typing import Optional, List, Dict, Union
 import json
 import os
 from pathlib import Path
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 import urllib.parse
+from datetime import datetime
 
 # 设置更详细的日志
 logging.basicConfig(
@@ -54,10 +62,13 @@ async def validation_exception_handler(request, exc):
     )
 
 # 初始化服务
-# stock_monitor = StockMonitor()
+alert_rules = AlertRuleEngine(resolve_group=lambda group: resolve_group_symbols(load_watchlist(), group))
+stock_monitor = StockMonitor(alert_rules)
 # alert_service = AlertService()
-# stock_scanner = StockScanner()
 stock_analyzer = StockAnalyzer()
+stock_scanner = StockScanner(stock_analyzer)
+backtest_runner = BacktestJobRunner(stock_analyzer)
+alert_scheduler = AlertScheduler(stock_monitor, lambda: watchlist_symbols())
 
 # 创建数据目录
 data_dir = Path(__file__).parent / 'data'
@@ -101,6 +112,24 @@ def save_watchlist(data):
         logger.error(f"Error saving watchlist: {str(e)}")
         raise
 
+def resolve_group_symbols(watchlist, group_path):
+    """按分组路径（如 观察/美股）收集该分组及其子分组中的全部股票"""
+    current_group = watchlist
+    group = None
+    for part in group_path.split('/'):
+        if part not in current_group:
+            raise HTTPException(status_code=404, detail=f"分组 {part} 不存在")
+        group = current_group[part]
+        current_group = group.get("subGroups") or {}
+
+    def collect_stocks(group):
+        stocks = list(group.get("stocks", []))
+        for subgroup in (group.get("subGroups") or {}).values():
+            stocks.extend(collect_stocks(subgroup))
+        return stocks
+
+    return collect_stocks(group)
+
 # 修改全局变量
 STOCK_GROUPS = load_watchlist()
 
@@ -188,14 +217,79 @@ class StockReorder(BaseModel):
     target_symbol: str
     position: str  # 'before' or 'after'
 
+class BatchAnalysisRequest(BaseModel):
+    symbols: Optional[List[str]] = None
+    group: Optional[str] = None  # 分组路径，如 观察/美股
+
+class BacktestJobRequest(BaseModel):
+    start_date: str
+    end_date: str
+    symbols: Optional[List[str]] = None
+    group: Optional[str] = None  # 不指定股票和分组时回测全部观察列表
+
+class FundamentalsRefreshRequest(BaseModel):
+    symbols: Optional[List[str]] = None
+    group: Optional[str] = None  # 不指定股票和分组时刷新股票池和全部观察列表
+    force: bool = False  # 为 True 时当天已有的记录也重新拉取
+
+class AlertRuleRequest(BaseModel):
+    feature: str  # 特征名，见 GET /api/alert-rules
+    direction: str = "above"  # above / below / at_or_above / at_or_below
+    threshold: Union[float, str]  # 数值，或另一个特征名（如 high_52w）
+    cooldown: Optional[float] = None  # 同一股票两次触发的最短间隔（秒），缺省 3600
+    symbols: Optional[List[str]] = None  # 作用范围：指定股票
+    group: Optional[str] = None  # 作用范围：观察列表分组路径；都不指定时作用于全部股票
+    id: Optional[str] = None
+    name: Optional[str] = None
+    message: Optional[str] = None  # 消息模板，可用 {value} {threshold} {symbol}
+    enabled: bool = True
+
+class SweepRequest(BaseModel):
+    start_date: str
+    end_date: str
+    strategy: str = "money_flow"  # money_flow 或 surge
+    symbols: Optional[List[str]] = None
+    group: Optional[str] = None  # 不指定股票和分组时使用全部观察列表
+    horizon: int = 1  # 持有交易日数
+    grid: Optional[Dict[str, List[float]]] = None  # 参数取值，缺省使用规则自带的网格
+    samples: Optional[int] = None  # 指定时在取值范围内随机采样
+    seed: Optional[int] = None
+    min_signals: int = 30
+    top: int = 20
+
 # 添加新的 Pydantic 模型用于备注
 class StockNote(BaseModel):
     symbol: str
     note: str
 
+def watchlist_symbols():
+    """全部观察列表中的股票"""
+    watchlist = load_watchlist()
+    symbols = []
+    for group_name in watchlist:
+        symbols.extend(resolve_group_symbols(watchlist, group_name))
+    return list(dict.fromkeys(symbol.upper() for symbol in symbols))
+
+def fundamentals_universe():
+    """股票池和全部观察列表中的股票"""
+    return list(dict.fromkeys([symbol.upper() for symbol in load_universe()] + watchlist_symbols()))
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting up FastAPI application")
+    # 后台预热基本面快照（只拉取当天尚未缓存的股票），扫描和校验不再等待 .info
+    if os.getenv('FUNDAMENTALS_PREFETCH', '1') != '0':
+        fundamentals.refresh_in_background(fundamentals_universe())
+    # 后台定期检查观察列表预警，通过 /ws/alerts 推送（ALERT_SCHEDULER=0 关闭）
+    if os.getenv('ALERT_SCHEDULER', '1') != '0':
+        alert_scheduler.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # 关闭共享连接池
+    await alert_scheduler.stop()
+    await http_client.aclose()
+    backtest_runner.shutdown()
 
 @app.get("/", status_code=200)
 async def root():
@@ -221,22 +315,188 @@ async def get_watchlist():
         logger.error(f"Error in get_watchlist: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# @app.get("/api/alerts/{symbol}")
-# async def check_alerts(symbol: str):
-#     try:
-#         alerts = stock_monitor.check_alerts(symbol)
-#         return alerts
-#     except Exception as e:
-#         logger.error(f"Error checking alerts for {symbol}: {str(e)}")
-#         raise HTTPException(status_code=500, detail=str(e))
-
-# @app.get("/api/scanner")
-# async def scan_stocks():
-#     try:
-#         results = stock_scanner.scan_market()
-#         return results
-#     except Exception as e:
-#         raise HTTPException(status_code=500, detail=str(e))
+def parse_time(value: Optional[str]):
+    """解析时间参数：Unix秒或 ISO 格式日期时间"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"无法解析时间: {value}")
+
+@app.get("/api/alert-history")
+async def get_alert_history(start: Optional[str] = None, end: Optional[str] = None,
+                            symbol: Optional[str] = None, type: Optional[str] = None,
+                            before: Optional[int] = None, limit: int = 100):
+    """查询预警记录（新的在前），翻页时把上一页返回的 next_before 作为 before 传入"""
+    if limit < 1 or limit > 1000:
+        raise HTTPException(status_code=400, detail="limit 应在 1 到 1000 之间")
+    return await run_blocking(stock_monitor.alert_log.query, parse_time(start), parse_time(end),
+                              symbol, type, before, limit)
+
+@app.get("/api/alerts/{symbol}")
+async def check_alerts(symbol: str):
+    """获取股票预警：观察列表中的股票直接返回后台调度最近一个周期的结果，其余股票即时检查"""
+    try:
+        alerts = alert_scheduler.fresh(symbol)
+        if alerts is None:
+            alerts = await run_blocking(stock_monitor.check_alerts, symbol.upper())
+        return alerts
+    except Exception as e:
+        logger.error(f"Error checking alerts for {symbol}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def alert_rule_fields(rule: AlertRuleRequest):
+    return {field: getattr(rule, field) for field in (
+        'id', 'name', 'feature', 'direction', 'threshold', 'cooldown', 'symbols', 'group', 'message', 'enabled'
+    )}
+
+@app.get("/api/alert-rules")
+async def list_alert_rules():
+    """获取全部预警规则及可用的特征和方向"""
+    return {"rules": alert_rules.rules(), "features": list(ALERT_FEATURES), "directions": list(DIRECTIONS)}
+
+@app.post("/api/alert-rules")
+async def create_alert_rule(rule: AlertRuleRequest):
+    """新增预警规则，下一个检查周期生效"""
+    try:
+        if rule.group:
+            resolve_group_symbols(load_watchlist(), rule.group)
+        return alert_rules.add(alert_rule_fields(rule))
+    except RuleError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.put("/api/alert-rules/{rule_id}")
+async def update_alert_rule(rule_id: str, rule: AlertRuleRequest):
+    """修改预警规则（整体替换），已有的冷却状态保留"""
+    try:
+        if rule.group:
+            resolve_group_symbols(load_watchlist(), rule.group)
+        return alert_rules.update(rule_id, alert_rule_fields(rule))
+    except RuleNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RuleError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/api/alert-rules/{rule_id}")
+async def delete_alert_rule(rule_id: str):
+    """删除预警规则"""
+    try:
+        alert_rules.remove(rule_id)
+        return {"success": True, "message": f"规则 {rule_id} 已删除"}
+    except RuleNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.websocket("/ws/alerts")
+async def alerts_websocket(websocket: WebSocket):
+    """预警推送：连接后先发送当前处于触发状态的预警（snapshot），之后推送每个周期新触发的预警（alerts）"""
+    await websocket.accept()
+    queue = alert_scheduler.subscribe()
+    # 同时等待客户端消息，以便客户端断开时立即退出（客户端发送的内容忽略）
+    receiver = asyncio.ensure_future(websocket.receive_text())
+    getter = None
+    try:
+        await websocket.send_json({
+            "type": "snapshot",
+            "alerts": alert_scheduler.active_alerts(),
+            "timestamp": datetime.now().isoformat()
+        })
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({receiver, getter}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                receiver.result()  # 客户端断开时抛出 WebSocketDisconnect
+                receiver = asyncio.ensure_future(websocket.receive_text())
+            if getter in done:
+                await websocket.send_json(getter.result())
+            else:
+                getter.cancel()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        alert_scheduler.unsubscribe(queue)
+        receiver.cancel()
+        if getter is not None:
+            getter.cancel()
+
+@app.get("/api/scanner")
+async def scan_stocks(symbols: Optional[str] = None, group: Optional[str] = None, timeout: Optional[float] = None):
+    """扫描异动股票：默认扫描整个股票池，也可指定逗号分隔的股票列表或分组路径
+
+    超时或获取失败的股票记入 failed，不影响其余股票的结果。
+    """
+    try:
+        universe = [symbol.strip() for symbol in (symbols or '').split(',') if symbol.strip()]
+        if group:
+            universe.extend(resolve_group_symbols(load_watchlist(), group))
+            if not universe:
+                raise HTTPException(status_code=400, detail="股票列表不能为空")
+        if timeout is not None and timeout <= 0:
+            raise HTTPException(status_code=400, detail="timeout 必须大于0")
+        return await stock_scanner.scan_market_async(universe or None, timeout=timeout)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error scanning market: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/scanner/stream")
+async def stream_scan(symbols: Optional[str] = None, group: Optional[str] = None, timeout: Optional[float] = None,
+                      format: str = "ndjson"):
+    """流式扫描：每只股票符合条件时立即推送报告，并定期推送进度
+
+    format=ndjson 时每行一个JSON事件；format=sse 时为 Server-Sent Events（事件名即 type）。
+    """
+    universe = [symbol.strip() for symbol in (symbols or '').split(',') if symbol.strip()]
+    if group:
+        universe.extend(resolve_group_symbols(load_watchlist(), group))
+        if not universe:
+            raise HTTPException(status_code=400, detail="股票列表不能为空")
+    if timeout is not None and timeout <= 0:
+        raise HTTPException(status_code=400, detail="timeout 必须大于0")
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format 必须为 ndjson 或 sse")
+
+    async def events():
+        try:
+            async for event in stock_scanner.scan_market_stream(universe or None, timeout=timeout):
+                data = json.dumps(event, ensure_ascii=False, default=str)
+                yield f"event: {event['type']}\ndata: {data}\n\n" if format == "sse" else data + "\n"
+        except Exception as e:
+            logger.error(f"Error streaming scan: {str(e)}")
+            data = json.dumps({"type": "error", "error": str(e)}, ensure_ascii=False)
+            yield f"event: error\ndata: {data}\n\n" if format == "sse" else data + "\n"
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+@app.get("/api/scanner/query")
+async def query_stocks(q: str, symbols: Optional[str] = None, group: Optional[str] = None,
+                       timeout: Optional[float] = None):
+    """用查询语言筛选股票，如 q=rsi14 between 50 and 70 and volume / avg30 > 3 and mcap < 5e9
+
+    默认筛选整个股票池；特征表在一段时间内复用，重复查询只做向量化计算。
+    """
+    try:
+        universe = [symbol.strip() for symbol in (symbols or '').split(',') if symbol.strip()]
+        if group:
+            universe.extend(resolve_group_symbols(load_watchlist(), group))
+            if not universe:
+                raise HTTPException(status_code=400, detail="股票列表不能为空")
+        if timeout is not None and timeout <= 0:
+            raise HTTPException(status_code=400, detail="timeout 必须大于0")
+        return await stock_scanner.query_async(q, universe or None, timeout=timeout)
+    except HTTPException:
+        raise
+    except QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error querying stocks: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/watchlist/{group:path}/{symbol}")
 async def remove_stock(group: str, symbol: str):
@@ -309,17 +569,17 @@ async def add_group(group: StockGroup):
 @app.get("/api/stock/validate/{symbol}")
 async def validate_stock(symbol: str):
     try:
-        ticker = yf.Ticker(symbol)
-        hist = ticker.history(period='1d')
+        provider = get_provider()
+        hist = await run_blocking(provider.history, symbol, period='1d')
         
         if hist.empty:
             return {"valid": False, "error": "无法获取股票数据"}
             
-        info = ticker.info
+        info = await fundamentals.get_async(symbol)
         return {
             "valid": True,
             "name": info.get('longName', '') or info.get('shortName', ''),
-            "price": hist['Close'][-1] if not hist.empty else 0
+            "price": hist['Close'].iloc[-1] if not hist.empty else 0
         }
     except Exception as e:
         return {"valid": False, "error": str(e)}
@@ -327,48 +587,8 @@ async def validate_stock(symbol: str):
 @app.get("/api/stock/search/{query}")
 async def search_stocks(query: str):
     try:
-        # 添加请求头和延迟
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        # 添加重试机制
-        max_retries = 3
-        retry_delay = 1  # 秒
-        
-        for attempt in range(max_retries):
-            try:
-                search_url = f"https://query2.finance.yahoo.com/v1/finance/search?q={query}"
-                response = requests.get(search_url, headers=headers)
-                
-                if response.status_code == 429:  # Rate limit
-                    if attempt < max_retries - 1:
-                        time.sleep(retry_delay)
-                        continue
-                    else:
-                        return []  # 达到最大重试次数
-                
-                response.raise_for_status()
-                data = response.json()
-                
-                # 过滤并格式化结果
-                suggestions = []
-                for item in data.get('quotes', [])[:10]:
-                    if item.get('quoteType') == 'EQUITY':
-                        suggestions.append({
-                            'symbol': item.get('symbol'),
-                            'name': item.get('longname') or item.get('shortname'),
-                            'exchange': item.get('exchange')
-                        })
-                return suggestions
-                
-            except requests.exceptions.RequestException as e:
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    continue
-                logger.error(f"Request failed after {max_retries} attempts: {str(e)}")
-                return []
-                
+        # 限流与429重试由数据源处理
+        return await get_provider().search_async(query)
     except Exception as e:
         logger.error(f"Error in stock search: {str(e)}")
         # 返回空列表而不是抛出错误，这样前端不会崩溃
@@ -378,18 +598,44 @@ async def search_stocks(query: str):
 async def analyze_stock(symbol: str):
     """获取股票分析报告"""
     try:
-        report = stock_analyzer.generate_daily_report(symbol)
+        report = await stock_analyzer.generate_daily_report_async(symbol)
         return report
     except Exception as e:
         logger.error(f"Error analyzing stock {symbol}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/stock/analysis")
+async def analyze_stocks(batch: BatchAnalysisRequest):
+    """批量获取股票分析报告（股票列表或分组路径）"""
+    try:
+        symbols = list(batch.symbols or [])
+        if batch.group:
+            symbols.extend(resolve_group_symbols(load_watchlist(), batch.group))
+        symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+        
+        if not symbols:
+            raise HTTPException(status_code=400, detail="股票列表不能为空")
+        
+        reports = await stock_analyzer.generate_batch_reports_async(symbols)
+        return {"reports": reports}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in batch analysis: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/stock/backtest/{symbol}")
-async def backtest_stock(symbol: str, start_date: str, end_date: str):
-    """获取股票回测分析结果"""
+async def backtest_stock(symbol: str, start_date: str, end_date: str, mode: str = "day"):
+    """获取股票回测分析结果
+
+    mode=day 只回测 end_date 当天；mode=range 回测区间内每个交易日（一次拉取、一次计算）。
+    """
     try:
-        logger.info(f"Starting backtest for {symbol} from {start_date} to {end_date}")
-        results = stock_analyzer.backtest_analysis(symbol, start_date, end_date)
+        logger.info(f"Starting backtest for {symbol} from {start_date} to {end_date} ({mode})")
+        if mode == "range":
+            results = await stock_analyzer.backtest_range_async(symbol, start_date, end_date)
+        else:
+            results = await stock_analyzer.backtest_analysis_async(symbol, start_date, end_date)
         
         if isinstance(results, dict) and "error" in results:
             raise HTTPException(status_code=400, detail=results["error"])
@@ -400,6 +646,154 @@ async def backtest_stock(symbol: str, start_date: str, end_date: str):
         logger.error(f"Error in backtest analysis for {symbol}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def parse_horizons(horizons: Optional[str]):
+    """解析持有天数参数，如 "1,5,20" """
+    if not horizons:
+        return HORIZONS
+    try:
+        values = tuple(int(h) for h in horizons.split(','))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="持有天数格式错误")
+    if not values or any(h <= 0 for h in values):
+        raise HTTPException(status_code=400, detail="持有天数必须为正整数")
+    return values
+
+@app.get("/api/stock/backtest/{symbol}/stats")
+async def backtest_signal_stats(symbol: str, start_date: str, end_date: str, horizons: Optional[str] = None):
+    """单只股票区间回测的信号统计（各信号之后N个交易日的胜率、收益及置信区间）"""
+    try:
+        horizon_days = parse_horizons(horizons)
+        report = await stock_analyzer.backtest_range_async(symbol, start_date, end_date)
+        if "error" in report:
+            raise HTTPException(status_code=400, detail=report["error"])
+        return await run_cpu(signal_statistics, {symbol: report}, horizon_days)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in signal stats for {symbol}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/backtest/jobs")
+async def submit_backtest_job(job: BacktestJobRequest):
+    """提交多股票回测任务（进程池并行计算），返回任务ID用于轮询"""
+    try:
+        watchlist = load_watchlist()
+        symbols = list(job.symbols or [])
+        if job.group:
+            symbols.extend(resolve_group_symbols(watchlist, job.group))
+        elif not symbols:
+            for group_name in watchlist:
+                symbols.extend(resolve_group_symbols(watchlist, group_name))
+        symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+        
+        if not symbols:
+            raise HTTPException(status_code=400, detail="股票列表不能为空")
+        
+        return backtest_runner.submit(symbols, job.start_date, job.end_date)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error submitting backtest job: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/backtest/sweep")
+async def sweep_thresholds(request: SweepRequest):
+    """阈值参数扫描：指标只计算一次，广播比较全部参数组合并按胜率区间下限排序"""
+    try:
+        watchlist = load_watchlist()
+        symbols = list(request.symbols or [])
+        if request.group:
+            symbols.extend(resolve_group_symbols(watchlist, request.group))
+        elif not symbols:
+            for group_name in watchlist:
+                symbols.extend(resolve_group_symbols(watchlist, group_name))
+        symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+        if not symbols:
+            raise HTTPException(status_code=400, detail="股票列表不能为空")
+        if request.horizon <= 0:
+            raise HTTPException(status_code=400, detail="持有天数必须为正整数")
+        # 对比行使用线上当前生效的阈值（预警规则和扫描器设置）
+        current = param_sweep.get_strategy(request.strategy).current(rules=alert_rules, scanner=stock_scanner)
+
+        start, end = param_sweep.fetch_range(request.start_date, request.end_date, request.horizon)
+        bars = await asyncio.gather(*(stock_analyzer.get_bars_async(symbol, start=start, end=end) for symbol in symbols))
+        return await run_cpu(
+            param_sweep.sweep, request.strategy, dict(zip(symbols, bars)), request.start_date, request.end_date,
+            horizon=request.horizon, grid=request.grid, samples=request.samples, seed=request.seed,
+            min_signals=request.min_signals, top=request.top, current=current
+        )
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in threshold sweep: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/backtest/jobs/{job_id}")
+async def get_backtest_job(job_id: str):
+    """查询回测任务进度和结果"""
+    status = backtest_runner.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="回测任务不存在")
+    return status
+
+@app.get("/api/backtest/jobs/{job_id}/stats")
+async def get_backtest_job_stats(job_id: str, horizons: Optional[str] = None):
+    """汇总回测任务中全部股票的信号统计（任务未完成时基于已完成的股票）"""
+    horizon_days = parse_horizons(horizons)
+    status = backtest_runner.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="回测任务不存在")
+    stats = await run_cpu(signal_statistics, status["results"], horizon_days)
+    stats["job_status"] = status["status"]
+    return stats
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """获取数据层运行指标（请求合并情况等）"""
+    return {
+        "single_flight": stock_analyzer.fetch_flight.stats(),
+        "backtest_cache": stock_analyzer.result_cache.stats(),
+        "fundamentals": fundamentals.stats(),
+        "alert_scheduler": alert_scheduler.stats(),
+        "monitor_cache": stock_monitor.data_cache.stats(),
+        "alert_rules": alert_rules.stats(),
+        "alert_log": stock_monitor.alert_log.stats()
+    }
+
+@app.post("/api/fundamentals/refresh")
+async def refresh_fundamentals(request: FundamentalsRefreshRequest):
+    """后台批量刷新基本面快照，返回刷新进度（已有刷新在进行时返回其进度）"""
+    try:
+        symbols = list(request.symbols or [])
+        if request.group:
+            symbols.extend(resolve_group_symbols(load_watchlist(), request.group))
+        elif not symbols:
+            symbols = fundamentals_universe()
+        if not symbols:
+            raise HTTPException(status_code=400, detail="股票列表不能为空")
+        return fundamentals.refresh_in_background(symbols, force=request.force)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error refreshing fundamentals: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/fundamentals/refresh")
+async def get_fundamentals_refresh():
+    """查询基本面批量刷新进度"""
+    return fundamentals.refresh_status()
+
+@app.get("/api/fundamentals/{symbol}")
+async def get_fundamentals(symbol: str):
+    """获取股票的基本面快照（当天有效）"""
+    try:
+        return await fundamentals.get_async(symbol)
+    except Exception as e:
+        logger.error(f"Error getting fundamentals for {symbol}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/watchlist/move")
 async def move_stock(move: StockMove):
     try:
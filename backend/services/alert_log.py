@@ -0,0 +1,205 @@
+"""预警记录
+
+- 最近的预警保存在内存环形缓冲区中（固定条数）
+- 全部预警按时间顺序追加写入磁盘分段文件（JSON Lines），单段超过大小上限时开新段，
+  超过保留段数时删除最早的段，磁盘占用同样有上限
+- 去重：同一股票、同一规则的预警在该规则的冷却时间内只记录一次（与推送使用同一个冷却时间，
+  重启后也能去重）；索引键为 (股票, 规则) 的定长哈希，只保留仍在冷却期内的键，长期运行内存占用不随时间增长
+- 查询：按时间范围和股票/类型过滤，新的在前，通过 before（记录序号）翻页；
+  范围落在环形缓冲区内时不读磁盘，否则只读取与时间范围重叠的分段
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from pathlib import Path
+
+from services.alert_rules import DEFAULT_COOLDOWN
+from services.market_data import DATA_DIR, get_provider
+
+logger = logging.getLogger(__name__)
+
+ALERT_LOG_RECENT = int(os.getenv('ALERT_LOG_RECENT', 1000))
+ALERT_LOG_SEGMENT_BYTES = int(os.getenv('ALERT_LOG_SEGMENT_KB', 1024)) * 1024
+ALERT_LOG_MAX_SEGMENTS = int(os.getenv('ALERT_LOG_MAX_SEGMENTS', 100))
+
+_SEGMENT = re.compile(r'segment-(\d+)-(\d+)\.jsonl')
+
+
+def _dedup_key(symbol, alert_type):
+    return hashlib.blake2b(f"{symbol}\0{alert_type}".encode(), digest_size=8).digest()
+
+
+class AlertLog:
+    """有界、持久化的预警记录
+
+    cooldown 为 规则ID -> 冷却秒数 的函数（通常为 AlertRuleEngine.cooldown），缺省为 DEFAULT_COOLDOWN。
+    """
+
+    def __init__(self, root=None, recent=ALERT_LOG_RECENT, cooldown=None,
+                 segment_bytes=ALERT_LOG_SEGMENT_BYTES, max_segments=ALERT_LOG_MAX_SEGMENTS):
+        self.root = Path(root) if root else DATA_DIR / 'alerts' / get_provider().name
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.cooldown = cooldown or (lambda alert_type: DEFAULT_COOLDOWN)
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=recent)
+        self._suppress_until = OrderedDict()  # 去重键 -> 冷却结束时间，按记录时间从旧到新排列
+        self._segments = []  # [(首条序号, 首条时间, 路径)]，按序号排列
+        self._next_id = 1
+        self.recorded = 0
+        self.suppressed = 0
+        self._restore()
+
+    def _restore(self):
+        """从磁盘恢复分段列表，并用最后两段重建环形缓冲区和去重索引"""
+        for path in self.root.glob('segment-*.jsonl'):
+            match = _SEGMENT.fullmatch(path.name)
+            if match:
+                self._segments.append((int(match.group(1)), int(match.group(2)), path))
+        self._segments.sort()
+        for first_id, _, path in self._segments[-2:]:
+            for record in self._read(path):
+                self._recent.append(record)
+                self._remember(record)
+                self._next_id = max(self._next_id, record['id'] + 1)
+        if self._segments and not self._recent:
+            self._next_id = self._segments[-1][0]
+
+    @staticmethod
+    def _read(path):
+        records = []
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # 写入中断留下的不完整行
+                        continue
+        except FileNotFoundError:
+            pass
+        return records
+
+    def _remember(self, record):
+        key = _dedup_key(record['symbol'], record['type'])
+        self._suppress_until[key] = record['ts'] + self.cooldown(record['type'])
+        self._suppress_until.move_to_end(key)
+
+    def _expire(self, now):
+        # 各规则冷却时间不同，只从最早记录的一端清理；未清理的过期键在查找时按时间判断
+        while self._suppress_until:
+            key, until = next(iter(self._suppress_until.items()))
+            if until > now:
+                break
+            self._suppress_until.popitem(last=False)
+
+    def _segment_for(self, record, size):
+        """当前可追加的分段，已满时开新段并删除超出保留数的旧段"""
+        if self._segments:
+            path = self._segments[-1][2]
+            try:
+                if path.stat().st_size + size <= self.segment_bytes:
+                    return path
+            except FileNotFoundError:
+                pass
+        path = self.root / f"segment-{record['id']:012d}-{int(record['ts'])}.jsonl"
+        self._segments.append((record['id'], int(record['ts']), path))
+        while len(self._segments) > self.max_segments:
+            _, _, expired = self._segments.pop(0)
+            expired.unlink(missing_ok=True)
+        return path
+
+    def record(self, alerts, now=None):
+        """记录一批预警（每条需包含 symbol 和 type），规则冷却时间内重复的跳过，返回实际记录的预警"""
+        now = time.time() if now is None else now
+        written = []
+        with self._lock:
+            self._expire(now)
+            for alert in alerts:
+                key = _dedup_key(alert['symbol'], alert['type'])
+                if self._suppress_until.get(key, 0) > now:
+                    self.suppressed += 1
+                    continue
+                record = dict(alert, id=self._next_id, ts=now, time=datetime.fromtimestamp(now).isoformat())
+                self._next_id += 1
+                self._remember(record)
+                self._recent.append(record)
+                written.append(record)
+            if written:
+                self._append(written)
+                self.recorded += len(written)
+        return written
+
+    def _append(self, records):
+        lines = [json.dumps(record, ensure_ascii=False, default=float) + '\n' for record in records]
+        data = ''.join(lines).encode('utf-8')
+        try:
+            path = self._segment_for(records[0], len(data))
+            with open(path, 'ab') as f:
+                f.write(data)
+        except Exception as e:
+            logger.error(f"写入预警记录失败: {str(e)}")
+
+    def query(self, start=None, end=None, symbol=None, alert_type=None, before=None, limit=100):
+        """按时间范围（Unix秒，含两端）查询，新的在前；before 为上一页最后一条的 id
+
+        返回 {'alerts', 'next_before'}，next_before 为 None 时没有更多记录。
+        """
+        symbol = symbol.upper() if symbol else None
+
+        def matches(record):
+            return (start is None or record['ts'] >= start) and (end is None or record['ts'] <= end) \
+                and (before is None or record['id'] < before) \
+                and (symbol is None or record['symbol'] == symbol) \
+                and (alert_type is None or record['type'] == alert_type)
+
+        with self._lock:
+            recent = list(self._recent)
+            segments = list(self._segments)
+        results = [record for record in reversed(recent) if matches(record)][:limit + 1]
+        oldest_recent = recent[0]['id'] if recent else None
+        covered = oldest_recent is not None and segments and oldest_recent <= segments[0][0]
+        # 环形缓冲区不能覆盖查询范围时，按从新到旧读取与范围重叠的分段
+        if len(results) <= limit and not covered and (not recent or start is None or recent[0]['ts'] > start):
+            boundary = oldest_recent if oldest_recent is not None else float('inf')
+            for index in range(len(segments) - 1, -1, -1):
+                first_id, first_ts, path = segments[index]
+                if first_id >= boundary or (before is not None and first_id >= before):
+                    continue
+                if end is not None and first_ts > end:
+                    continue
+                # 文件名中的时间取整到秒：下一段首条时间 < next_ts + 1，本段及更早的分段全部早于 start
+                next_ts = segments[index + 1][1] if index + 1 < len(segments) else float('inf')
+                if start is not None and next_ts + 1 <= start:
+                    break
+                older = [record for record in reversed(self._read(path)) if record['id'] < boundary and matches(record)]
+                results.extend(older[:limit + 1 - len(results)])
+                if len(results) > limit:
+                    break
+        page = results[:limit]
+        return {
+            'alerts': page,
+            'next_before': page[-1]['id'] if len(results) > limit else None
+        }
+
+    def recent(self, limit=100):
+        with self._lock:
+            return list(self._recent)[-limit:][::-1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'recent': len(self._recent),
+                'dedup_keys': len(self._suppress_until),
+                'segments': len(self._segments),
+                'recorded': self.recorded,
+                'suppressed': self.suppressed,
+                'next_id': self._next_id
+            }
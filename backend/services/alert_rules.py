@@ -0,0 +1,378 @@
+"""预警规则引擎
+
+规则为声明式的单条件：特征、方向、阈值（数值或另一个特征）、冷却时间和作用范围（股票列表或观察列表分组）。
+全部规则编译为按规则排列的数组，每个周期对 (规则 × 股票) 一次向量化比较，规则增删改后下次评估时重新编译，
+无需重启服务。规则保存在 data/alert_rules.json。
+
+特征（每只股票一个数值，缺失为NaN，比较结果为False）：
+- price: 最新价；daily_change: 当日涨幅%；change_15m: 最近一根15分钟K线涨幅%
+- volume / volume_ma: 当日成交量 / 15分钟成交量均线；rsi / mfi / macd / macd_signal: 盘中指标
+- high_52w / low_52w: 52周高低点（含当天盘中）；session_high / session_low: 当天盘中高低点
+- high_Nd / low_Nd: 此前N个交易日（不含当天）的高低点，N 见 EXTREME_WINDOWS，用于通道突破
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+from services.extremes_index import EXTREME_WINDOWS
+from services.market_data import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+RULES_FILE = DATA_DIR / 'alert_rules.json'
+
+FEATURES = (
+    'price', 'daily_change', 'change_15m', 'volume', 'volume_ma', 'rsi', 'mfi', 'macd', 'macd_signal',
+    'high_52w', 'low_52w', 'session_high', 'session_low'
+) + tuple(f'{name}_{window}d' for window in EXTREME_WINDOWS for name in ('high', 'low'))
+
+DIRECTIONS = {
+    'above': np.greater,
+    'below': np.less,
+    'at_or_above': np.greater_equal,
+    'at_or_below': np.less_equal
+}
+
+_OPERATORS = {'above': '>', 'below': '<', 'at_or_above': '>=', 'at_or_below': '<='}
+
+DEFAULT_COOLDOWN = 3600
+
+# 缓存的作用范围矩阵数（调度周期的全部股票与单只股票的即时检查互不挤占）
+SCOPE_CACHE_SIZE = 4
+
+DEFAULT_THRESHOLDS = {
+    'daily_change': 5.0,  # 5%
+    'rapid_rise': 3.0     # 3%
+}
+
+# 原有的固定预警条件
+DEFAULT_RULES = [
+    {'id': 'daily_surge', 'name': '单日涨幅', 'feature': 'daily_change', 'direction': 'above',
+     'threshold': DEFAULT_THRESHOLDS['daily_change'], 'message': '单日涨幅达到 {value:.2f}%'},
+    {'id': 'rapid_rise', 'name': '15分钟急涨', 'feature': 'change_15m', 'direction': 'above',
+     'threshold': DEFAULT_THRESHOLDS['rapid_rise'], 'message': '15分钟涨幅达到 {value:.2f}%'},
+    {'id': 'new_high', 'name': '52周新高', 'feature': 'price', 'direction': 'at_or_above', 'threshold': 'high_52w',
+     'message': '突破52周新高: {value:.2f}'},
+    {'id': 'new_low', 'name': '52周新低', 'feature': 'price', 'direction': 'at_or_below', 'threshold': 'low_52w',
+     'message': '跌破52周新低: {value:.2f}'}
+]
+
+
+class RuleError(ValueError):
+    """规则格式错误"""
+
+
+class RuleNotFoundError(RuleError):
+    """规则不存在"""
+
+
+def normalize_rule(rule, rule_id=None):
+    """校验并补全规则字段"""
+    rule = dict(rule)
+    rule_id = rule_id or rule.get('id') or uuid.uuid4().hex[:8]
+    if not re.fullmatch(r'[A-Za-z0-9_\-]+', str(rule_id)):
+        raise RuleError(f"规则ID只能包含字母、数字、下划线和横线: {rule_id}")
+    feature = rule.get('feature')
+    if feature not in FEATURES:
+        raise RuleError(f"未知特征: {feature}，可用特征: {', '.join(FEATURES)}")
+    direction = rule.get('direction') or 'above'
+    if direction not in DIRECTIONS:
+        raise RuleError(f"未知方向: {direction}，可用方向: {', '.join(DIRECTIONS)}")
+    threshold = rule.get('threshold')
+    if isinstance(threshold, str):
+        if threshold not in FEATURES:
+            try:
+                threshold = float(threshold)
+            except ValueError:
+                raise RuleError(f"阈值应为数值或特征名: {threshold}")
+    elif isinstance(threshold, (int, float)) and not isinstance(threshold, bool):
+        threshold = float(threshold)
+    else:
+        raise RuleError("阈值应为数值或特征名")
+    cooldown = rule.get('cooldown')
+    cooldown = DEFAULT_COOLDOWN if cooldown is None else float(cooldown)
+    if cooldown < 0:
+        raise RuleError("冷却时间不能为负数")
+    message = rule.get('message') or None
+    if message:
+        try:
+            message.format(value=0.0, threshold=0.0, symbol='')
+        except Exception as e:
+            # 模板中的属性访问、格式说明等错误都视为规则格式错误
+            raise RuleError(f"消息模板无效（可用 {{value}} {{threshold}} {{symbol}}）: {str(e)}")
+    symbols = rule.get('symbols')
+    return {
+        'id': str(rule_id),
+        'name': rule.get('name') or str(rule_id),
+        'feature': feature,
+        'direction': direction,
+        'threshold': threshold,
+        'cooldown': cooldown,
+        'symbols': [symbol.upper() for symbol in symbols] if symbols else None,
+        'group': rule.get('group') or None,
+        'message': message,
+        'enabled': bool(rule.get('enabled', True))
+    }
+
+
+class _Compiled:
+    """规则的数组形式
+
+    启用的规则按 (特征, 方向, 阈值类型) 排序，同组规则占连续的行，每组只需一次广播比较。
+    """
+
+    def __init__(self, rules):
+        index = {feature: i for i, feature in enumerate(FEATURES)}
+
+        def group_key(rule):
+            by_feature = isinstance(rule['threshold'], str)
+            return index[rule['feature']], rule['direction'], by_feature, rule['threshold'] if by_feature else ''
+
+        enabled = [rule for rule in rules if rule['enabled']]
+        order = sorted(range(len(enabled)), key=lambda i: group_key(enabled[i]))
+        self.rules = [enabled[i] for i in order]
+        # 每行规则在声明中的位置，输出时按声明顺序排列
+        self.position = np.array(order, dtype=np.intp)
+        self.ids = [rule['id'] for rule in self.rules]
+        self.feature = np.array([index[rule['feature']] for rule in self.rules], dtype=np.intp)
+        self.by_feature = np.array([isinstance(rule['threshold'], str) for rule in self.rules], dtype=bool)
+        self.threshold_feature = np.array(
+            [index[rule['threshold']] if isinstance(rule['threshold'], str) else 0 for rule in self.rules],
+            dtype=np.intp
+        )
+        self.threshold = np.array(
+            [np.nan if isinstance(rule['threshold'], str) else rule['threshold'] for rule in self.rules]
+        )
+        self.cooldown = np.array([rule['cooldown'] for rule in self.rules])
+        self.scoped = any(rule['symbols'] or rule['group'] for rule in self.rules)
+        # (起始行, 结束行, 比较函数, 特征行, 阈值特征行或None)
+        self.groups = []
+        start = 0
+        for stop in range(1, len(self.rules) + 1):
+            if stop == len(self.rules) or group_key(self.rules[stop]) != group_key(self.rules[start]):
+                rule = self.rules[start]
+                self.groups.append((
+                    start, stop, DIRECTIONS[rule['direction']], self.feature[start],
+                    self.threshold_feature[start] if self.by_feature[start] else None
+                ))
+                start = stop
+
+
+class AlertRuleEngine:
+    """预警规则：运行时可增删改，评估时对全部股票和规则一次向量化计算
+
+    resolve_group(group) 返回分组中的股票，用于分组范围的规则。
+    """
+
+    def __init__(self, path=None, resolve_group=None):
+        self.path = path or RULES_FILE
+        self.resolve_group = resolve_group
+        self._lock = threading.RLock()
+        self._rules = self._load()
+        self._compiled = None
+        self._version = 0
+        # 冷却状态：(规则ID, 股票) 的上次触发时间，行与 _cooldown_ids 对应，列见 _cooldown_index
+        self._cooldown_ids = []
+        self._cooldown_index = {}
+        self._last_fired = np.empty((0, 0))
+        self._scopes = OrderedDict()  # 最近使用的作用范围矩阵
+        self.evaluations = 0
+        self.fired = 0
+        self.last_seconds = 0.0
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return [normalize_rule(rule) for rule in json.load(f)]
+        except FileNotFoundError:
+            return [normalize_rule(rule) for rule in DEFAULT_RULES]
+        except Exception as e:
+            logger.error(f"读取预警规则失败，使用默认规则: {str(e)}")
+            return [normalize_rule(rule) for rule in DEFAULT_RULES]
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._rules, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+    def rules(self):
+        with self._lock:
+            return [dict(rule) for rule in self._rules]
+
+    def cooldown(self, rule_id):
+        """规则的冷却时间（秒），规则已删除时为默认值"""
+        with self._lock:
+            rule = next((rule for rule in self._rules if rule['id'] == rule_id), None)
+            return rule['cooldown'] if rule is not None else DEFAULT_COOLDOWN
+
+    def _commit(self, rules):
+        with self._lock:
+            previous = self._rules
+            self._rules = rules
+            try:
+                self._save()
+            except Exception:
+                self._rules = previous
+                raise
+            self._compiled = None
+            self._version += 1
+
+    def add(self, rule):
+        with self._lock:
+            rule = normalize_rule(rule)
+            if any(existing['id'] == rule['id'] for existing in self._rules):
+                raise RuleError(f"规则 {rule['id']} 已存在")
+            self._commit(self._rules + [rule])
+            return dict(rule)
+
+    def update(self, rule_id, rule):
+        with self._lock:
+            rule = normalize_rule(rule, rule_id)
+            if not any(existing['id'] == rule_id for existing in self._rules):
+                raise RuleNotFoundError(f"规则 {rule_id} 不存在")
+            self._commit([rule if existing['id'] == rule_id else existing for existing in self._rules])
+            return dict(rule)
+
+    def remove(self, rule_id):
+        with self._lock:
+            rules = [existing for existing in self._rules if existing['id'] != rule_id]
+            if len(rules) == len(self._rules):
+                raise RuleNotFoundError(f"规则 {rule_id} 不存在")
+            self._commit(rules)
+
+    def _group_symbols(self, group):
+        try:
+            return frozenset(symbol.upper() for symbol in self.resolve_group(group)) if self.resolve_group else frozenset()
+        except Exception as e:
+            logger.warning(f"预警规则分组 {group} 无法解析: {str(e)}")
+            return frozenset()
+
+    def _scope_mask(self, compiled, symbols):
+        """(规则 × 股票) 的作用范围；规则、股票和分组成员不变时复用"""
+        groups = {rule['group'] for rule in compiled.rules if rule['group']}
+        members = {group: self._group_symbols(group) for group in groups}
+        key = (self._version, tuple(symbols), tuple(sorted(members.items(), key=lambda item: item[0])))
+        scope = self._scopes.get(key)
+        if scope is None:
+            scope = np.ones((len(compiled.rules), len(symbols)), dtype=bool)
+            symbol_array = np.array(symbols, dtype=str)
+            for i, rule in enumerate(compiled.rules):
+                allowed = None
+                if rule['symbols']:
+                    allowed = set(rule['symbols'])
+                if rule['group']:
+                    allowed = members[rule['group']] if allowed is None else allowed & members[rule['group']]
+                if allowed is not None:
+                    scope[i] = np.isin(symbol_array, list(allowed))
+            self._scopes[key] = scope
+            while len(self._scopes) > SCOPE_CACHE_SIZE:
+                self._scopes.popitem(last=False)
+        self._scopes.move_to_end(key)
+        return scope
+
+    def _cooldown_columns(self, compiled, symbols):
+        """symbols 在上次触发时间矩阵中的列
+
+        新出现的股票追加列，已见过的股票即使某个周期缺席状态也一直保留；规则变化时按规则ID迁移行。
+        """
+        if compiled.ids != self._cooldown_ids:
+            old_rules = {rule_id: i for i, rule_id in enumerate(self._cooldown_ids)}
+            rows = np.array([old_rules.get(rule_id, -1) for rule_id in compiled.ids], dtype=np.intp)
+            last_fired = np.full((len(compiled.ids), self._last_fired.shape[1]), -np.inf)
+            kept = np.flatnonzero(rows >= 0)
+            last_fired[kept] = self._last_fired[rows[kept]]
+            self._cooldown_ids, self._last_fired = list(compiled.ids), last_fired
+        added = [symbol for symbol in dict.fromkeys(symbols) if symbol not in self._cooldown_index]
+        if added:
+            for symbol in added:
+                self._cooldown_index[symbol] = len(self._cooldown_index)
+            self._last_fired = np.hstack([self._last_fired, np.full((len(self._cooldown_ids), len(added)), -np.inf)])
+        return np.array([self._cooldown_index[symbol] for symbol in symbols], dtype=np.intp)
+
+    def evaluate(self, symbols, columns, now=None, cooldown=True):
+        """评估全部规则
+
+        columns 为 {特征: 与 symbols 对应的数组}，缺少的特征视为NaN。
+        返回 (active, fired)：active 为当前满足条件的全部预警；fired 为其中已过冷却期、本次触发的预警
+        （cooldown=False 时不检查也不记录冷却，fired 为空）。
+        """
+        started = time.perf_counter()
+        now = time.time() if now is None else now
+        symbols = [symbol.upper() for symbol in symbols]
+        with self._lock:
+            if self._compiled is None:
+                self._compiled = _Compiled(self._rules)
+            compiled = self._compiled
+            matrix = np.full((len(FEATURES), len(symbols)), np.nan)
+            for i, feature in enumerate(FEATURES):
+                if feature in columns:
+                    matrix[i] = columns[feature]
+
+            # 每组规则一次广播比较，结果直接写入对应的行
+            hit = np.empty((len(compiled.rules), len(symbols)), dtype=bool)
+            with np.errstate(invalid='ignore'):
+                for start, stop, compare, feature, threshold_feature in compiled.groups:
+                    threshold = matrix[threshold_feature] if threshold_feature is not None \
+                        else compiled.threshold[start:stop, None]
+                    compare(matrix[feature], threshold, out=hit[start:stop])
+
+            # 满足条件的通常很少，作用范围和冷却只在命中的位置上检查
+            rows, hit_columns = np.nonzero(hit)
+            if compiled.scoped and len(rows):
+                in_scope = self._scope_mask(compiled, symbols)[rows, hit_columns]
+                rows, hit_columns = rows[in_scope], hit_columns[in_scope]
+            ordered = np.lexsort((compiled.position[rows], hit_columns))
+            rows, hit_columns = rows[ordered], hit_columns[ordered]
+            values = matrix[compiled.feature[rows], hit_columns]
+            thresholds = np.where(compiled.by_feature[rows], matrix[compiled.threshold_feature[rows], hit_columns],
+                                  compiled.threshold[rows])
+            ready = np.zeros(len(rows), dtype=bool)
+            if cooldown and len(rows):
+                state_columns = self._cooldown_columns(compiled, symbols)[hit_columns]
+                ready = now - self._last_fired[rows, state_columns] >= compiled.cooldown[rows]
+                self._last_fired[rows[ready], state_columns[ready]] = now
+            self.evaluations += 1
+            self.fired += int(ready.sum())
+
+            active, fired = [], []
+            for i, j, value, threshold, is_ready in zip(rows.tolist(), hit_columns.tolist(), values.tolist(),
+                                                        thresholds.tolist(), ready.tolist()):
+                alert = self._alert(compiled.rules[i], symbols[j], value, threshold)
+                active.append(alert)
+                if is_ready:
+                    fired.append(alert)
+            self.last_seconds = time.perf_counter() - started
+            return active, fired
+
+    @staticmethod
+    def _alert(rule, symbol, value, threshold):
+        if rule['message']:
+            message = rule['message'].format(value=value, threshold=threshold, symbol=symbol)
+        else:
+            message = f"{rule['name']}: {rule['feature']} {value:.2f} {_OPERATORS[rule['direction']]} {threshold:.2f}"
+        return {
+            'symbol': symbol,
+            'type': rule['id'],
+            'message': message,
+            'value': value,
+            'threshold': threshold
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rules': len(self._rules),
+                'enabled': sum(1 for rule in self._rules if rule['enabled']),
+                'evaluations': self.evaluations,
+                'fired': self.fired,
+                'last_seconds': self.last_seconds
+            }
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+
+from services.async_data import run_blocking, run_cpu
+from services.stock_monitor import StockMonitor
+
+logger = logging.getLogger(__name__)
+
+# 检查周期（秒）和同时拉取的股票数
+ALERT_INTERVAL = float(os.getenv('ALERT_INTERVAL', 60))
+ALERT_CONCURRENCY = int(os.getenv('ALERT_CONCURRENCY', 8))
+
+# 每个客户端最多积压的推送消息数，超出时丢弃最早的消息
+CLIENT_QUEUE_SIZE = 100
+
+
+class AlertScheduler:
+    """观察列表预警调度
+
+    后台按固定周期批量拉取观察列表中全部股票的数据，计算特征后对全部股票和规则一次向量化评估，
+    每个周期对上游的请求数只与股票数有关；规则过了冷却期再次满足时推送给所有已订阅的客户端，
+    客户端不再需要逐只轮询。
+    """
+
+    def __init__(self, monitor: StockMonitor, symbols, interval=ALERT_INTERVAL, concurrency=ALERT_CONCURRENCY):
+        self.monitor = monitor
+        self.symbols = symbols  # 返回当前观察列表股票的函数
+        self.interval = interval
+        self.concurrency = concurrency
+        self.latest = {}  # 股票 -> 最近一次检查结果
+        self.checked_at = None
+        self.cycles = 0
+        self._clients = set()
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop(), name='alert-scheduler')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"预警检查周期失败: {str(e)}")
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    async def run_once(self):
+        """检查一遍观察列表，返回本周期触发（已过冷却期）并写入预警记录的预警"""
+        symbols = list(dict.fromkeys(symbol.upper() for symbol in self.symbols()))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self._check(symbol, semaphore) for symbol in symbols))
+
+        # 获取失败的股票特征为NaN，不会触发，冷却状态保留到恢复后
+        names = next((result['features'] for result in results if 'features' in result), {})
+        columns = {
+            name: [result['features'][name] if 'features' in result else float('nan') for result in results]
+            for name in names
+        }
+        active, fired = await run_cpu(self.monitor.rules.evaluate, symbols, columns)
+
+        timestamp = datetime.now().isoformat()
+        by_symbol = {}
+        for alert in active:
+            by_symbol.setdefault(alert['symbol'], []).append(
+                {key: value for key, value in alert.items() if key != 'symbol'}
+            )
+        latest = {}
+        for result in results:
+            symbol = result['symbol']
+            if 'features' in result:
+                latest[symbol] = {
+                    'symbol': symbol,
+                    'alerts': by_symbol.get(symbol, []),
+                    'indicators': result['indicators'],
+                    'extremes': result['extremes'],
+                    'timestamp': timestamp
+                }
+            else:
+                latest[symbol] = result
+        # 已移出观察列表的股票不再保留
+        self.latest = latest
+        # 只记录本周期触发（已过规则冷却期）的预警，持续满足条件的预警不会每个周期重复记录；
+        # 规则引擎的冷却状态不持久化，重启后再次触发的预警由预警记录按冷却期去重，
+        # 推送与返回都只用实际写入的记录，保证与历史记录一致
+        recorded = await run_blocking(self.monitor.alert_log.record, fired) if fired else []
+
+        self.checked_at = time.time()
+        self.cycles += 1
+        if recorded:
+            self.publish({'type': 'alerts', 'alerts': recorded, 'timestamp': datetime.now().isoformat()})
+        return recorded
+
+    async def _check(self, symbol, semaphore):
+        """通过 StockMonitor 的两级缓存获取数据（同一根K线内不发起请求），在计算线程池中计算特征"""
+        try:
+            async with semaphore:
+                data = await run_blocking(self.monitor.get_stock_data, symbol)
+            if data['hist'].empty:
+                return {'symbol': symbol, 'alerts': [], 'timestamp': datetime.now().isoformat()}
+            computed = await run_cpu(self.monitor.compute_features, symbol, data['hist'], data['extremes'])
+            return dict(computed, symbol=symbol, extremes=data['extremes'])
+        except Exception as e:
+            logger.error(f"Error checking alerts for {symbol}: {str(e)}")
+            return {'symbol': symbol, 'alerts': [], 'timestamp': datetime.now().isoformat(), 'error': str(e)}
+
+    def fresh(self, symbol):
+        """最近一个周期内的检查结果，没有或已过期时返回 None"""
+        result = self.latest.get(symbol.upper())
+        if result is None or self.checked_at is None or time.time() - self.checked_at > self.interval * 2:
+            return None
+        return result
+
+    def active_alerts(self):
+        """当前处于触发状态的全部预警"""
+        return [
+            dict(alert, symbol=symbol)
+            for symbol, result in self.latest.items()
+            for alert in result['alerts']
+        ]
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self._clients.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._clients.discard(queue)
+
+    def publish(self, event):
+        """推送给所有客户端；处理不及时的客户端丢弃最早的消息，不阻塞调度"""
+        for queue in list(self._clients):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def stats(self):
+        return {
+            'running': self._task is not None and not self._task.done(),
+            'interval': self.interval,
+            'symbols': len(self.latest),
+            'cycles': self.cycles,
+            'clients': len(self._clients),
+            'checked_at': self.checked_at
+        }
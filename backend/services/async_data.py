@@ -0,0 +1,88 @@
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import httpx
+
+from services.rate_limiter import rate_limiter, RateLimitedError
+
+logger = logging.getLogger(__name__)
+
+# CPU密集的 pandas/numpy 计算使用独立线程池，避免占用事件循环
+_cpu_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix='cpu')
+
+# 阻塞式第三方库调用（如 yfinance）使用的线程池
+_io_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='io')
+
+
+async def run_cpu(func, *args, **kwargs):
+    """在计算线程池中执行CPU密集函数"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_cpu_executor, functools.partial(func, *args, **kwargs))
+
+
+async def run_blocking(func, *args, **kwargs):
+    """在IO线程池中执行阻塞调用"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_executor, functools.partial(func, *args, **kwargs))
+
+
+class AsyncHttpClient:
+    """共享异步HTTP客户端：连接池复用 keep-alive 连接，按主机限制并发连接数，并接入共享限流器"""
+
+    def __init__(self, max_connections=100, max_keepalive=20, per_host_limit=8, timeout=10.0):
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self._client = None
+        self._host_semaphores = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout, follow_redirects=True)
+        return self._client
+
+    def _semaphore(self, host):
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_semaphores[host]
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """限流后发送请求：429时降低主机速率并退避，网络错误时只延迟本次请求后重试"""
+        host = urlparse(url).hostname
+        for attempt in range(rate_limiter.max_retries):
+            await rate_limiter.acquire_async(host)
+            try:
+                async with self._semaphore(host):
+                    response = await self.client.request(method, url, **kwargs)
+            except httpx.HTTPError as e:
+                if attempt < rate_limiter.max_retries - 1:
+                    await asyncio.sleep(rate_limiter.error_backoff(host, attempt, e))
+                    continue
+                raise
+            if response.status_code == 429:
+                rate_limiter.throttled(host, response.headers.get('Retry-After'))
+                continue
+            rate_limiter.succeeded(host)
+            return response
+        raise RateLimitedError(f"{host} 持续限流，已重试 {rate_limiter.max_retries} 次")
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request('GET', url, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# 全进程共享的异步HTTP客户端
+http_client = AsyncHttpClient(
+    max_connections=int(os.getenv('HTTP_MAX_CONNECTIONS', 100)),
+    max_keepalive=int(os.getenv('HTTP_MAX_KEEPALIVE', 20)),
+    per_host_limit=int(os.getenv('HTTP_PER_HOST_LIMIT', 8)),
+)
@@ -0,0 +1,220 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import pandas as pd
+
+from services.bar_store import BarStore
+from services.bars import Bars
+from services.stock_analyzer import StockAnalyzer
+
+logger = logging.getLogger(__name__)
+
+# 最多保留的任务数，超出时丢弃最早完成的任务
+MAX_JOBS = 50
+
+
+def _backtest_symbol(store_root, symbol, req_start, req_end, start_date, end_date):
+    """进程池任务：以内存映射方式读取本地K线文件并执行区间回测
+
+    主进程只传递存储路径和时间范围，K线数据不经过序列化。
+    """
+    bars = Bars.from_records(BarStore(store_root).read(symbol, '1d')).between(req_start, req_end)
+    return StockAnalyzer._backtest_range_report(symbol, bars if len(bars) else None, start_date, end_date)
+
+
+class BacktestJobRunner:
+    """多股票回测任务
+
+    主进程并发拉取数据并写入本地K线存储，每只股票的回测计算分发到进程池，
+    任务状态保存在内存中供轮询。
+    """
+
+    def __init__(self, analyzer: StockAnalyzer, max_workers=None, fetch_workers=8):
+        self.analyzer = analyzer
+        self.max_workers = max_workers or os.cpu_count() or 4
+        self.fetch_workers = fetch_workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        # 使用 spawn 启动工作进程，避免 fork 时复制主进程中的线程和锁状态
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._pool
+
+    def _reset_pool(self, broken):
+        """工作进程异常退出后进程池不可再用，丢弃它，下次提交时重新创建"""
+        with self._pool_lock:
+            if self._pool is broken:
+                self._pool = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, job, symbol, store_root, req_start, req_end, retry, collected):
+        """提交一只股票的回测，结果由回调记录，回调结束时释放 collected；进程池已损坏时换新的进程池重试一次"""
+        for attempt in range(2):
+            pool = self.pool
+            try:
+                future = pool.submit(_backtest_symbol, store_root, symbol, req_start, req_end,
+                                     job["start_date"], job["end_date"])
+            except BrokenProcessPool:
+                self._reset_pool(pool)
+                continue
+            future.add_done_callback(partial(self._collect, job, symbol, pool, retry, collected))
+            return future
+        logger.error(f"回测 {symbol} 失败: 进程池不可用")
+        self._record(job, symbol, {"error": "回测进程池不可用"})
+        collected.release()
+        return None
+
+    def submit(self, symbols, start_date: str, end_date: str) -> dict:
+        """提交回测任务，立即返回任务状态"""
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "pending",
+            "start_date": start_date,
+            "end_date": end_date,
+            "symbols": list(symbols),
+            "completed": 0,
+            "results": {},
+            "error": None,
+            "created_at": time.time(),
+            "finished_at": None
+        }
+        with self._lock:
+            self._jobs[job["job_id"]] = job
+            self._prune()
+        threading.Thread(target=self._run, args=(job,), name=f"backtest-{job['job_id'][:8]}", daemon=True).start()
+        return self.status(job["job_id"], include_results=False)
+
+    def status(self, job_id: str, include_results=True):
+        """查询任务状态，不存在时返回 None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            total = len(job["symbols"])
+            finished_at = job["finished_at"] or time.time()
+            view = {
+                "job_id": job["job_id"],
+                "status": job["status"],
+                "start_date": job["start_date"],
+                "end_date": job["end_date"],
+                "total": total,
+                "completed": job["completed"],
+                "progress": job["completed"] / total if total else 1.0,
+                "elapsed": finished_at - job["created_at"],
+                "error": job["error"]
+            }
+            if include_results:
+                view["results"] = dict(job["results"])
+            return view
+
+    def _run(self, job):
+        job["status"] = "running"
+        start_date_pd = pd.to_datetime(job["start_date"])
+        end_date_pd = pd.to_datetime(job["end_date"])
+        # 与单只股票的区间回测截取相同范围的数据
+        start = start_date_pd - pd.Timedelta(days=7)
+        end = end_date_pd + pd.Timedelta(days=5)
+        req_start, req_end = int(start.timestamp()), int(end.timestamp())
+        store_root = str(self.analyzer.bar_store.root)
+
+        try:
+            # 已缓存的历史结果直接返回，不再拉取数据和计算
+            pending = []
+            for symbol in job["symbols"]:
+                cached = self.analyzer.backtest_cache_get('range', symbol, job["start_date"], job["end_date"])
+                if cached is not None:
+                    self._record(job, symbol, cached)
+                else:
+                    pending.append(symbol)
+
+            # wait() 可能在回调执行前返回，用信号量等待所有回调记录完结果
+            collected = threading.Semaphore(0)
+            submitted = 0
+            retry = []
+            with ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix='backtest-fetch') as fetcher:
+                # 数据按提交顺序陆续就绪，就绪一只即提交一只计算，拉取与计算重叠进行
+                loaded = fetcher.map(lambda symbol: self.analyzer.get_bars(symbol, start=start, end=end), pending)
+                for symbol, bars in zip(pending, loaded):
+                    if bars is None:
+                        self._record(job, symbol, {"error": "无法获取历史数据"})
+                        continue
+                    self._submit(job, symbol, store_root, req_start, req_end, retry, collected)
+                    submitted += 1
+            for _ in range(submitted):
+                collected.acquire()
+
+            # 工作进程异常退出时，进程池中所有未完成的股票都会失败；在新的进程池中重试这些股票一次
+            if retry:
+                logger.warning(f"回测任务 {job['job_id']} 的进程池异常退出，重试 {len(retry)} 只股票")
+                for symbol in retry:
+                    self._submit(job, symbol, store_root, req_start, req_end, None, collected)
+                for _ in retry:
+                    collected.acquire()
+
+            failed = sum(1 for result in job["results"].values() if "error" in result)
+            if failed and failed == len(job["symbols"]):
+                status, error = "failed", f"全部 {failed} 只股票回测失败"
+            elif failed:
+                status, error = "partial", f"{failed}/{len(job['symbols'])} 只股票回测失败"
+            else:
+                status, error = "done", None
+        except Exception as e:
+            logger.error(f"回测任务 {job['job_id']} 执行失败: {str(e)}")
+            status, error = "failed", str(e)
+
+        with self._lock:
+            job["status"] = status
+            job["error"] = error
+            job["finished_at"] = time.time()
+
+    def _collect(self, job, symbol, pool, retry, collected, future):
+        try:
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                self._reset_pool(pool)
+                if retry is not None:
+                    retry.append(symbol)
+                    return
+                logger.error(f"回测 {symbol} 失败: {str(e)}")
+                result = {"error": "回测进程异常退出"}
+            except Exception as e:
+                logger.error(f"回测 {symbol} 失败: {str(e)}")
+                result = {"error": str(e)}
+            self._record(job, symbol, result)
+            self.analyzer.backtest_cache_put('range', symbol, job["start_date"], job["end_date"], result)
+        finally:
+            collected.release()
+
+    def _record(self, job, symbol, result):
+        with self._lock:
+            job["results"][symbol] = result
+            job["completed"] += 1
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if job["finished_at"] is not None]
+        finished.sort(key=lambda job: job["finished_at"])
+        while len(self._jobs) > MAX_JOBS and finished:
+            self._jobs.pop(finished.pop(0)["job_id"], None)
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
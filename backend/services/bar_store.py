@@ -0,0 +1,127 @@
+import json
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 每根K线一条定长记录，文件即为记录数组，可直接内存映射读取
+BAR_DTYPE = np.dtype([
+    ('timestamp', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+    ('adjclose', '<f8'),
+])
+
+
+class BarStore:
+    """本地K线存储：每个 股票/周期 一个列式记录文件 + 一个覆盖范围元数据文件
+
+    元数据记录已连续覆盖的时间区间 [covered_from, fetched_through]，
+    调用方据此只向上游请求缺失的部分。
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root) if root else Path(__file__).parent.parent / 'data' / 'bars'
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _base(self, symbol, interval):
+        safe = re.sub(r'[^A-Za-z0-9._\-=^]', '_', symbol.upper())
+        return self.root / f"{safe}_{interval}"
+
+    def data_path(self, symbol, interval='1d'):
+        return self._base(symbol, interval).with_suffix('.bars')
+
+    def meta_path(self, symbol, interval='1d'):
+        return self._base(symbol, interval).with_suffix('.json')
+
+    def lock(self, symbol, interval='1d'):
+        """获取 股票/周期 对应的锁，读-拉取-写 整个过程应在锁内完成"""
+        key = (symbol.upper(), interval)
+        with self._locks_guard:
+            if key not in self._locks:
+                self._locks[key] = threading.RLock()
+            return self._locks[key]
+
+    def read(self, symbol, interval='1d'):
+        """以只读内存映射方式读取全部K线，不存在时返回空数组"""
+        path = self.data_path(symbol, interval)
+        if not path.exists() or path.stat().st_size < BAR_DTYPE.itemsize:
+            return np.empty(0, dtype=BAR_DTYPE)
+        count = path.stat().st_size // BAR_DTYPE.itemsize
+        return np.memmap(path, dtype=BAR_DTYPE, mode='r', shape=(count,))
+
+    def meta(self, symbol, interval='1d'):
+        """读取覆盖范围元数据"""
+        path = self.meta_path(symbol, interval)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.error(f"读取{symbol}K线元数据失败: {str(e)}")
+            return {}
+
+    def _save_meta(self, symbol, interval, meta):
+        path = self.meta_path(symbol, interval)
+        tmp = path.with_suffix('.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp, path)
+
+    def clear(self, symbol, interval='1d'):
+        """删除 股票/周期 的全部K线和覆盖范围（已打开的内存映射不受影响）"""
+        with self.lock(symbol, interval):
+            self.data_path(symbol, interval).unlink(missing_ok=True)
+            self.meta_path(symbol, interval).unlink(missing_ok=True)
+
+    def _load(self, symbol, interval):
+        """读取全部K线到内存（不保留内存映射，写入期间不占用数据文件）"""
+        path = self.data_path(symbol, interval)
+        if not path.exists():
+            return np.empty(0, dtype=BAR_DTYPE)
+        data = np.fromfile(path, dtype=np.uint8)
+        count = len(data) // BAR_DTYPE.itemsize
+        return data[:count * BAR_DTYPE.itemsize].view(BAR_DTYPE)
+
+    def write(self, symbol, interval, records, covered_from=None, fetched_through=None):
+        """合并新拉取的K线并更新覆盖范围
+
+        已写入的字节从不原地修改：新K线全部晚于已存数据时只在文件末尾追加，
+        需要修订已有K线（如刷新未收盘的最后一根）时整体写入临时文件后原子替换，
+        已打开的内存映射看到的始终是写入前的数据。
+        """
+        records = np.asarray(records, dtype=BAR_DTYPE)
+        path = self.data_path(symbol, interval)
+        with self.lock(symbol, interval):
+            if len(records):
+                existing = self._load(symbol, interval)
+                first_new = records['timestamp'][0]
+                if len(existing) == 0 or first_new > existing['timestamp'][-1]:
+                    with open(path, 'ab') as f:
+                        f.write(records.tobytes())
+                else:
+                    last_new = records['timestamp'][-1]
+                    keep = (existing['timestamp'] < first_new) | (existing['timestamp'] > last_new)
+                    merged = np.concatenate([existing[keep], records])
+                    merged = merged[np.argsort(merged['timestamp'], kind='stable')]
+                    tmp = path.with_suffix('.bars.tmp')
+                    merged.tofile(tmp)
+                    os.replace(tmp, path)
+
+            meta = self.meta(symbol, interval)
+            if covered_from is not None:
+                meta['covered_from'] = min(int(covered_from), meta.get('covered_from', int(covered_from)))
+            if fetched_through is not None:
+                meta['fetched_through'] = max(int(fetched_through), meta.get('fetched_through', int(fetched_through)))
+            self._save_meta(symbol, interval, meta)
@@ -0,0 +1,137 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from services.bar_store import BAR_DTYPE
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:  # orjson 为可选依赖，未安装时退回标准库
+    _loads = json.loads
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class Bars:
+    """列式K线：时间戳为 int64 秒，OHLCV 为 float64 数组，只在调用方需要时才构建DataFrame"""
+
+    __slots__ = ('timestamp', 'open', 'high', 'low', 'close', 'volume', 'adjclose', '_frame')
+
+    def __init__(self, timestamp, open, high, low, close, volume, adjclose=None):
+        self.timestamp = timestamp
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.adjclose = adjclose
+        self._frame = None
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    @classmethod
+    def from_records(cls, records):
+        """从 BarStore 记录数组创建，各列为记录数组的视图（不复制）"""
+        adjclose = records['adjclose']
+        return cls(records['timestamp'], records['open'], records['high'], records['low'],
+                   records['close'], records['volume'],
+                   adjclose if len(adjclose) and not np.isnan(adjclose).all() else None)
+
+    def to_records(self):
+        """转换为 BarStore 记录数组"""
+        records = np.empty(len(self), dtype=BAR_DTYPE)
+        records['timestamp'] = self.timestamp
+        for field in FIELDS:
+            records[field] = getattr(self, field)
+        records['adjclose'] = self.adjclose if self.adjclose is not None else np.nan
+        return records
+
+    @classmethod
+    def concat(cls, parts):
+        """按顺序拼接多段K线，结果为新分配的连续数组"""
+        return cls.from_records(np.concatenate([part.to_records() for part in parts]))
+
+    def take(self, index):
+        """按布尔掩码或下标一次性截取所有列"""
+        return Bars(self.timestamp[index], self.open[index], self.high[index], self.low[index],
+                    self.close[index], self.volume[index],
+                    self.adjclose[index] if self.adjclose is not None else None)
+
+    def between(self, start=None, end=None):
+        """按时间戳闭区间截取（时间戳有序，使用二分查找，结果为视图）"""
+        lo = 0 if start is None else int(np.searchsorted(self.timestamp, start, side='left'))
+        hi = len(self) if end is None else int(np.searchsorted(self.timestamp, end, side='right'))
+        return self.take(slice(lo, hi))
+
+    def tail(self, count):
+        return self.take(slice(max(len(self) - count, 0), len(self)))
+
+    def clean(self):
+        """单次遍历完成清理：去掉含NaN的K线和重复时间戳（保留第一条）"""
+        valid = np.isfinite(self.open) & np.isfinite(self.high) & np.isfinite(self.low) \
+            & np.isfinite(self.close) & np.isfinite(self.volume)
+        timestamp = self.timestamp
+        if len(timestamp) > 1 and (timestamp[1:] >= timestamp[:-1]).all():
+            # 常见情况：时间戳已有序，重复项必然相邻
+            first = np.ones(len(timestamp), dtype=bool)
+            valid_ts = timestamp[valid]
+            keep = np.ones(len(valid_ts), dtype=bool)
+            keep[1:] = valid_ts[1:] != valid_ts[:-1]
+            first[np.flatnonzero(valid)[~keep]] = False
+            mask = valid & first
+        else:
+            mask = np.zeros(len(timestamp), dtype=bool)
+            candidates = np.flatnonzero(valid)
+            _, index = np.unique(timestamp[candidates], return_index=True)
+            mask[candidates[index]] = True
+        if mask.all():
+            return self
+        return self.take(mask)
+
+    def frame(self):
+        """构建（并缓存）与原 get_stock_data 相同格式的DataFrame"""
+        if self._frame is None:
+            df = pd.DataFrame({
+                'Open': self.open,
+                'High': self.high,
+                'Low': self.low,
+                'Close': self.close,
+                'Volume': self.volume
+            }, index=pd.to_datetime(self.timestamp, unit='s'))
+
+            # 处理调整后的收盘价
+            if self.adjclose is not None:
+                df['Adj Close'] = self.adjclose
+            self._frame = df
+        return self._frame
+
+
+def decode_chart(content):
+    """将 chart 接口返回的JSON直接解码为连续的类型化数组并清理
+
+    数据不完整时抛出 KeyError/IndexError/TypeError/ValueError。
+    """
+    data = _loads(content)
+    chart_data = data['chart']['result'][0]
+    timestamp = np.array(chart_data.get('timestamp') or [], dtype=np.int64)
+    quote = chart_data['indicators']['quote'][0]
+
+    def column(values):
+        # None（停牌/缺失）直接转换为NaN
+        if values is None:
+            return np.full(len(timestamp), np.nan)
+        array = np.array(values, dtype=np.float64)
+        if len(array) != len(timestamp):
+            raise ValueError("K线字段长度与时间戳不一致")
+        return array
+
+    # 处理调整后的收盘价
+    adjclose = None
+    if 'adjclose' in chart_data['indicators']:
+        adjclose = column(chart_data['indicators']['adjclose'][0].get('adjclose'))
+
+    return Bars(timestamp, *(column(quote.get(field)) for field in FIELDS), adjclose=adjclose).clean()
@@ -0,0 +1,124 @@
+"""滚动高低点索引
+
+每只股票维护日K的52周高低点和可配置的N日高低点（单调队列，见 RollingExtreme）。
+每根新的已收盘日K只推进一次，状态与本地K线存储放在同一目录下持久化，
+突破/跌破判断只需 O(1) 查表，不再每次对一年日K求最大值。
+"""
+import logging
+import math
+import os
+import threading
+
+import numpy as np
+
+from services.market_data import get_provider
+from services.streaming_indicators import IndicatorStateStore, RollingExtreme
+
+logger = logging.getLogger(__name__)
+
+# 52周按交易日计
+WEEKS_52 = 252
+
+# 额外维护的N日高低点，例如 EXTREME_WINDOWS=20,55
+EXTREME_WINDOWS = tuple(int(window) for window in os.getenv('EXTREME_WINDOWS', '20,55').split(',') if window.strip())
+
+
+def _label(window):
+    return '52w' if window == WEEKS_52 else f'{window}d'
+
+
+class ExtremesSet:
+    """单只股票各窗口的滚动最高价/最低价，按日K时间戳推进（早于或等于最后一根的K线忽略）"""
+
+    def __init__(self, windows=(WEEKS_52,) + EXTREME_WINDOWS):
+        self.windows = sorted(set(windows))
+        self.highs = {window: RollingExtreme(window, 'max') for window in self.windows}
+        self.lows = {window: RollingExtreme(window, 'min') for window in self.windows}
+        self.last_timestamp = None
+
+    def update(self, timestamp, high, low):
+        """推进一根日K，返回是否改变了状态"""
+        timestamp = int(timestamp)
+        if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+            return False
+        for window in self.windows:
+            self.highs[window].update(high)
+            self.lows[window].update(low)
+        self.last_timestamp = timestamp
+        return True
+
+    def seed(self, timestamps, high, low):
+        """用日K推进，只处理最后一根之后的K线（时间戳有序，二分定位），返回是否有新K线"""
+        start = 0 if self.last_timestamp is None else int(np.searchsorted(timestamps, self.last_timestamp, side='right'))
+        for timestamp, high_value, low_value in zip(timestamps[start:], high[start:], low[start:]):
+            self.update(timestamp, float(high_value), float(low_value))
+        return start < len(timestamps)
+
+    def high(self, window=WEEKS_52):
+        return self.highs[window].value
+
+    def low(self, window=WEEKS_52):
+        return self.lows[window].value
+
+    def snapshot(self):
+        """各窗口的高低点，尚无数据时为None"""
+        values = {}
+        for window in self.windows:
+            for name, value in (('high', self.high(window)), ('low', self.low(window))):
+                values[f'{name}_{_label(window)}'] = value if not math.isnan(value) else None
+        return values
+
+    def to_dict(self):
+        return {
+            'windows': self.windows,
+            'highs': [self.highs[window].to_dict() for window in self.windows],
+            'lows': [self.lows[window].to_dict() for window in self.windows],
+            'last_timestamp': self.last_timestamp
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls.__new__(cls)
+        state.windows = list(data['windows'])
+        state.highs = {window: RollingExtreme.from_dict(item) for window, item in zip(state.windows, data['highs'])}
+        state.lows = {window: RollingExtreme.from_dict(item) for window, item in zip(state.windows, data['lows'])}
+        state.last_timestamp = data['last_timestamp']
+        return state
+
+
+class ExtremesIndex:
+    """全部股票的滚动高低点：内存中按股票保存，首次访问时从磁盘恢复"""
+
+    def __init__(self, root=None, windows=(WEEKS_52,) + EXTREME_WINDOWS):
+        self.windows = sorted(set(windows))
+        self.store = IndicatorStateStore(root or get_provider().cache_dir / 'extremes', ExtremesSet)
+        self._sets = {}
+        self._lock = threading.Lock()
+
+    def _load(self, symbol):
+        extremes = self._sets.get(symbol)
+        if extremes is None:
+            extremes = self.store.load(symbol, '1d')
+            if extremes is None or extremes.windows != self.windows:
+                # 窗口配置变化时重新计算
+                extremes = ExtremesSet(self.windows)
+            self._sets[symbol] = extremes
+        return extremes
+
+    def update(self, symbol, bars):
+        """用已收盘的日K（Bars）推进，返回最新高低点；没有新K线时不做任何计算"""
+        symbol = symbol.upper()
+        with self._lock:
+            extremes = self._load(symbol)
+            if len(bars) and extremes.seed(bars.timestamp, bars.high, bars.low):
+                try:
+                    self.store.save(symbol, '1d', extremes)
+                except Exception as e:
+                    logger.error(f"保存{symbol}高低点失败: {str(e)}")
+            return extremes.snapshot()
+
+    def get(self, symbol):
+        """当前高低点，股票尚未建立索引时返回 None"""
+        with self._lock:
+            extremes = self._sets.get(symbol.upper())
+            return extremes.snapshot() if extremes is not None and extremes.last_timestamp is not None else None
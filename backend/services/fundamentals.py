@@ -0,0 +1,219 @@
+"""基本面快照存储
+
+Ticker.info 是最慢的行情接口，而市值、市盈率、机构持股等字段每天最多变化一次。
+每只股票只保留常用字段，按数据源分目录保存为一个小JSON文件；记录在美东时间的
+同一天内有效，跨天后下次访问时重新拉取。拉取失败时退回使用过期记录。
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from services.async_data import run_blocking
+from services.market_data import DATA_DIR, get_provider
+from services.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# 保存的字段（与 yfinance Ticker.info 的字段名一致）
+FIELDS = (
+    'symbol', 'longName', 'shortName', 'exchange', 'sector', 'industry',
+    'marketCap', 'forwardPE', 'trailingPE', 'institutionalOwnership'
+)
+
+MARKET_TZ = 'America/New_York'
+
+
+def market_date(ts):
+    """Unix秒对应的美东日期（YYYY-MM-DD）"""
+    return pd.Timestamp(int(ts), unit='s', tz='UTC').tz_convert(MARKET_TZ).strftime('%Y-%m-%d')
+
+
+def compact(info):
+    """只保留 FIELDS 中的字段，去掉缺失值"""
+    return {field: info[field] for field in FIELDS if info.get(field) is not None}
+
+
+class FundamentalsStore:
+    """基本面快照：内存 + 磁盘两级缓存，所有 .info 调用方共用
+
+    并发的相同股票请求合并为一次拉取；bulk refresh 在后台线程中刷新一批股票的过期记录。
+    """
+
+    def __init__(self, root=None, refresh_workers=8):
+        self.root = Path(root) if root else DATA_DIR / 'cache' / 'fundamentals'
+        self.refresh_workers = refresh_workers
+        self.flight = SingleFlight('fundamentals')
+        self._records = {}  # (数据源, 股票) -> {'date', 'fetched_at', 'info'}
+        self._lock = threading.Lock()
+        self._refresh = None
+        self._refresh_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+
+    def path(self, provider, symbol):
+        safe = re.sub(r'[^A-Za-z0-9._\-=^]', '_', symbol)
+        return self.root / provider.name / f"{safe}.json"
+
+    def _load(self, provider, symbol):
+        """读取内存中的记录，首次访问时从磁盘加载"""
+        key = (provider.name, symbol)
+        with self._lock:
+            if key in self._records:
+                return self._records[key]
+        record = None
+        try:
+            with open(self.path(provider, symbol), 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"读取{symbol}基本面缓存失败: {str(e)}")
+        with self._lock:
+            return self._records.setdefault(key, record)
+
+    def _save(self, provider, symbol, record):
+        path = self.path(provider, symbol)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f'.{threading.get_ident()}.tmp')
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except Exception as e:
+            logger.error(f"写入{symbol}基本面缓存失败: {str(e)}")
+            tmp.unlink(missing_ok=True)
+
+    @staticmethod
+    def _fresh(provider, record):
+        return record is not None and record.get('date') == market_date(provider.clock())
+
+    def cached(self, symbol):
+        """当天有效的基本面信息，没有时返回 None（不发起请求）"""
+        provider = get_provider()
+        record = self._load(provider, symbol.upper())
+        return dict(record['info']) if self._fresh(provider, record) else None
+
+    def get(self, symbol, force=False):
+        """获取基本面信息字典；当天的记录直接返回，否则拉取并保存"""
+        provider = get_provider()
+        symbol = symbol.upper()
+        record = self._load(provider, symbol)
+        if not force and self._fresh(provider, record):
+            with self._lock:
+                self.hits += 1
+            return dict(record['info'])
+        with self._lock:
+            self.misses += 1
+        return dict(self.flight.do((provider.name, symbol), self._fetch, provider, symbol, record)['info'])
+
+    async def get_async(self, symbol):
+        """get 的异步版本：命中当天记录时不切换线程"""
+        info = self.cached(symbol)
+        if info is not None:
+            with self._lock:
+                self.hits += 1
+            return info
+        return await run_blocking(self.get, symbol)
+
+    def _fetch(self, provider, symbol, previous):
+        try:
+            info = provider.info(symbol)
+        except Exception as e:
+            if previous is None:
+                raise
+            # 拉取失败时退回过期记录，不影响扫描和校验
+            logger.warning(f"刷新{symbol}基本面失败，使用 {previous['date']} 的记录: {str(e)}")
+            with self._lock:
+                self.stale_served += 1
+            return previous
+        now = provider.clock()
+        record = {'date': market_date(now), 'fetched_at': now, 'info': compact(info)}
+        with self._lock:
+            self._records[(provider.name, symbol)] = record
+        self._save(provider, symbol, record)
+        return record
+
+    def refresh(self, symbols, force=False, progress=None):
+        """刷新一批股票（默认只刷新过期的），返回 {'refreshed', 'skipped', 'failed'}
+
+        progress 为可选回调，参数为新处理完的股票数。
+        """
+        symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+        stale = symbols if force else [symbol for symbol in symbols if self.cached(symbol) is None]
+        failed = {}
+        if progress is not None:
+            progress(len(symbols) - len(stale))
+
+        def refresh_one(symbol):
+            try:
+                self.get(symbol, force=True)
+            except Exception as e:
+                failed[symbol] = str(e)
+            if progress is not None:
+                progress(1)
+
+        with ThreadPoolExecutor(max_workers=self.refresh_workers, thread_name_prefix='fundamentals') as pool:
+            list(pool.map(refresh_one, stale))
+        return {'refreshed': len(stale) - len(failed), 'skipped': len(symbols) - len(stale), 'failed': failed}
+
+    def refresh_in_background(self, symbols, force=False):
+        """在后台线程中刷新；已有刷新在进行时直接返回其状态"""
+        with self._refresh_lock:
+            if self._refresh is not None and self._refresh['status'] == 'running':
+                return dict(self._refresh)
+            symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+            self._refresh = {
+                'status': 'running',
+                'total': len(symbols),
+                'completed': 0,
+                'result': None,
+                'error': None,
+                'started_at': time.time(),
+                'finished_at': None
+            }
+        threading.Thread(target=self._run_refresh, args=(symbols, force),
+                         name='fundamentals-refresh', daemon=True).start()
+        return self.refresh_status()
+
+    def _run_refresh(self, symbols, force):
+        try:
+            result, status, error = self.refresh(symbols, force, self._progress), 'done', None
+            logger.info(f"基本面刷新完成: {result['refreshed']} 只刷新, {result['skipped']} 只未过期, "
+                        f"{len(result['failed'])} 只失败")
+        except Exception as e:
+            logger.error(f"基本面刷新失败: {str(e)}")
+            result, status, error = None, 'failed', str(e)
+        with self._refresh_lock:
+            self._refresh.update(status=status, result=result, error=error, finished_at=time.time())
+
+    def _progress(self, count):
+        with self._refresh_lock:
+            self._refresh['completed'] += count
+
+    def refresh_status(self):
+        with self._refresh_lock:
+            return dict(self._refresh) if self._refresh is not None else {'status': 'idle'}
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'records': sum(1 for record in self._records.values() if record is not None),
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale_served': self.stale_served,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'coalesced': self.flight.stats()['coalesced']
+            }
+
+
+# 全进程共享的基本面快照
+fundamentals = FundamentalsStore(refresh_workers=int(os.getenv('FUNDAMENTALS_REFRESH_WORKERS', 8)))
@@ -0,0 +1,183 @@
+"""技术指标计算引擎
+
+所有函数接收 NumPy 数组，沿最后一个轴（时间轴）计算，因此既可以处理单只股票的一维序列，
+也可以处理 (股票数, K线数) 的二维矩阵。数值结果与原先 pandas 实现一致：
+窗口不足时为 NaN，与 rolling(window) 相同；ema 与 ewm(adjust=False) 相同。
+"""
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def _as_float(values):
+    return np.asarray(values, dtype=np.float64)
+
+
+def shift(values, periods=1):
+    """与 Series.shift 相同，空出的位置为 NaN"""
+    values = _as_float(values)
+    out = np.full(values.shape, np.nan)
+    if periods < values.shape[-1]:
+        out[..., periods:] = values[..., :values.shape[-1] - periods]
+    return out
+
+
+def diff(values, periods=1):
+    """与 Series.diff 相同"""
+    values = _as_float(values)
+    return values - shift(values, periods)
+
+
+def pct_change(values, periods=1):
+    """与 Series.pct_change 相同（输入不含NaN时）"""
+    values = _as_float(values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return values / shift(values, periods) - 1
+
+
+def rolling(values, window, func):
+    """沿时间轴滑动窗口聚合，前 window-1 个位置为 NaN；窗口内有 NaN 时结果为 NaN"""
+    values = _as_float(values)
+    out = np.full(values.shape, np.nan)
+    if values.shape[-1] >= window:
+        out[..., window - 1:] = func(sliding_window_view(values, window, axis=-1), axis=-1)
+    return out
+
+
+def rolling_sum(values, window):
+    return rolling(values, window, np.sum)
+
+
+def rolling_mean(values, window):
+    return rolling(values, window, np.mean)
+
+
+def rolling_std(values, window, ddof=1):
+    return rolling(values, window, lambda view, axis: np.std(view, axis=axis, ddof=ddof))
+
+
+def rolling_max(values, window):
+    return rolling(values, window, np.max)
+
+
+def rolling_min(values, window):
+    return rolling(values, window, np.min)
+
+
+sma = rolling_mean
+
+
+def ema(values, span=None, alpha=None):
+    """指数移动平均，与 ewm(span=span 或 alpha=alpha, adjust=False).mean() 逐位一致
+
+    逐根K线递推、对所有股票同时计算；遇到 NaN 时保持上一值，
+    缺口后的权重衰减方式与 pandas（ignore_na=False）相同。
+    """
+    values = _as_float(values)
+    if alpha is None:
+        alpha = 1.0 / (1.0 + (span - 1) / 2.0)
+    decay = 1.0 - alpha
+    if values.ndim == 1:
+        return _ema_series(values, alpha, decay)
+    out = np.empty(values.shape)
+    weighted = np.full(values.shape[:-1], np.nan)
+    old_wt = np.ones(values.shape[:-1])
+    for t in range(values.shape[-1]):
+        current = values[..., t]
+        observed = current == current
+        started = weighted == weighted
+        old_wt = np.where(started, old_wt * decay, old_wt)
+        update = started & observed & (weighted != current)
+        with np.errstate(invalid='ignore'):
+            blended = (old_wt * weighted + alpha * current) / (old_wt + alpha)
+        weighted = np.where(update, blended, weighted)
+        old_wt = np.where(started & observed, 1.0, old_wt)
+        weighted = np.where(~started & observed, current, weighted)
+        out[..., t] = weighted
+    return out
+
+
+def _ema_series(values, alpha, decay):
+    """单只股票的 ema：逐个标量递推比逐列数组运算快得多，运算顺序相同，结果逐位一致"""
+    out = []
+    weighted = math.nan
+    old_wt = 1.0
+    for current in values.tolist():
+        if weighted == weighted:
+            old_wt *= decay
+            if current == current:
+                if weighted != current:
+                    weighted = (old_wt * weighted + alpha * current) / (old_wt + alpha)
+                old_wt = 1.0
+        elif current == current:
+            weighted = current
+        out.append(weighted)
+    return np.array(out, dtype=np.float64)
+
+
+def macd(close, fast=12, slow=26, signal=9):
+    """MACD：返回 (macd线, 信号线)"""
+    macd_line = ema(close, fast) - ema(close, slow)
+    return macd_line, ema(macd_line, signal)
+
+
+def rsi(close, window=14, method='sma'):
+    """RSI：method='sma' 为简单移动平均（项目原有算法），'wilder' 为 Wilder 平滑"""
+    delta = diff(close)
+    # 第一根K线的 diff 为 NaN，按 where(delta > 0, 0) 的语义计为0
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+    if method == 'wilder':
+        gain = ema(gain, alpha=1.0 / window)
+        loss = ema(loss, alpha=1.0 / window)
+    else:
+        gain = rolling_mean(gain, window)
+        loss = rolling_mean(loss, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 - (100 / (1 + gain / loss))
+
+
+def typical_price(high, low, close):
+    return (_as_float(high) + _as_float(low) + _as_float(close)) / 3
+
+
+def mfi(high, low, close, volume, window=14):
+    """资金流量指标 MFI"""
+    tp = typical_price(high, low, close)
+    raw_money_flow = tp * _as_float(volume)
+    previous = shift(tp)
+    positive_flow = rolling_sum(np.where(tp > previous, raw_money_flow, 0.0), window)
+    negative_flow = rolling_sum(np.where(tp < previous, raw_money_flow, 0.0), window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 - (100 / (1 + positive_flow / negative_flow))
+
+
+def obv(close, volume):
+    """能量潮 OBV：收盘价不高于前一日记为流出，首根K线记为流入"""
+    volume = _as_float(volume)
+    direction = np.where(diff(close) <= 0, -1.0, 1.0)
+    flow = volume * direction
+    out = np.nancumsum(flow, axis=-1)
+    out[np.isnan(flow)] = np.nan
+    return out
+
+
+def true_range(high, low, close):
+    """真实波幅：max(最高-最低, |最高-前收|, |最低-前收|)"""
+    high, low = _as_float(high), _as_float(low)
+    prev_close = shift(close)
+    # fmax 忽略 NaN：首根K线没有前收，真实波幅即为最高-最低
+    return np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+
+
+def atr(high, low, close, window=14):
+    """平均真实波幅 ATR（简单移动平均）"""
+    return rolling_mean(true_range(high, low, close), window)
+
+
+def volume_ratio(volume, window):
+    """成交量相对前 window 日（含当日）均量的倍数"""
+    volume = _as_float(volume)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return volume / rolling_mean(volume, window)
@@ -0,0 +1,168 @@
+"""盘中行情两级缓存
+
+- 日K：一年日K线只在收盘后才会变化，缓存到下一次收盘（美东 16:00）为止
+- 盘中K线：缓存最近一个交易日的K线，以K线周期为界刷新；进入新的一根K线时只从最后一根
+  （可能尚未走完的）K线开始增量拉取并拼接
+
+两级共用一个按内存占用（而不是条目数）淘汰的LRU。
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from services.bar_store import BAR_DTYPE
+from services.bars import Bars
+from services.fundamentals import MARKET_TZ
+from services.market_data import get_provider
+from services.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# 首次拉取盘中K线时回看的时间，覆盖周末和节假日，取其中最近一个交易日
+INTRADAY_LOOKBACK = 5 * 86400
+
+SESSION_CLOSE = pd.Timedelta(hours=16)
+
+# 缓存占用的内存上限
+MONITOR_CACHE_MAX_BYTES = int(os.getenv('MONITOR_CACHE_MAX_MB', 64)) * 1024 * 1024
+
+
+def bar_start(ts, seconds):
+    """ts 所在K线的起始时间"""
+    return int(ts) // seconds * seconds
+
+
+def next_session_close(ts):
+    """ts 之后最近一次收盘（美东工作日 16:00）的Unix秒，不区分节假日"""
+    now = pd.Timestamp(int(ts), unit='s', tz='UTC').tz_convert(MARKET_TZ)
+    close = now.normalize() + SESSION_CLOSE
+    if now >= close:
+        close += pd.Timedelta(days=1)
+    while close.weekday() >= 5:
+        close += pd.Timedelta(days=1)
+    return int(close.timestamp())
+
+
+def _compact(bars):
+    """复制为独立的连续数组，避免缓存引用数据源中更大的底层数组，也使内存占用可精确计算"""
+    return Bars.from_records(bars.to_records())
+
+
+class IntradayCache:
+    """StockMonitor 使用的日K + 盘中K线缓存，并发的相同请求合并为一次拉取"""
+
+    def __init__(self, interval='15m', max_bytes=MONITOR_CACHE_MAX_BYTES):
+        self.interval = interval
+        self.bar_seconds = int(interval[:-1]) * 60
+        self.max_bytes = max_bytes
+        self.flight = SingleFlight('intraday')
+        self._entries = OrderedDict()  # (数据源, 层, 股票) -> (有效标记, Bars)，按访问时间从旧到新排列
+        self._total = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.requests = 0
+        self.evictions = 0
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, tag, bars):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total -= len(previous[1]) * BAR_DTYPE.itemsize
+            self._entries[key] = (tag, bars)
+            self._total += len(bars) * BAR_DTYPE.itemsize
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._total -= len(evicted) * BAR_DTYPE.itemsize
+                self.evictions += 1
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def daily(self, symbol) -> Bars:
+        """最近一年的日K，缓存到下一次收盘"""
+        provider = get_provider()
+        now = provider.clock()
+        key = (provider.name, 'daily', symbol)
+        entry = self._get(key)
+        if entry is not None and now < entry[0]:
+            self._count(True)
+            return entry[1]
+        self._count(False)
+        return self.flight.do(key, self._fetch_daily, provider, symbol, key, now)
+
+    def _fetch_daily(self, provider, symbol, key, now):
+        bars = provider.fetch_bars(symbol, {'range': '1y', 'interval': '1d'})
+        with self._lock:
+            self.requests += 1
+        if bars is None:
+            raise ValueError(f"无法获取{symbol}日K数据")
+        bars = _compact(bars.clean())
+        self._put(key, next_session_close(now), bars)
+        return bars
+
+    def intraday(self, symbol) -> Bars:
+        """最近一个交易日的盘中K线；同一根K线内直接返回缓存"""
+        provider = get_provider()
+        now = provider.clock()
+        bar = bar_start(now, self.bar_seconds)
+        key = (provider.name, 'intraday', symbol)
+        entry = self._get(key)
+        if entry is not None and entry[0] == bar:
+            self._count(True)
+            return entry[1]
+        self._count(False)
+        return self.flight.do(key, self._fetch_intraday, provider, symbol, key, now, bar,
+                              entry[1] if entry is not None else None)
+
+    def _fetch_intraday(self, provider, symbol, key, now, bar, cached):
+        # 最后一根K线可能尚未走完，从它开始重新拉取
+        start = int(cached.timestamp[-1]) if cached is not None and len(cached) else now - INTRADAY_LOOKBACK
+        fresh = provider.fetch_bars(symbol, {
+            'period1': start, 'period2': now, 'interval': self.interval, 'includePrePost': 'false'
+        })
+        with self._lock:
+            self.requests += 1
+        if fresh is None:
+            if cached is None:
+                raise ValueError(f"无法获取{symbol}盘中数据")
+            # 拉取失败时返回已有数据，不更新有效标记，下次检查时重试
+            logger.warning(f"刷新{symbol}盘中数据失败，使用缓存")
+            return cached
+        fresh = fresh.clean()
+        bars = Bars.concat([cached.between(end=start - 1), fresh]) if cached is not None else fresh
+        if len(bars):
+            # 只保留最近一个交易日（美股常规交易时段在同一个UTC日内）
+            bars = bars.between(start=bar_start(bars.timestamp[-1], 86400))
+        bars = _compact(bars)
+        self._put(key, bar, bars)
+        return bars
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'requests': self.requests,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'coalesced': self.flight.stats()['coalesced']
+            }
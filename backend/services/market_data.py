@@ -0,0 +1,358 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import zlib
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from services.async_data import http_client, run_blocking, run_cpu
+from services.bar_store import BarStore, BAR_DTYPE
+from services.bars import Bars, decode_chart
+from services.rate_limiter import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).parent.parent / 'data'
+
+
+def parse_period(period, now):
+    """解析 yfinance 风格的时间段：返回 ('bars', 根数) / ('since', 起始时间戳) / ('all',)"""
+    if period == 'max':
+        return ('all',)
+    match = re.fullmatch(r'(\d+)(d|wk|mo|y)', period or '')
+    if not match:
+        return parse_period('1y', now)
+    count, unit = int(match.group(1)), match.group(2)
+    if unit == 'd':
+        return ('bars', count)
+    offset = {
+        'wk': pd.DateOffset(weeks=count),
+        'mo': pd.DateOffset(months=count),
+        'y': pd.DateOffset(years=count)
+    }[unit]
+    return ('since', int((pd.Timestamp(now, unit='s') - offset).timestamp()))
+
+
+def records_to_history(records):
+    """K线记录数组转换为与 yfinance Ticker.history 相同列名的DataFrame"""
+    index = pd.to_datetime(records['timestamp'], unit='s', utc=True).tz_convert('America/New_York')
+    return pd.DataFrame({
+        'Open': records['open'],
+        'High': records['high'],
+        'Low': records['low'],
+        'Close': records['close'],
+        'Volume': records['volume'],
+        'Dividends': 0.0,
+        'Stock Splits': 0.0
+    }, index=index)
+
+
+class MarketDataProvider:
+    """行情数据源接口：所有服务通过它访问K线、基本面和搜索数据"""
+
+    name = 'base'
+
+    @property
+    def cache_dir(self):
+        """本地K线存储目录，不同数据源的数据互不混用"""
+        return DATA_DIR / 'bars' / self.name
+
+    def clock(self):
+        """数据源的当前时间（Unix秒）"""
+        return int(time.time())
+
+    def fetch_bars(self, symbol, params):
+        """获取K线（Bars），params 为 period1/period2 或 range，以及可选 interval"""
+        raise NotImplementedError
+
+    async def fetch_bars_async(self, symbol, params):
+        return await run_blocking(self.fetch_bars, symbol, params)
+
+    def history(self, symbol, period='1mo', interval='1d'):
+        """获取 yfinance 风格的历史行情 DataFrame"""
+        raise NotImplementedError
+
+    def info(self, symbol):
+        """获取基本面信息字典（字段与 yfinance Ticker.info 一致）"""
+        raise NotImplementedError
+
+    def search(self, query):
+        """搜索股票，返回 [{'symbol', 'name', 'exchange'}]"""
+        raise NotImplementedError
+
+    async def search_async(self, query):
+        return await run_blocking(self.search, query)
+
+
+class YahooProvider(MarketDataProvider):
+    """Yahoo Finance 数据源：chart/search 接口直连，历史行情和基本面走 yfinance，全部经过共享限流器"""
+
+    name = 'yahoo'
+    CHART_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{ticker}"
+    SEARCH_URL = "https://query2.finance.yahoo.com/v1/finance/search"
+
+    def __init__(self):
+        self.headers = {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0",
+            "Accept": "application/json"
+        }
+
+    @property
+    def cache_dir(self):
+        return DATA_DIR / 'bars'
+
+    @staticmethod
+    def _chart_params(params):
+        return {
+            "interval": "1d",
+            "includePrePost": "true",
+            "events": "div,splits,capitalGains",
+            **params
+        }
+
+    def fetch_bars(self, symbol, params):
+        # 发送请求（共享限流器，有余量时不等待）
+        response = rate_limiter.request('GET', self.CHART_URL.format(ticker=symbol),
+                                        headers=self.headers, params=self._chart_params(params))
+        if response.status_code != 200:
+            logger.error(f"获取{symbol}数据失败，状态码: {response.status_code}")
+            return None
+        return self.parse_chart(symbol, response.content)
+
+    async def fetch_bars_async(self, symbol, params):
+        response = await http_client.get(self.CHART_URL.format(ticker=symbol), headers=self.headers,
+                                         params=self._chart_params(params))
+        if response.status_code != 200:
+            logger.error(f"获取{symbol}数据失败，状态码: {response.status_code}")
+            return None
+        return await run_cpu(self.parse_chart, symbol, response.content)
+
+    @staticmethod
+    def parse_chart(symbol, content):
+        """解析chart接口返回的JSON为 Bars，失败返回None"""
+        try:
+            return decode_chart(content)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            logger.error(f"解析{symbol}数据失败: {str(e)}")
+            return None
+
+    def history(self, symbol, period='1mo', interval='1d'):
+        return rate_limiter.call(yf.Ticker(symbol).history, period=period, interval=interval)
+
+    def info(self, symbol):
+        return rate_limiter.call(lambda: yf.Ticker(symbol).info)
+
+    def _format_search(self, data):
+        # 过滤并格式化结果
+        suggestions = []
+        for item in data.get('quotes', [])[:10]:
+            if item.get('quoteType') == 'EQUITY':
+                suggestions.append({
+                    'symbol': item.get('symbol'),
+                    'name': item.get('longname') or item.get('shortname'),
+                    'exchange': item.get('exchange')
+                })
+        return suggestions
+
+    def search(self, query):
+        response = rate_limiter.request('GET', self.SEARCH_URL, headers=self.headers, params={'q': query})
+        response.raise_for_status()
+        return self._format_search(response.json())
+
+    async def search_async(self, query):
+        response = await http_client.get(self.SEARCH_URL, headers=self.headers, params={'q': query})
+        response.raise_for_status()
+        return self._format_search(response.json())
+
+
+class ReplayProvider(MarketDataProvider):
+    """离线回放数据源：优先回放磁盘上录制的K线（BarStore 格式），没有录制数据的股票按代码生成确定性的合成K线
+
+    可配置固定的回放时钟和每次请求的模拟延迟，便于离线、可复现地压测和基准测试。
+    """
+
+    name = 'replay'
+    SYNTHETIC_START = '2010-01-04'
+    SYNTHETIC_END = '2035-12-31'
+
+    def __init__(self, data_dir=None, latency=0.0, now=None):
+        self.store = BarStore(data_dir or DATA_DIR / 'replay')
+        self.latency = latency
+        self.now = int(pd.Timestamp(now).timestamp()) if now else None
+        self._universe = None
+
+    def clock(self):
+        """回放时钟：未配置时使用当前时间"""
+        return self.now if self.now is not None else int(time.time())
+
+    def _wait(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def _records(self, symbol, interval):
+        recorded = self.store.read(symbol, interval)
+        if len(recorded):
+            records = np.asarray(recorded)
+        elif interval == '1d':
+            records = _synthetic_daily(symbol.upper(), self.SYNTHETIC_START, self.SYNTHETIC_END)
+        else:
+            records = self._synthetic_intraday(symbol, interval)
+        return records[records['timestamp'] <= self.clock()]
+
+    def _synthetic_intraday(self, symbol, interval):
+        """以最近一根日K为基准生成当日的日内K线"""
+        minutes = int(re.fullmatch(r'(\d+)m', interval).group(1)) if re.fullmatch(r'(\d+)m', interval) else 15
+        daily = self._records(symbol, '1d')
+        if len(daily) == 0:
+            return np.empty(0, dtype=BAR_DTYPE)
+        day = daily[-1]
+        count = max(1, 390 // minutes)
+        rng = np.random.default_rng(zlib.crc32(f"{symbol.upper()}:{day['timestamp']}:{minutes}".encode()))
+        path = np.linspace(day['open'], day['close'], count + 1)
+        path[1:-1] += rng.normal(0, (day['high'] - day['low']) / 6, count - 1)
+        path = np.clip(path, day['low'], day['high'])
+        records = np.empty(count, dtype=BAR_DTYPE)
+        records['timestamp'] = day['timestamp'] + np.arange(count) * minutes * 60
+        records['open'] = path[:-1]
+        records['close'] = path[1:]
+        records['high'] = np.maximum(path[:-1], path[1:])
+        records['low'] = np.minimum(path[:-1], path[1:])
+        records['volume'] = np.round(day['volume'] * rng.dirichlet(np.ones(count)))
+        records['adjclose'] = records['close']
+        return records
+
+    def _slice(self, records, params):
+        now = self.clock()
+        if 'range' in params:
+            bounds = parse_period(params['range'], now)
+            if bounds[0] == 'bars':
+                return records[-bounds[1]:]
+            if bounds[0] == 'since':
+                return records[records['timestamp'] >= bounds[1]]
+            return records
+        ts = records['timestamp']
+        return records[(ts >= int(params.get('period1', 0))) & (ts <= int(params.get('period2', now)))]
+
+    def fetch_bars(self, symbol, params):
+        self._wait()
+        return Bars.from_records(self._slice(self._records(symbol, params.get('interval', '1d')), params))
+
+    async def fetch_bars_async(self, symbol, params):
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        return Bars.from_records(self._slice(self._records(symbol, params.get('interval', '1d')), params))
+
+    def history(self, symbol, period='1mo', interval='1d'):
+        self._wait()
+        records = self._records(symbol, interval)
+        if interval != '1d' and len(records):
+            # 日内数据按交易日截取
+            days = records['timestamp'] // 86400
+            sessions = np.unique(days)
+            bounds = parse_period(period, self.clock())
+            count = bounds[1] if bounds[0] == 'bars' else len(sessions)
+            records = records[days >= sessions[-min(count, len(sessions))]]
+        else:
+            records = self._slice(records, {'range': period})
+        return records_to_history(records)
+
+    def _load_universe(self):
+        if self._universe is None:
+            try:
+                with open(DATA_DIR / 'us_stocks.json', 'r', encoding='utf-8') as f:
+                    self._universe = json.load(f)
+            except Exception as e:
+                logger.error(f"Error loading stock universe: {str(e)}")
+                self._universe = {}
+        return self._universe
+
+    def info(self, symbol):
+        self._wait()
+        rng = np.random.default_rng(zlib.crc32(f"info:{symbol.upper()}".encode()))
+        name = self._load_universe().get(symbol.upper(), {}).get('name', symbol.upper())
+        return {
+            'symbol': symbol.upper(),
+            'longName': name,
+            'shortName': name,
+            'marketCap': int(10 ** rng.uniform(8.5, 12.5)),
+            'forwardPE': round(float(rng.uniform(5, 60)), 2),
+            'institutionalOwnership': round(float(rng.uniform(0, 0.9)), 4)
+        }
+
+    def search(self, query):
+        self._wait()
+        query = query.upper().strip()
+        results = []
+        for ticker, item in self._load_universe().items():
+            if query in ticker or query.lower() in item['name'].lower():
+                results.append({'symbol': ticker, 'name': item['name'], 'exchange': item['exchange']})
+        results.sort(key=lambda x: len(x['symbol']))
+        return results[:10]
+
+
+@lru_cache(maxsize=8)
+def _business_days(start, end):
+    """交易日（工作日）的Unix秒时间戳；所有股票共用，生成一次后缓存"""
+    days = pd.bdate_range(start, end).values.astype('datetime64[s]').astype(np.int64)
+    days.flags.writeable = False
+    return days
+
+
+# 每只股票约 6500 根日K × 56 字节 ≈ 360KB，缓存 256 只约占 90MB；回放全市场时按 LRU 淘汰后重新生成
+SYNTHETIC_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=SYNTHETIC_CACHE_SIZE)
+def _synthetic_daily(symbol, start, end):
+    """按股票代码生成确定性的合成日K（几何布朗运动）"""
+    rng = np.random.default_rng(zlib.crc32(symbol.encode()))
+    days = _business_days(start, end)
+    count = len(days)
+    close = (20 + rng.random() * 280) * np.exp(np.cumsum(rng.normal(0.0003, 0.02, count)))
+    open_ = np.concatenate([[close[0]], close[:-1]]) * np.exp(rng.normal(0, 0.005, count))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, count)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, count)))
+
+    records = np.empty(count, dtype=BAR_DTYPE)
+    # 美东 9:30 开盘（UTC 13:30，不区分夏令时）
+    records['timestamp'] = days + 13 * 3600 + 30 * 60
+    records['open'] = open_
+    records['high'] = high
+    records['low'] = low
+    records['close'] = close
+    records['volume'] = np.round(rng.lognormal(np.log(5e6), 0.5, count))
+    records['adjclose'] = close
+    records.flags.writeable = False
+    return records
+
+
+_provider = None
+
+
+def get_provider() -> MarketDataProvider:
+    """获取当前数据源，由环境变量 MARKET_DATA_PROVIDER（yahoo / replay）选择"""
+    global _provider
+    if _provider is None:
+        if os.getenv('MARKET_DATA_PROVIDER', 'yahoo').lower() == 'replay':
+            _provider = ReplayProvider(
+                data_dir=os.getenv('REPLAY_DATA_DIR') or None,
+                latency=float(os.getenv('REPLAY_LATENCY_MS', 0)) / 1000,
+                now=os.getenv('REPLAY_NOW') or None
+            )
+        else:
+            _provider = YahooProvider()
+        logger.info(f"Using market data provider: {_provider.name}")
+    return _provider
+
+
+def set_provider(provider: MarketDataProvider):
+    """替换当前数据源（用于压测、基准测试或接入新的行情源）"""
+    global _provider
+    _provider = provider
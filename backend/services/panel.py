@@ -0,0 +1,141 @@
+"""截面面板：把整个股票池的K线对齐为 (股票数, K线数) 矩阵，一次向量化计算全部股票的指标
+
+缺失的K线为 NaN。按时间对齐时，窗口内有缺失K线的指标为 NaN；
+按右对齐（每只股票最近的K线排在最后一列）时，指标与逐只股票单独计算的结果一致。
+"""
+import warnings
+
+import numpy as np
+
+from services import indicators
+from services.bars import Bars
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class Panel:
+    """对齐后的 open/high/low/close/volume 矩阵
+
+    timestamp 为按时间对齐时各列的时间戳；右对齐后各行的列不再对应同一时间，timestamp 为 None。
+    """
+
+    def __init__(self, symbols, timestamp, open, high, low, close, volume):
+        self.symbols = list(symbols)
+        self.timestamp = timestamp
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self._index = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @property
+    def shape(self):
+        return self.close.shape
+
+    @classmethod
+    def from_bars(cls, bars_by_symbol, align='time'):
+        """由 {股票: Bars} 构建面板，align 为 'time'（按时间戳对齐）或 'right'（右对齐）"""
+        symbols = list(bars_by_symbol)
+        bars = [bars_by_symbol[symbol] for symbol in symbols]
+        if bars:
+            timestamp = np.unique(np.concatenate([np.asarray(b.timestamp, dtype=np.int64) for b in bars]))
+        else:
+            timestamp = np.empty(0, dtype=np.int64)
+
+        columns = {field: np.full((len(symbols), len(timestamp)), np.nan) for field in FIELDS}
+        for i, b in enumerate(bars):
+            index = np.searchsorted(timestamp, b.timestamp)
+            for field in FIELDS:
+                columns[field][i, index] = getattr(b, field)
+
+        panel = cls(symbols, timestamp, **columns)
+        return panel.right_aligned() if align == 'right' else panel
+
+    @classmethod
+    def from_frames(cls, frames, align='time'):
+        """由 {股票: DataFrame(Open/High/Low/Close/Volume)} 构建面板"""
+        bars = {}
+        for symbol, df in frames.items():
+            bars[symbol] = Bars(
+                df.index.values.astype('datetime64[s]').astype(np.int64),
+                *(df[field.capitalize()].to_numpy(dtype=float) for field in FIELDS)
+            )
+        return cls.from_bars(bars, align=align)
+
+    def right_aligned(self):
+        """每行的有效K线保持顺序移到最右侧，缺失的K线移到左侧（NaN）"""
+        order = np.argsort(self.valid, axis=1, kind='stable')
+        columns = {field: np.take_along_axis(getattr(self, field), order, axis=1) for field in FIELDS}
+        return Panel(self.symbols, None, **columns)
+
+    def tail(self, count):
+        """截取最后 count 列"""
+        start = max(self.shape[1] - count, 0)
+        return Panel(self.symbols, None if self.timestamp is None else self.timestamp[start:],
+                     **{field: getattr(self, field)[:, start:] for field in FIELDS})
+
+    def select(self, rows):
+        """按行位置选取部分股票"""
+        rows = np.asarray(rows, dtype=np.intp)
+        return Panel([self.symbols[i] for i in rows], self.timestamp,
+                     **{field: getattr(self, field)[rows] for field in FIELDS})
+
+    def row(self, symbol):
+        return self._index[symbol]
+
+    @property
+    def valid(self):
+        """有效K线掩码"""
+        return np.isfinite(self.close) & np.isfinite(self.volume)
+
+    def _complete(self, values, window):
+        """窗口内有缺失K线（包括左侧尚无数据）的位置置为NaN"""
+        complete = indicators.rolling_sum(self.valid.astype(float), window) == window
+        return np.where(complete, values, np.nan)
+
+    def last(self, values):
+        """每行最后一个有效值"""
+        values = np.asarray(values, dtype=float)
+        finite = np.isfinite(values)
+        index = values.shape[1] - 1 - np.argmax(finite[:, ::-1], axis=1)
+        out = values[np.arange(len(values)), index]
+        out[~finite.any(axis=1)] = np.nan
+        return out
+
+    # ---- 指标（全部股票一次计算，返回 (股票数, K线数) 矩阵） ----
+
+    def sma(self, window, field='close'):
+        return indicators.sma(getattr(self, field), window)
+
+    def ema(self, span, field='close'):
+        return indicators.ema(getattr(self, field), span)
+
+    def macd(self, fast=12, slow=26, signal=9):
+        return indicators.macd(self.close, fast, slow, signal)
+
+    def rsi(self, window=14, method='sma'):
+        values = indicators.rsi(self.close, window, method)
+        return values if method == 'wilder' else self._complete(values, window)
+
+    def mfi(self, window=14):
+        return self._complete(indicators.mfi(self.high, self.low, self.close, self.volume, window), window)
+
+    def obv(self):
+        return indicators.obv(self.close, self.volume)
+
+    def atr(self, window=14):
+        return indicators.atr(self.high, self.low, self.close, window)
+
+    def pct_change(self, field='close', periods=1):
+        return indicators.pct_change(getattr(self, field), periods)
+
+    def window_mean(self, count, field='volume'):
+        """每行最后 count 列的均值（忽略缺失K线，与 Series.mean 相同）"""
+        with warnings.catch_warnings():
+            # 整行缺失时结果为NaN，不需要 "Mean of empty slice" 警告
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return np.nanmean(getattr(self, field)[:, -count:], axis=1)
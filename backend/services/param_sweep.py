@@ -0,0 +1,261 @@
+"""阈值参数扫描
+
+每只股票的指标序列只计算一次，所有参数组合的信号由阈值数组 (组合数, 1) 与
+指标数组 (交易日数,) 广播比较一次得到，再按回测胜率的 Wilson 区间下限排序。
+"""
+import logging
+import math
+
+import numpy as np
+import pandas as pd
+
+from services import indicators
+from services.stock_analyzer import (
+    MONEY_FLOW_DIRECTIONS, MONEY_FLOW_THRESHOLDS, money_flow_codes, money_flow_features, range_targets
+)
+from services.alert_rules import DEFAULT_THRESHOLDS
+from services.stock_scanner import VOLUME_SURGE_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+# 每批广播比较的元素数上限（组合数 × 交易日数），控制内存占用
+CHUNK_ELEMENTS = 4_000_000
+
+# 95% 置信区间
+Z = 1.96
+
+
+class SweepStrategy:
+    """可扫描的规则：features 从K线计算指标序列，signal 根据（可广播的）阈值给出看多/看空/无信号"""
+
+    name = None
+    defaults = {}
+    grid = {}
+
+    def current(self, rules=None, scanner=None):
+        """线上当前生效的参数（未被规则或扫描器覆盖的参数使用 defaults）"""
+        return dict(self.defaults)
+
+    def features(self, bars):
+        raise NotImplementedError
+
+    def signal(self, features, params):
+        raise NotImplementedError
+
+
+class MoneyFlowStrategy(SweepStrategy):
+    """money_flow_analysis 的分类阈值；信号方向见 MONEY_FLOW_DIRECTIONS"""
+
+    name = 'money_flow'
+    defaults = MONEY_FLOW_THRESHOLDS
+    grid = {
+        'price_strong': [1.0, 2.0, 3.0],
+        'volume_strong': [20.0, 30.0, 50.0],
+        'obv_strong': [2.0, 3.0, 5.0],
+        'obv_weak': [1.0, 2.0, 3.0],
+        'mfi_high': [65.0, 70.0, 80.0],
+        'mfi_low': [20.0, 30.0, 35.0],
+        'mfi_bull': [50.0, 55.0, 60.0],
+        'mfi_bear': [40.0, 45.0, 50.0]
+    }
+
+    def features(self, bars):
+        names = ('price_change', 'volume_change', 'mfi', 'obv_change')
+        return dict(zip(names, money_flow_features(bars.high, bars.low, bars.close, bars.volume)))
+
+    def signal(self, features, params):
+        codes = money_flow_codes(features['price_change'], features['volume_change'],
+                                  features['mfi'], features['obv_change'], params)
+        return MONEY_FLOW_DIRECTIONS[codes]
+
+
+class SurgeStrategy(SweepStrategy):
+    """监控/扫描使用的异动阈值：当日涨幅超过 daily_change% 且成交量超过30日均量的 volume_surge% 时看多
+
+    daily_change 对应预警规则中的单日涨幅规则，volume_surge 对应扫描器的放量阈值。
+    """
+
+    name = 'surge'
+    defaults = {
+        'daily_change': DEFAULT_THRESHOLDS['daily_change'],
+        'volume_surge': VOLUME_SURGE_THRESHOLD
+    }
+    grid = {
+        'daily_change': list(np.arange(1.0, 10.5, 0.5)),
+        'volume_surge': list(np.arange(100.0, 525.0, 25.0))
+    }
+
+    def features(self, bars):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return {
+                'day_change': (bars.close - bars.open) / bars.open * 100,
+                'volume_ratio': indicators.volume_ratio(bars.volume, 30) * 100
+            }
+
+    def current(self, rules=None, scanner=None):
+        params = dict(self.defaults)
+        if rules is not None:
+            # 启用的、作用于全部股票的单日涨幅规则中最低的阈值（最先触发的那条）
+            thresholds = [
+                rule['threshold'] for rule in rules.rules()
+                if rule['enabled'] and rule['feature'] == 'daily_change'
+                and rule['direction'] in ('above', 'at_or_above') and not isinstance(rule['threshold'], str)
+                and not rule['symbols'] and not rule['group']
+            ]
+            if thresholds:
+                params['daily_change'] = min(thresholds)
+        if scanner is not None:
+            params['volume_surge'] = float(scanner.volume_surge_threshold)
+        return params
+
+    def signal(self, features, params):
+        return ((features['day_change'] > params['daily_change'])
+                & (features['volume_ratio'] > params['volume_surge'])).astype(np.int8)
+
+
+STRATEGIES = {strategy.name: strategy for strategy in (MoneyFlowStrategy(), SurgeStrategy())}
+
+
+def get_strategy(name):
+    if name not in STRATEGIES:
+        raise ValueError(f"未知的扫描规则: {name}，可选: {', '.join(STRATEGIES)}")
+    return STRATEGIES[name]
+
+
+def fetch_range(start_date, end_date, horizon):
+    """扫描所需K线的时间范围：与区间回测相同的起点，终点多取 horizon 个交易日用于计算远期收益"""
+    start = pd.to_datetime(start_date) - pd.Timedelta(days=7)
+    end = pd.to_datetime(end_date) + pd.Timedelta(days=int(horizon * 1.5) + 10)
+    return start, end
+
+
+def prepare(strategy, bars_by_symbol, start_date, end_date, horizon=1):
+    """计算所有股票在区间内各交易日的指标和持有 horizon 个交易日的收益率（%），拼接为一维序列"""
+    features, returns = [], []
+    for symbol, bars in bars_by_symbol.items():
+        if bars is None or len(bars) < 2:
+            continue
+        _, targets = range_targets(bars, start_date, end_date)
+        if targets is None or len(targets) == 0:
+            continue
+        values = strategy.features(bars)
+        features.append({name: series[targets] for name, series in values.items()})
+
+        close = bars.close
+        forward = np.full(len(targets), np.nan)
+        ahead = targets + horizon < len(close)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            forward[ahead] = (close[targets[ahead] + horizon] / close[targets[ahead]] - 1) * 100
+        returns.append(forward)
+
+    if not features:
+        return {}, np.empty(0)
+    merged = {name: np.concatenate([f[name] for f in features]) for name in features[0]}
+    return merged, np.concatenate(returns)
+
+
+def grid_combinations(grid):
+    """网格搜索：全部取值的笛卡尔积"""
+    names = list(grid)
+    mesh = np.meshgrid(*(np.asarray(grid[name], dtype=float) for name in names), indexing='ij')
+    return {name: values.ravel() for name, values in zip(names, mesh)}
+
+
+def random_combinations(grid, samples, seed=None):
+    """随机搜索：在每个参数取值的 [最小值, 最大值] 内均匀采样"""
+    rng = np.random.default_rng(seed)
+    return {
+        name: rng.uniform(min(values), max(values), samples)
+        for name, values in grid.items()
+    }
+
+
+def evaluate(strategy, features, returns, combinations, base=None):
+    """分批广播计算每组参数的信号数、命中数（信号方向与收益方向一致）和平均方向收益
+
+    combinations 中没有的参数取 base（缺省为规则的 defaults）。
+    """
+    size = len(next(iter(combinations.values()))) if combinations else 1
+    count = np.zeros(size, dtype=np.int64)
+    hits = np.zeros(size, dtype=np.int64)
+    total = np.zeros(size)
+    valid = np.isfinite(returns)
+    chunk = max(1, CHUNK_ELEMENTS // max(len(returns), 1))
+
+    for start in range(0, size, chunk):
+        stop = min(start + chunk, size)
+        params = dict(base if base is not None else strategy.defaults)
+        params.update({name: values[start:stop, None] for name, values in combinations.items()})
+        direction = np.broadcast_to(strategy.signal(features, params), (stop - start, len(returns)))
+        signaled = (direction != 0) & valid
+        directional = np.where(signaled, direction * returns, 0.0)
+        count[start:stop] = signaled.sum(axis=1)
+        hits[start:stop] = (directional > 0).sum(axis=1)
+        total[start:stop] = directional.sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hit_rate = hits / count
+        mean_return = total / count
+        # Wilson 区间下限，样本少的组合不会仅凭偶然的高胜率排在前面
+        z2 = Z * Z
+        lower = ((hit_rate + z2 / (2 * count))
+                 - Z * np.sqrt(hit_rate * (1 - hit_rate) / count + z2 / (4 * count * count))) / (1 + z2 / count)
+    return {'signals': count, 'hit_rate': hit_rate, 'hit_rate_low': lower, 'mean_return': mean_return}
+
+
+def _number(value):
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def _row(params, results, i):
+    return {
+        'params': params,
+        'signals': int(results['signals'][i]),
+        'hit_rate': _number(results['hit_rate'][i]),
+        'hit_rate_low': _number(results['hit_rate_low'][i]),
+        'mean_return': _number(results['mean_return'][i])
+    }
+
+
+def sweep(strategy_name, bars_by_symbol, start_date, end_date, horizon=1, grid=None, samples=None,
+          seed=None, min_signals=30, top=20, current=None):
+    """扫描阈值组合并按胜率的 Wilson 区间下限排序（相同时信号数多的在前）
+
+    grid 为 {参数: [取值]}，缺省使用规则自带的网格；指定 samples 时在网格取值范围内随机采样。
+    信号数少于 min_signals 的组合不参与排名；同时返回当前阈值（current，缺省为规则的 defaults，
+    见 SweepStrategy.current）的表现作为对比，未扫描的参数也取当前值。
+    """
+    strategy = get_strategy(strategy_name)
+    grid = grid or strategy.grid
+    unknown = set(grid) - set(strategy.defaults)
+    if unknown:
+        raise ValueError(f"规则 {strategy.name} 没有参数: {', '.join(sorted(unknown))}")
+
+    features, returns = prepare(strategy, bars_by_symbol, start_date, end_date, horizon)
+    if not features:
+        raise ValueError("区间内没有可用的K线数据")
+
+    combinations = random_combinations(grid, samples, seed) if samples else grid_combinations(grid)
+    base = dict(strategy.defaults)
+    base.update(current or {})
+    results = evaluate(strategy, features, returns, combinations, base)
+    baseline = evaluate(strategy, features, returns, {}, base)
+
+    eligible = np.flatnonzero(results['signals'] >= min_signals)
+    order = eligible[np.lexsort((-results['signals'][eligible], -results['hit_rate_low'][eligible]))][:top]
+    ranked = []
+    for i in order:
+        params = dict(base)
+        params.update({name: float(values[i]) for name, values in combinations.items()})
+        ranked.append(_row(params, results, i))
+
+    return {
+        'strategy': strategy.name,
+        'horizon': horizon,
+        'days': int(len(returns)),
+        'evaluated': int(len(results['signals'])),
+        'eligible': int(len(eligible)),
+        'current': _row(base, baseline, 0),
+        'results': ranked
+    }
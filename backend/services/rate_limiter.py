@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# yfinance 内部请求走的主机，yfinance 调用共用该主机的预算
+YFINANCE_HOST = 'query2.finance.yahoo.com'
+
+# 各主机的默认预算：(每秒令牌数, 桶容量)
+DEFAULT_HOST_BUDGETS = {
+    'query1.finance.yahoo.com': (2.0, 5),
+    'query2.finance.yahoo.com': (2.0, 5),
+}
+
+
+# 网络错误（超时、DNS、连接中断）重试前的等待：首次 0.5 秒，之后逐次翻倍
+ERROR_BACKOFF_BASE = 0.5
+ERROR_BACKOFF_MAX = 8.0
+
+
+class RateLimitedError(Exception):
+    """上游持续返回429，重试次数用尽"""
+
+
+class TokenBucket:
+    """令牌桶：有余量时立即返回，无余量时计算需要等待的时间"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.backoff = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """预占一个令牌，返回调用方需要等待的秒数（0表示可立即发起请求）"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            return max(wait, self.blocked_until - now)
+
+    def throttled(self, retry_after=None, max_backoff=60.0):
+        """收到429：降低速率并进入指数退避"""
+        with self.lock:
+            self.backoff = min(max_backoff, self.backoff * 2 if self.backoff else 1.0)
+            try:
+                delay = max(self.backoff, float(retry_after or 0))
+            except ValueError:
+                delay = self.backoff
+            self.blocked_until = time.monotonic() + delay
+            self.rate = max(self.base_rate / 8, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+            return delay
+
+    def succeeded(self):
+        """请求成功：逐步恢复速率并清除退避"""
+        with self.lock:
+            if self.backoff == 0 and self.rate == self.base_rate:
+                return
+            self.backoff = 0.0
+            self.rate = min(self.base_rate, self.rate + self.base_rate / 10)
+
+
+class RateLimiter:
+    """进程级限流与重试：按主机分配令牌桶预算，根据429响应自适应退避"""
+
+    def __init__(self, default_rate=5.0, default_capacity=10, host_budgets=None, max_retries=3):
+        self.default_rate = default_rate
+        self.default_capacity = default_capacity
+        self.host_budgets = dict(DEFAULT_HOST_BUDGETS if host_budgets is None else host_budgets)
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self._buckets = {}
+        self._guard = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """从环境变量读取配置，例如 RATE_LIMIT_HOSTS=query1.finance.yahoo.com:2:5,api.example.com:10:20"""
+        host_budgets = dict(DEFAULT_HOST_BUDGETS)
+        for item in filter(None, os.getenv('RATE_LIMIT_HOSTS', '').split(',')):
+            host, rate, capacity = item.strip().split(':')
+            host_budgets[host] = (float(rate), float(capacity))
+        return cls(
+            default_rate=float(os.getenv('RATE_LIMIT_RATE', 5.0)),
+            default_capacity=float(os.getenv('RATE_LIMIT_CAPACITY', 10)),
+            host_budgets=host_budgets,
+            max_retries=int(os.getenv('RATE_LIMIT_MAX_RETRIES', 3)),
+        )
+
+    def bucket(self, host: str) -> TokenBucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            with self._guard:
+                bucket = self._buckets.get(host)
+                if bucket is None:
+                    rate, capacity = self.host_budgets.get(host, (self.default_rate, self.default_capacity))
+                    bucket = self._buckets[host] = TokenBucket(rate, capacity)
+        return bucket
+
+    def acquire(self, host: str):
+        """阻塞直到该主机有可用预算"""
+        wait = self.bucket(host).reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, host: str):
+        """异步版本，等待期间不阻塞事件循环"""
+        wait = self.bucket(host).reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def throttled(self, host: str, retry_after=None) -> float:
+        delay = self.bucket(host).throttled(retry_after)
+        logger.warning(f"{host} 请求受限，退避 {delay:.1f} 秒")
+        return delay
+
+    def succeeded(self, host: str):
+        self.bucket(host).succeeded()
+
+    @staticmethod
+    def error_backoff(host: str, attempt: int, error) -> float:
+        """网络错误后本次请求重试前的等待秒数
+
+        只延迟出错的请求本身：网络错误不说明上游在限流，不降低主机速率，也不阻塞其他调用方。
+        """
+        delay = min(ERROR_BACKOFF_MAX, ERROR_BACKOFF_BASE * 2 ** attempt)
+        logger.warning(f"{host} 请求失败（{type(error).__name__}），{delay:.1f} 秒后重试")
+        return delay
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """限流后发送HTTP请求：429时降低主机速率并退避，网络错误时只延迟本次请求后重试"""
+        host = urlparse(url).hostname
+        for attempt in range(self.max_retries):
+            self.acquire(host)
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                if attempt < self.max_retries - 1:
+                    time.sleep(self.error_backoff(host, attempt, e))
+                    continue
+                raise
+            if response.status_code == 429:
+                self.throttled(host, response.headers.get('Retry-After'))
+                continue
+            self.succeeded(host)
+            return response
+        raise RateLimitedError(f"{host} 持续限流，已重试 {self.max_retries} 次")
+
+    def call(self, func, *args, host: str = YFINANCE_HOST, **kwargs):
+        """限流后调用 yfinance 等第三方库函数，遇到限流异常时退避重试"""
+        for attempt in range(self.max_retries):
+            self.acquire(host)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                message = str(e)
+                if ('429' in message or 'Too Many Requests' in message or 'Rate limit' in message) \
+                        and attempt < self.max_retries - 1:
+                    self.throttled(host)
+                    continue
+                raise
+            self.succeeded(host)
+            return result
+
+
+# 全进程共享的限流器
+rate_limiter = RateLimiter.from_env()
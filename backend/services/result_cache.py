@@ -0,0 +1,127 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def code_version(*modules):
+    """根据模块源码计算版本哈希，计算逻辑有任何改动时缓存自动失效"""
+    digest = hashlib.sha256()
+    for module in modules:
+        digest.update(module.__name__.encode())
+        digest.update(Path(module.__file__).read_bytes())
+    return digest.hexdigest()[:16]
+
+
+class ResultCache:
+    """按内容寻址的磁盘结果缓存
+
+    键为请求参数与代码版本的哈希，每个结果一个JSON文件；文件修改时间记录最近访问时间，
+    总大小超过上限时按最近最少使用淘汰。
+    """
+
+    def __init__(self, root, max_bytes=256 * 1024 * 1024, version=''):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.version = version
+        self._lock = threading.Lock()
+        self._index = None  # 路径 -> 文件大小，按访问时间从旧到新排列
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, parts: dict) -> str:
+        payload = json.dumps({'parts': parts, 'version': self.version}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def _ensure_index(self):
+        if self._index is not None:
+            return
+        entries = []
+        for path in self.root.glob('*/*.json'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, path, stat.st_size))
+        entries.sort(key=lambda entry: entry[0])
+        self._index = OrderedDict((path, size) for _, path, size in entries)
+        self._total = sum(self._index.values())
+
+    def get(self, parts: dict):
+        """读取缓存结果，不存在时返回 None"""
+        path = self.path(self.key(parts))
+        with self._lock:
+            self._ensure_index()
+            if path not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(path)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+            os.utime(path)
+        except Exception as e:
+            logger.error(f"读取缓存 {path.name} 失败: {str(e)}")
+            self._discard(path)
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, parts: dict, value):
+        """写入结果并在超出容量时淘汰最久未访问的条目"""
+        path = self.path(self.key(parts))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f'.{threading.get_ident()}.tmp')
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp, path)
+            size = path.stat().st_size
+        except Exception as e:
+            logger.error(f"写入缓存 {path.name} 失败: {str(e)}")
+            tmp.unlink(missing_ok=True)
+            return
+
+        with self._lock:
+            self._ensure_index()
+            self._total += size - self._index.pop(path, 0)
+            self._index[path] = size
+            while self._total > self.max_bytes and len(self._index) > 1:
+                oldest, oldest_size = self._index.popitem(last=False)
+                self._total -= oldest_size
+                self.evictions += 1
+                oldest.unlink(missing_ok=True)
+
+    def _discard(self, path):
+        with self._lock:
+            if self._index is not None and path in self._index:
+                self._total -= self._index.pop(path)
+        path.unlink(missing_ok=True)
+
+    def stats(self):
+        with self._lock:
+            self._ensure_index()
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._index),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,235 @@
+"""筛选查询语言
+
+例如 ``rsi14 between 50 and 70 and volume / avg30 > 3 and mcap < 5e9``：
+查询只解析一次，编译为对特征表各列的 NumPy 向量运算，结果为每只股票一个布尔值。
+
+语法：
+- 逻辑：and / or / not，括号分组
+- 比较：< <= > >= == (=) !=，以及 ``x between a and b``（含两端）
+- 算术：+ - * /，一元负号
+- 数值：支持科学计数法和 k/m/b/t 后缀（如 5e9、5b、300m）
+- 字段：screening.METRICS 中的指标名及 ALIASES 中的简写
+
+指标缺失（NaN）的股票比较结果为 False。
+"""
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from services.screening import METRICS
+
+# 常用字段简写
+ALIASES = {
+    'mcap': 'market_cap',
+    'inst': 'institutional_ownership',
+    'pe': 'forward_pe',
+    'volume': 'current_volume',
+    'avg30': 'avg_volume_30d',
+    'avg20': 'avg_volume_20d',
+    'change': 'price_change',
+    'volume_chg': 'volume_change',
+    'rsi': 'rsi14',
+    'close': 'price'
+}
+
+SUFFIXES = {'k': 1e3, 'm': 1e6, 'b': 1e9, 't': 1e12}
+
+KEYWORDS = {'and', 'or', 'not', 'between'}
+
+_TOKEN = re.compile(r'''
+    \s*(?:
+        (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?[kKmMbBtT]?(?![A-Za-z0-9_]))
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<op><=|>=|==|!=|<|>|=|\+|-|\*|/|\(|\))
+    )''', re.VERBOSE)
+
+_COMPARISONS = {
+    '<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal,
+    '==': np.equal, '=': np.equal, '!=': np.not_equal
+}
+
+_ARITHMETIC = {'+': np.add, '-': np.subtract, '*': np.multiply, '/': np.divide}
+
+
+class QueryError(ValueError):
+    """查询语法错误或使用了未知字段"""
+
+
+def _tokenize(text):
+    tokens, position = [], 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None:
+            raise QueryError(f"无法识别的内容: {text[position:].strip()[:20]!r}（位置 {position}）")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'name' and value.lower() in KEYWORDS:
+            kind, value = 'keyword', value.lower()
+        tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    """递归下降解析，直接生成 (类型, 求值函数)，类型为 'num' 或 'bool'"""
+
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.position = 0
+        self.fields = set()
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def accept(self, kind, value=None):
+        token = self.peek()
+        if token[0] == kind and (value is None or token[1] == value):
+            self.position += 1
+            return token[1]
+        return None
+
+    def expect(self, kind, value=None):
+        token = self.accept(kind, value)
+        if token is None:
+            found = self.peek()[1]
+            raise QueryError(f"应为 {value or kind}，实际为 {found if found is not None else '结尾'}")
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise QueryError("查询不能为空")
+        kind, func = self.disjunction()
+        if self.position < len(self.tokens):
+            raise QueryError(f"多余的内容: {self.peek()[1]}")
+        if kind != 'bool':
+            raise QueryError("查询结果必须是条件（比较或逻辑运算）")
+        return func
+
+    @staticmethod
+    def _require(kind, expected, operator):
+        if kind != expected:
+            raise QueryError(f"{operator} 的操作数应为{'条件' if expected == 'bool' else '数值'}")
+
+    def _logical(self, keyword, operand, combine):
+        kind, func = operand()
+        while self.accept('keyword', keyword):
+            self._require(kind, 'bool', keyword)
+            right_kind, right = operand()
+            self._require(right_kind, 'bool', keyword)
+            func = (lambda left, right: lambda table: combine(left(table), right(table)))(func, right)
+        return kind, func
+
+    def disjunction(self):
+        return self._logical('or', self.conjunction, np.logical_or)
+
+    def conjunction(self):
+        return self._logical('and', self.negation, np.logical_and)
+
+    def negation(self):
+        if self.accept('keyword', 'not'):
+            kind, func = self.negation()
+            self._require(kind, 'bool', 'not')
+            return 'bool', lambda table: np.logical_not(func(table))
+        return self.comparison()
+
+    def comparison(self):
+        kind, left = self.sum()
+        if self.accept('keyword', 'between'):
+            self._require(kind, 'num', 'between')
+            low_kind, low = self.sum()
+            self.expect('keyword', 'and')
+            high_kind, high = self.sum()
+            self._require(low_kind, 'num', 'between')
+            self._require(high_kind, 'num', 'between')
+
+            def between(table):
+                values = left(table)
+                return (values >= low(table)) & (values <= high(table))
+            return 'bool', between
+
+        token = self.peek()
+        if token[0] == 'op' and token[1] in _COMPARISONS:
+            self.position += 1
+            self._require(kind, 'num', token[1])
+            right_kind, right = self.sum()
+            self._require(right_kind, 'num', token[1])
+            compare = _COMPARISONS[token[1]]
+            return 'bool', lambda table: compare(left(table), right(table))
+        return kind, left
+
+    def _arithmetic(self, operators, operand):
+        kind, func = operand()
+        while self.peek()[0] == 'op' and self.peek()[1] in operators:
+            operator = self.tokens[self.position][1]
+            self.position += 1
+            self._require(kind, 'num', operator)
+            right_kind, right = operand()
+            self._require(right_kind, 'num', operator)
+            func = (lambda left, right, apply: lambda table: apply(left(table), right(table)))(
+                func, right, _ARITHMETIC[operator]
+            )
+        return kind, func
+
+    def sum(self):
+        return self._arithmetic(('+', '-'), self.product)
+
+    def product(self):
+        return self._arithmetic(('*', '/'), self.unary)
+
+    def unary(self):
+        if self.accept('op', '-'):
+            kind, func = self.unary()
+            self._require(kind, 'num', '-')
+            return 'num', lambda table: np.negative(func(table))
+        return self.atom()
+
+    def atom(self):
+        number = self.accept('number')
+        if number is not None:
+            scale = SUFFIXES.get(number[-1].lower(), 1)
+            value = float(number[:-1] if scale != 1 else number) * scale
+            return 'num', lambda table: value
+        name = self.accept('name')
+        if name is not None:
+            field = ALIASES.get(name.lower(), name.lower())
+            if field not in METRICS:
+                raise QueryError(f"未知字段: {name}，可用字段: {', '.join(available_fields())}")
+            self.fields.add(field)
+            return 'num', lambda table: table[field]
+        if self.accept('op', '('):
+            result = self.disjunction()
+            self.expect('op', ')')
+            return result
+        found = self.peek()[1]
+        raise QueryError(f"应为数值、字段或括号，实际为 {found if found is not None else '结尾'}")
+
+
+class CompiledQuery:
+    """编译后的查询：fields 为用到的指标，调用时传入 {指标: 数组} 返回布尔掩码"""
+
+    def __init__(self, text, fields, func):
+        self.text = text
+        self.fields = frozenset(fields)
+        self._func = func
+
+    def __call__(self, columns, size=None):
+        if size is None:
+            size = len(next(iter(columns.values()))) if columns else 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mask = self._func(columns)
+        return np.broadcast_to(np.asarray(mask, dtype=bool), (size,))
+
+
+@lru_cache(maxsize=256)
+def compile_query(text: str) -> CompiledQuery:
+    """解析并编译查询，相同文本的查询直接返回缓存的编译结果"""
+    parser = _Parser(text)
+    func = parser.parse()
+    return CompiledQuery(text, parser.fields, func)
+
+
+def available_fields():
+    """可在查询中使用的字段（指标名和简写）"""
+    return sorted(set(METRICS) | set(ALIASES))
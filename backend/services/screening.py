@@ -0,0 +1,223 @@
+"""扫描筛选流水线
+
+筛选条件按计算成本排序（只看代码 → 当天缓存的基本面 → K线指标），逐个阶段只对仍未淘汰的股票计算，
+淘汰后不再计算后续条件，K线也只为通过前面阶段的股票拉取。一次扫描内的指标和条件结果缓存在
+ScreenContext 中，报告生成时直接复用。
+"""
+import asyncio
+import time
+
+import numpy as np
+
+from services.panel import Panel
+
+# 各阶段所需的数据，按获取成本从低到高排列
+REQUIREMENTS = ('symbol', 'info', 'bars')
+
+# 指标：name -> (所需数据, func(ctx, rows))，rows 为股票在 ctx.symbols 中的位置（升序）
+METRICS = {}
+
+
+def metric(name, requires):
+    def register(func):
+        METRICS[name] = (requires, func)
+        return func
+    return register
+
+
+def _number(value) -> float:
+    """基本面字段可能缺失或为None，统一转换为浮点数（无效值为NaN）"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def _institutional_ownership(info) -> float:
+    """基本面信息中的机构持股比例（%）"""
+    return (info.get('institutionalOwnership', 0) or 0) * 100
+
+
+@metric('market_cap', 'info')
+def _market_cap(ctx, rows):
+    return np.array([_number(ctx.info(i).get('marketCap', float('inf'))) for i in rows])
+
+
+@metric('institutional_ownership', 'info')
+def _institutional(ctx, rows):
+    return np.array([_number(_institutional_ownership(ctx.info(i))) for i in rows])
+
+
+@metric('forward_pe', 'info')
+def _forward_pe(ctx, rows):
+    return np.array([_number(ctx.info(i).get('forwardPE')) for i in rows])
+
+
+@metric('current_volume', 'bars')
+def _current_volume(ctx, rows):
+    return ctx.panel(rows).volume[:, -1]
+
+
+@metric('avg_volume_30d', 'bars')
+def _avg_volume_30d(ctx, rows):
+    return ctx.panel(rows).window_mean(30)
+
+
+@metric('avg_volume_20d', 'bars')
+def _avg_volume_20d(ctx, rows):
+    return ctx.panel(rows).window_mean(20)
+
+
+@metric('price', 'bars')
+def _price(ctx, rows):
+    return ctx.panel(rows).close[:, -1]
+
+
+@metric('price_change', 'bars')
+def _price_change(ctx, rows):
+    close = ctx.panel(rows).close
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (close[:, -1] - close[:, -2]) / close[:, -2] * 100
+
+
+@metric('volume_change', 'bars')
+def _volume_change(ctx, rows):
+    volume = ctx.panel(rows).volume
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (volume[:, -1] - volume[:, -2]) / volume[:, -2] * 100
+
+
+@metric('ma20', 'bars')
+def _ma20(ctx, rows):
+    return ctx.panel(rows).sma(20)[:, -1]
+
+
+@metric('rsi14', 'bars')
+def _rsi14(ctx, rows):
+    return ctx.panel(rows).rsi(14)[:, -1]
+
+
+class ScreenContext:
+    """一次扫描的输入数据和中间结果：每个指标、每个条件对每只股票最多计算一次"""
+
+    def __init__(self, symbols):
+        self.symbols = list(symbols)
+        self._index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.infos = {}
+        self.bars = {}
+        self.failed = {}
+        self.alive = np.ones(len(self.symbols), dtype=bool)
+        self._stages = {}
+        self._values = {}
+        self._conditions = {}
+        self._panel = None
+        self._panel_rows = None
+
+    def rows(self):
+        """仍未淘汰的股票位置"""
+        return np.flatnonzero(self.alive)
+
+    def alive_symbols(self):
+        return [self.symbols[i] for i in self.rows()]
+
+    def info(self, i):
+        return self.infos[self.symbols[i]]
+
+    def panel(self, rows):
+        """rows 对应的右对齐K线面板；首次需要K线时为当时存活的全部股票构建一次，之后按行选取"""
+        if self._panel is None or not np.isin(rows, self._panel_rows).all():
+            self._panel_rows = np.asarray(rows)
+            self._panel = Panel.from_bars({self.symbols[i]: self.bars[self.symbols[i]] for i in rows}, align='right')
+        if len(rows) == len(self._panel_rows):
+            return self._panel
+        return self._panel.select(np.searchsorted(self._panel_rows, rows))
+
+    def value(self, name, rows):
+        """指标值（缓存，只计算 rows 中尚未计算过的股票）"""
+        values, done = self._values.setdefault(
+            name, (np.full(len(self.symbols), np.nan), np.zeros(len(self.symbols), dtype=bool))
+        )
+        missing = rows[~done[rows]]
+        if len(missing):
+            values[missing] = METRICS[name][1](self, missing)
+            done[missing] = True
+        return values[rows]
+
+    def condition(self, name, rows, predicate):
+        """条件结果（缓存，只对 rows 中尚未判断过的股票调用 predicate）"""
+        passed, done = self._conditions.setdefault(
+            name, (np.zeros(len(self.symbols), dtype=bool), np.zeros(len(self.symbols), dtype=bool))
+        )
+        missing = rows[~done[rows]]
+        if len(missing):
+            passed[missing] = predicate(self, missing)
+            done[missing] = True
+        return passed[rows]
+
+    def load(self, stage, symbols, outcomes, target, seconds):
+        """记录一个数据获取阶段的结果：成功的存入 target，失败的记入 failed 并淘汰"""
+        rejected = 0
+        for symbol, outcome in zip(symbols, outcomes):
+            if isinstance(outcome, BaseException):
+                self.failed[symbol] = "超时" if isinstance(outcome, asyncio.TimeoutError) \
+                    else str(outcome) or type(outcome).__name__
+                self.alive[self._index[symbol]] = False
+                rejected += 1
+            else:
+                target[symbol] = outcome
+        self.record(stage, len(symbols), rejected, seconds)
+
+    def record(self, stage, evaluated, rejected, seconds):
+        """累计阶段统计：逐只股票执行时同一阶段多次记录，合并为一条"""
+        stats = self._stages.setdefault(stage, {'stage': stage, 'evaluated': 0, 'rejected': 0, 'seconds': 0.0})
+        stats['evaluated'] += evaluated
+        stats['rejected'] += rejected
+        stats['seconds'] += seconds
+
+    @property
+    def stages(self):
+        """各阶段的处理数、淘汰数和耗时，按首次执行的顺序排列"""
+        return [dict(stats) for stats in self._stages.values()]
+
+
+class FeatureTable:
+    """股票池的特征表：每个指标一列，行与 symbols 对应，供查询语言一次向量化筛选"""
+
+    def __init__(self, symbols, columns, failed=None, built_at=None):
+        self.symbols = list(symbols)
+        self.columns = columns
+        self.failed = failed or {}
+        self.built_at = built_at if built_at is not None else time.time()
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @classmethod
+    def from_context(cls, ctx):
+        """计算 ctx 中存活股票的全部指标"""
+        rows = ctx.rows()
+        columns = {name: ctx.value(name, rows) for name in METRICS}
+        return cls([ctx.symbols[i] for i in rows], columns, dict(ctx.failed))
+
+
+class ScreenPipeline:
+    """声明式筛选流水线：stages 为按成本排列的 (条件, 所需数据, predicate(ctx, rows))"""
+
+    def __init__(self, stages):
+        # 所需数据成本相同的阶段保持声明顺序
+        self.stages = sorted(stages, key=lambda stage: REQUIREMENTS.index(stage[1]))
+
+    @property
+    def names(self):
+        return [name for name, _, _ in self.stages]
+
+    def run(self, ctx, requires, rows=None):
+        """依次执行所需数据为 requires 的阶段，每个阶段只判断仍存活的股票（可限定在 rows 内）"""
+        for name, needs, predicate in self.stages:
+            if needs != requires:
+                continue
+            rows = ctx.rows() if rows is None else rows[ctx.alive[rows]]
+            started = time.perf_counter()
+            passed = ctx.condition(name, rows, predicate) if len(rows) else np.zeros(0, dtype=bool)
+            ctx.alive[rows[~passed]] = False
+            ctx.record(name, len(rows), int((~passed).sum()), time.perf_counter() - started)
@@ -0,0 +1,163 @@
+"""回测信号统计：按信号标签汇总之后 N 个交易日的收益表现
+
+输入为区间回测结果（backtest_range 的输出，可来自多只股票），先展开为
+（交易日, 信号）长表，再用 bincount/lexsort 一次完成所有标签的分组统计。
+"""
+import math
+
+import numpy as np
+
+# 默认统计的持有天数（交易日）
+HORIZONS = (1, 5, 20)
+
+# 95% 置信区间
+Z = 1.96
+
+CATEGORIES = ('technical_signals', 'volatility_alert', 'money_flow', 'volume_alert')
+
+
+def _label(text):
+    """去掉标签中的数值部分，如 "RSI超买 (72.3)" -> "RSI超买" """
+    return text.split(' (')[0]
+
+
+def forward_returns(prices, horizons=HORIZONS):
+    """第 i 天收盘持有 h 个交易日后的收益率（%），之后不足 h 天的为 NaN"""
+    prices = np.asarray(prices, dtype=float)
+    n = len(prices)
+    out = np.full((n, len(horizons)), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for j, h in enumerate(horizons):
+            if h < n:
+                out[:n - h, j] = (prices[h:] / prices[:n - h] - 1) * 100
+    return out
+
+
+def _expand(reports, horizons):
+    """把多只股票的区间回测结果展开为长表：每个 (交易日, 信号) 一行
+
+    返回 (分组键列表, 每行的分组编号, 每行对应的交易日行号, 各交易日的远期收益矩阵)。
+    """
+    values = {category: [] for category in CATEGORIES}
+    rows = {category: [] for category in CATEGORIES}
+    returns = []
+    offset = 0
+    for report in reports.values():
+        if not report or 'error' in report or not report.get('days'):
+            continue
+        days = report['days']
+        # 收盘价序列末尾接上最后一天的下一交易日收盘价
+        prices = [day['price'] for day in days] + [days[-1]['next_day']['price']]
+        returns.append(forward_returns(prices, horizons)[:len(days)])
+        index = range(offset, offset + len(days))
+        for category in CATEGORIES:
+            if category == 'technical_signals':
+                pairs = [(text, row) for row, day in zip(index, days) for text in day[category]]
+                values[category].extend(text for text, _ in pairs)
+                rows[category].extend(row for _, row in pairs)
+            else:
+                values[category].extend(day[category] for day in days)
+                rows[category].extend(index)
+        offset += len(days)
+
+    # 每个类别内先对原始文本去重编号，再把去掉数值后的标签映射为统一的分组编号
+    key_codes, codes, all_rows = {}, [], []
+    for category in CATEGORIES:
+        if not values[category]:
+            continue
+        unique, inverse = np.unique(np.array(values[category]), return_inverse=True)
+        mapping = np.array([key_codes.setdefault((category, _label(text)), len(key_codes)) for text in unique])
+        codes.append(mapping[inverse])
+        all_rows.append(np.array(rows[category], dtype=np.intp))
+    keys = sorted(key_codes, key=key_codes.get)
+
+    returns = np.vstack(returns) if returns else np.empty((0, len(horizons)))
+    if not codes:
+        return keys, np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), returns
+    return keys, np.concatenate(codes), np.concatenate(all_rows), returns
+
+
+def _group_stats(codes, groups, values):
+    """按分组编号一次计算每组的样本数、胜率、均值、中位数及置信区间"""
+    valid = np.isfinite(values)
+    codes, values = codes[valid], values[valid]
+    count = np.bincount(codes, minlength=groups)
+    hits = np.bincount(codes, values > 0, minlength=groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.bincount(codes, values, minlength=groups) / count
+        deviation = values - mean[codes]
+        variance = np.bincount(codes, deviation * deviation, minlength=groups) / (count - 1)
+        half_width = Z * np.sqrt(variance / count)
+
+        # 中位数：按 (分组, 数值) 排序后取每组中间位置
+        ordered = values[np.lexsort((values, codes))]
+        starts = np.concatenate([[0], np.cumsum(count)[:-1]])
+        lower = np.minimum(starts + (count - 1) // 2, max(len(ordered) - 1, 0))
+        upper = np.minimum(starts + count // 2, max(len(ordered) - 1, 0))
+        median = (ordered[lower] + ordered[upper]) / 2 if len(ordered) else np.full(groups, np.nan)
+        median = np.where(count > 0, median, np.nan)
+
+        # 胜率使用 Wilson 区间，样本少时比正态近似更可靠
+        rate = hits / count
+        z2 = Z * Z
+        center = (rate + z2 / (2 * count)) / (1 + z2 / count)
+        spread = Z * np.sqrt(rate * (1 - rate) / count + z2 / (4 * count * count)) / (1 + z2 / count)
+
+    return {
+        'count': count,
+        'hit_rate': rate,
+        'hit_rate_low': center - spread,
+        'hit_rate_high': center + spread,
+        'mean': mean,
+        'mean_low': mean - half_width,
+        'mean_high': mean + half_width,
+        'median': median
+    }
+
+
+def _number(value):
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def _horizon_view(stats, i):
+    return {
+        'count': int(stats['count'][i]),
+        'hit_rate': _number(stats['hit_rate'][i]),
+        'hit_rate_ci': [_number(stats['hit_rate_low'][i]), _number(stats['hit_rate_high'][i])],
+        'mean': _number(stats['mean'][i]),
+        'mean_ci': [_number(stats['mean_low'][i]), _number(stats['mean_high'][i])],
+        'median': _number(stats['median'][i])
+    }
+
+
+def signal_statistics(reports, horizons=HORIZONS):
+    """按信号标签统计之后 1/5/20 个交易日的胜率（收益>0的比例）、平均/中位收益（%）及95%置信区间
+
+    reports 为 {股票: 区间回测结果}；baseline 为全部交易日（不区分信号）的同口径统计，用于对比。
+    """
+    horizons = tuple(horizons)
+    keys, codes, rows, returns = _expand(reports, horizons)
+    occurrences = np.bincount(codes, minlength=len(keys))
+
+    signal_stats = [_group_stats(codes, len(keys), returns[rows, j]) for j in range(len(horizons))]
+    baseline_codes = np.zeros(len(returns), dtype=np.intp)
+    baseline_stats = [_group_stats(baseline_codes, 1, returns[:, j]) for j in range(len(horizons))]
+
+    signals = []
+    for i, (category, label) in enumerate(keys):
+        signals.append({
+            'category': category,
+            'label': label,
+            'occurrences': int(occurrences[i]),
+            'horizons': {str(h): _horizon_view(signal_stats[j], i) for j, h in enumerate(horizons)}
+        })
+    signals.sort(key=lambda item: (CATEGORIES.index(item['category']), -item['occurrences']))
+
+    return {
+        'symbols': [symbol for symbol, report in reports.items() if report and 'error' not in report],
+        'days': len(returns),
+        'horizons': list(horizons),
+        'baseline': {str(h): _horizon_view(baseline_stats[j], 0) for j, h in enumerate(horizons)},
+        'signals': signals
+    }
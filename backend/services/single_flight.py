@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import threading
+from functools import partial
+
+from services.async_data import run_blocking
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self, task=None):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        # 由 do_async 发起时为执行中的任务，完成时同样设置 event，同步调用方也可等待
+        self.task = task
+
+
+def _in_event_loop():
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+class SingleFlight:
+    """合并并发的相同请求：同一 key 同一时刻只执行一次，其余调用方等待并共享结果
+
+    同步和异步调用共用同一个 key 表：线程中的 do() 与事件循环中的 do_async() 也会合并。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, func, *args, **kwargs):
+        """同步调用：已有相同 key 的调用在执行时，等待其结果而不是再执行一次"""
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if call.task is not None and _in_event_loop():
+                # 在事件循环线程中同步等待异步任务会死锁
+                raise RuntimeError(f"{self.name}: 不能在事件循环中同步等待进行中的异步调用，请使用 do_async")
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def do_async(self, key, func, *args, **kwargs):
+        """异步调用：func 为协程函数，相同 key 的并发调用共享同一个任务
+
+        相同 key 的同步调用正在执行时，在线程池中等待其结果，不占用事件循环。
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call(asyncio.ensure_future(func(*args, **kwargs)))
+                call.task.add_done_callback(partial(self._task_done, key, call))
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if call.task is not None:
+            # shield：单个调用方取消时不影响其他等待者
+            return await asyncio.shield(call.task)
+        await run_blocking(call.event.wait)
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _task_done(self, key, call, task):
+        if task.cancelled():
+            call.error = asyncio.CancelledError()
+        elif task.exception() is not None:
+            call.error = task.exception()
+        else:
+            call.result = task.result()
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.event.set()
+
+    def stats(self):
+        """合并情况统计"""
+        with self._lock:
+            return {
+                "name": self.name,
+                "calls": self.calls,
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+                "coalesced_ratio": self.coalesced / self.calls if self.calls else 0.0
+            }
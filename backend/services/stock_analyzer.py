@@ -1,113 +1,269 @@
 import pandas as pd
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 import plotly.graph_objects as go
 from pathlib import Path
 import logging
 import pytz
-import requests
-from time import sleep
+import asyncio
+import os
+import sys
+from services.bar_store import BarStore
+from services.bars import Bars
+from services import indicators
+from services.async_data import run_blocking, run_cpu
+from services.market_data import DATA_DIR, get_provider
+from services.result_cache import ResultCache, code_version
+from services.single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+# 按K线根数截取的时间段（与Yahoo range参数语义一致）
+BAR_COUNT_PERIODS = {'1d': 1, '5d': 5}
+
+# 按日历区间截取的时间段
+PERIOD_OFFSETS = {
+    '1mo': pd.DateOffset(months=1), '3mo': pd.DateOffset(months=3),
+    '6mo': pd.DateOffset(months=6), '1y': pd.DateOffset(years=1),
+    '2y': pd.DateOffset(years=2), '5y': pd.DateOffset(years=5)
+}
+
+class StaleHistoryError(Exception):
+    """本地存储的历史K线与上游不一致，需要重新拉取"""
+
+
 class StockAnalyzer:
     def __init__(self):
         # 创建图表保存目录
         self.charts_dir = Path(__file__).parent.parent / 'static' / 'charts'
         self.charts_dir.mkdir(parents=True, exist_ok=True)
         
-        # 设置请求头
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0",
-            "Accept": "application/json"
-        }
+        # 行情数据源与本地K线存储
+        self.provider = get_provider()
+        self.bar_store = BarStore(self.provider.cache_dir)
+
+        # 合并并发的相同行情请求
+        self.fetch_flight = SingleFlight('stock_data')
+
+        # 回测结果缓存：计算代码（本模块、指标引擎、K线容器）改动后自动失效
+        self.result_cache = ResultCache(
+            DATA_DIR / 'cache' / 'backtest',
+            max_bytes=int(os.getenv('BACKTEST_CACHE_MAX_MB', 256)) * 1024 * 1024,
+            version=code_version(sys.modules[__name__], indicators, sys.modules[Bars.__module__])
+        )
 
     def get_stock_data(self, ticker, period='1y', start=None, end=None):
-        """使用Yahoo Finance API获取股票数据（支持时间范围或时间段）"""
-        try:
-            sleep(1)
-            # 优先使用明确的时间范围参数
-            use_date_range = start is not None or end is not None
-            
-            # 构建基础URL
-            url = f"https://query1.finance.yahoo.com/v8/finance/chart/{ticker}"
-            params = {
-                "interval": "1d",
-                "includePrePost": True,
-                "events": "div,splits,capitalGains"
-            }
+        """通过行情数据源获取股票数据（支持时间范围或时间段）
 
-            if use_date_range:
-                # 处理日期范围模式
-                start_date = pd.to_datetime(start)
-                end_date = pd.to_datetime(end)
-                
-                # 转换为Unix时间戳（秒）
-                params.update({
-                    "period1": int(start_date.timestamp()),
-                    "period2": int(end_date.timestamp())
-                })
-            else:
-                # 处理时间段模式
-                period_map = {
-                    '1d': '1d', '5d': '5d', '1mo': '1mo', '3mo': '3mo',
-                    '6mo': '6mo', '1y': '1y', '2y': '2y', '5y': '5y', 'max': 'max'
-                }
-                params["range"] = period_map.get(period, '1y')
+        优先读取本地K线存储，只向上游请求存储中缺失的区间并追加保存；
+        并发的相同请求合并为一次拉取，调用方共享结果。
+        """
+        return _frame(self.get_bars(ticker, period, start, end))
 
-            # 发送请求
-            response = requests.get(url, headers=self.headers, params=params)
-            
-            if response.status_code != 200:
-                logger.error(f"获取{ticker}数据失败，状态码: {response.status_code}")
-                return None
+    def get_bars(self, ticker, period='1y', start=None, end=None):
+        """与 get_stock_data 相同，但返回列式 Bars，不构建DataFrame"""
+        key = self._flight_key(ticker, period, start, end)
+        return self.fetch_flight.do(key, self._load_stock_data, ticker, period, start, end)
 
-            data = response.json()
-            
-            try:
-                chart_data = data['chart']['result'][0]
-                timestamps = chart_data['timestamp']
-                quote = chart_data['indicators']['quote'][0]
-                
-                # 创建DataFrame
-                df = pd.DataFrame({
-                    'Open': quote.get('open', []),
-                    'High': quote.get('high', []),
-                    'Low': quote.get('low', []),
-                    'Close': quote.get('close', []),
-                    'Volume': quote.get('volume', [])
-                }, index=pd.to_datetime(timestamps, unit='s'))
-                
-                # 处理调整后的收盘价
-                if 'adjclose' in chart_data['indicators']:
-                    df['Adj Close'] = chart_data['indicators']['adjclose'][0]['adjclose']
-                
-                # 清理数据：移除NaN和重复索引
-                df = df.dropna().loc[~df.index.duplicated(keep='first')]
-                
-                # 确保时间范围有效性（当使用start/end时）
-                if use_date_range:
-                    df = df.loc[start_date:end_date]
-                
-                return df
-
-            except (KeyError, IndexError) as e:
-                logger.error(f"解析{ticker}数据失败: {str(e)}")
-                return None
-                
+    async def get_stock_data_async(self, ticker, period='1y', start=None, end=None):
+        """get_stock_data 的异步版本：通过共享连接池并发拉取缺口，构建DataFrame放到线程池"""
+        bars = await self.get_bars_async(ticker, period, start, end)
+        return await run_cpu(_frame, bars) if bars is not None else None
+
+    async def get_bars_async(self, ticker, period='1y', start=None, end=None):
+        """get_bars 的异步版本"""
+        key = self._flight_key(ticker, period, start, end)
+        return await self.fetch_flight.do_async(key, self._load_stock_data_async, ticker, period, start, end)
+
+    @staticmethod
+    def _flight_key(ticker, period, start, end):
+        """请求合并的键：(股票, 周期, 范围)"""
+        if start is not None or end is not None:
+            return (ticker.upper(), '1d', str(start), str(end))
+        return (ticker.upper(), '1d', period)
+
+    def _load_stock_data(self, ticker, period, start, end):
+        try:
+            for attempt in range(2):
+                fetches, selection = self._plan_locked(ticker, period, start, end)
+                results = [self.provider.fetch_bars(ticker, params) for params, _ in fetches]
+                try:
+                    return self._store_fetched(ticker, fetches, results, selection)
+                except StaleHistoryError as e:
+                    # 本地存储已清空，重新规划时整段拉取
+                    if attempt:
+                        raise
+                    logger.warning(f"{ticker} {str(e)}，重新拉取")
+        except Exception as e:
+            logger.error(f"获取{ticker}股票数据异常: {str(e)}")
+            return None
+
+    async def _load_stock_data_async(self, ticker, period, start, end):
+        try:
+            # 读写本地存储放到线程池，事件循环线程只等待网络请求
+            for attempt in range(2):
+                fetches, selection = await run_blocking(self._plan_locked, ticker, period, start, end)
+                results = await asyncio.gather(*(
+                    self.provider.fetch_bars_async(ticker, params) for params, _ in fetches
+                ))
+                try:
+                    return await run_blocking(self._store_fetched, ticker, fetches, results, selection)
+                except StaleHistoryError as e:
+                    if attempt:
+                        raise
+                    logger.warning(f"{ticker} {str(e)}，重新拉取")
         except Exception as e:
             logger.error(f"获取{ticker}股票数据异常: {str(e)}")
             return None
+
+    def _plan_locked(self, ticker, period, start, end):
+        """在存储锁内规划拉取；网络请求不持有锁，以免其他线程（或事件循环）等待一次完整的往返
+
+        并发加载可能基于相同的覆盖范围重复拉取同一区间，写入时按时间戳合并，结果不受影响。
+        """
+        with self.bar_store.lock(ticker, '1d'):
+            return self._plan_fetches(ticker, period, start, end)
+
+    def _store_fetched(self, ticker, fetches, results, selection):
+        """在存储锁内写入拉取结果并截取K线
+
+        拉取结果与本地已收盘K线重叠的部分不一致时（拆股、分红后上游重新复权了历史价格），
+        清空该股票的本地存储并抛出 StaleHistoryError，由调用方整段重新拉取。
+        """
+        with self.bar_store.lock(ticker, '1d'):
+            for records in results:
+                if records is not None and not self._matches_stored(ticker, records):
+                    self.bar_store.clear(ticker, '1d')
+                    raise StaleHistoryError("历史K线复权价格已变化（拆股或分红）")
+            for (params, coverage), records in zip(fetches, results):
+                self._apply_fetch(ticker, records, coverage)
+            return self._select_bars(ticker, selection)
+
+    def _matches_stored(self, ticker, bars):
+        """拉取的K线与本地已存K线在相同时间戳上的收盘价和复权收盘价是否一致
+
+        最后一根已存K线可能尚未收盘，不参与比较。
+        """
+        stored = self.bar_store.read(ticker, '1d')
+        if len(stored) < 2 or len(bars) == 0:
+            return True
+        closed = stored[:-1]
+        common, stored_index, fetched_index = np.intersect1d(
+            closed['timestamp'], bars.timestamp, assume_unique=True, return_indices=True
+        )
+        if len(common) == 0:
+            return True
+        fetched_adjclose = bars.adjclose if bars.adjclose is not None else np.full(len(bars), np.nan)
+        return bool(
+            np.allclose(closed['close'][stored_index], bars.close[fetched_index], rtol=1e-6, equal_nan=True)
+            and np.allclose(closed['adjclose'][stored_index], fetched_adjclose[fetched_index],
+                            rtol=1e-6, equal_nan=True)
+        )
+
+    def _plan_fetches(self, ticker, period, start, end):
+        """根据本地存储的覆盖范围规划需要拉取的请求
+
+        返回 (fetches, selection)：fetches 为 [(请求参数, 覆盖范围更新)]，
+        selection 描述拉取完成后如何从存储中截取结果。
+        """
+        now = self.provider.clock()
+        meta = self.bar_store.meta(ticker, '1d')
+        stored = self.bar_store.read(ticker, '1d')
+
+        # 优先使用明确的时间范围参数
+        if start is not None or end is not None:
+            # 处理日期范围模式
+            start_date = pd.to_datetime(start)
+            end_date = pd.to_datetime(end) if end is not None else pd.Timestamp(now, unit='s')
+            req_start = int(start_date.timestamp())
+            req_end = int(end_date.timestamp())
+            return self._plan_range(meta, stored, req_start, req_end, now), ('range', req_start, req_end)
+
+        # 处理时间段模式
+        if period == 'max':
+            if meta.get('covered_from') != 0:
+                return [({"range": "max"}, (0, now))], ('all',)
+            return self._plan_range(meta, stored, 0, now, now), ('all',)
+        if period in BAR_COUNT_PERIODS:
+            count = BAR_COUNT_PERIODS[period]
+            # 存量不足时按日历天数向前多取一段，覆盖周末和节假日
+            req_start = now - (count * 2 + 10) * 86400 if len(stored) < count else meta.get('covered_from', now)
+            return self._plan_range(meta, stored, req_start, now, now), ('tail', count)
+
+        offset = PERIOD_OFFSETS.get(period, PERIOD_OFFSETS['1y'])
+        req_start = int((pd.Timestamp(now, unit='s') - offset).timestamp())
+        return self._plan_range(meta, stored, req_start, now, now), ('range', req_start, now)
+
+    @staticmethod
+    def _plan_range(meta, stored, req_start, req_end, now):
+        """只拉取 [req_start, req_end] 中本地尚未覆盖的部分（头部缺口和尾部新K线）"""
+        covered_from = meta.get('covered_from')
+        fetched_through = meta.get('fetched_through')
+
+        if len(stored) == 0 or covered_from is None or fetched_through is None:
+            return [({"period1": req_start, "period2": req_end}, (req_start, min(req_end, now)))]
+
+        fetches = []
+        if req_start < covered_from:
+            # 向前补齐历史缺口
+            fetches.append(({"period1": req_start, "period2": covered_from}, (req_start, None)))
+        if req_end > fetched_through:
+            # 从倒数第二根已存K线开始拉取：刷新未收盘的最新K线，
+            # 并用一根已收盘的K线校验历史价格是否被重新复权（见 _matches_stored）
+            anchor_ts = int(stored['timestamp'][-2 if len(stored) >= 2 else -1])
+            fetches.append(({"period1": min(anchor_ts, fetched_through), "period2": req_end},
+                            (None, min(req_end, now))))
+        return fetches
+
+    def _apply_fetch(self, ticker, bars, coverage):
+        """将拉取结果写入本地存储并更新覆盖范围"""
+        if bars is None:
+            raise ValueError("获取数据失败")
+        covered_from, fetched_through = coverage
+        self.bar_store.write(ticker, '1d', bars.to_records(), covered_from=covered_from,
+                             fetched_through=fetched_through)
+
+    def _select_bars(self, ticker, selection):
+        """按规划结果从本地存储截取K线
+
+        在内存映射上二分截取，只复制选中的部分：返回的数组会被缓存并在并发分析间共享，
+        不能引用存储文件（文件被替换或在 Windows 上被占用时都会出问题）。
+        """
+        bars = Bars.from_records(self.bar_store.read(ticker, '1d'))
+        if selection[0] == 'range':
+            bars = bars.between(selection[1], selection[2])
+        elif selection[0] == 'tail':
+            bars = bars.tail(selection[1])
+
+        if len(bars) == 0:
+            logger.error(f"获取{ticker}数据失败：无可用K线")
+            return None
+        return Bars.from_records(bars.to_records())
         
         
     def generate_daily_report(self, ticker):
         """生成每日分析报告"""
+        # 获取数据
+        hist = self.get_stock_data(ticker, '5d')
+        if hist is None:
+            return {"error": "无法获取股票数据"}
+        return self._daily_report(ticker, hist)
+
+    async def generate_daily_report_async(self, ticker):
+        """生成每日分析报告（异步拉取数据，指标计算在线程池中执行）"""
+        hist = await self.get_stock_data_async(ticker, '5d')
+        if hist is None:
+            return {"error": "无法获取股票数据"}
+        return await run_cpu(self._daily_report, ticker, hist)
+
+    def _daily_report(self, ticker, hist):
+        """根据K线数据计算每日分析报告"""
+        if len(hist) < 2:
+            logger.error(f"{ticker}数据不足，无法生成每日报告")
+            return {"error": "数据不足：至少需要2根K线"}
         try:
-            # 获取数据
-            hist = self.get_stock_data(ticker, '5d')
-            if hist is None:
-                return {"error": "无法获取股票数据"}
-            
             # 计算关键指标
             latest = hist.iloc[-1]
             prev_close = hist.iloc[-2]['Close']
@@ -134,142 +290,103 @@ class StockAnalyzer:
             logger.error(f"Error generating daily report for {ticker}: {str(e)}")
             return {"error": str(e)}
 
+    def generate_batch_reports(self, tickers):
+        """批量生成每日分析报告"""
+        hists = {ticker: self.get_bars(ticker, '5d') for ticker in tickers}
+        return self._batch_reports(hists)
+
+    async def generate_batch_reports_async(self, tickers):
+        """批量生成每日分析报告：并发拉取所有股票数据，再一次性向量化计算"""
+        hists = await asyncio.gather(*(self.get_bars_async(ticker, '5d') for ticker in tickers))
+        return await run_cpu(self._batch_reports, dict(zip(tickers, hists)))
+
+    def _batch_reports(self, hists):
+        """将K线根数相同的股票（Bars）堆叠为 (股票数, K线数) 矩阵，一次计算全部报告
+
+        结果与逐只调用 generate_daily_report 一致。
+        """
+        reports = {}
+        groups = {}
+        for ticker, hist in hists.items():
+            if hist is None:
+                reports[ticker] = {"error": "无法获取股票数据"}
+            elif len(hist) < 2:
+                # 数据不足时沿用单只股票的路径（返回相同的错误信息）
+                reports[ticker] = self._daily_report(ticker, hist.frame())
+            else:
+                groups.setdefault(len(hist), []).append(ticker)
+
+        today = datetime.today().strftime('%Y-%m-%d')
+        for tickers in groups.values():
+            high, low, close, volume = (
+                np.vstack([getattr(hists[ticker], field) for ticker in tickers])
+                for field in ('high', 'low', 'close', 'volume')
+            )
+            with np.errstate(divide='ignore', invalid='ignore'):
+                columns = {
+                    "price": close[:, -1],
+                    "change": (close[:, -1] - close[:, -2]) / close[:, -2] * 100,
+                    "volume": volume[:, -1] / 1e6,
+                    "atr": (high - low).mean(axis=1),
+                    "volume_alert": _volume_alerts(volume),
+                    "technical_signals": _technical_signals(close),
+                    "volatility_alert": _volatility_alerts(close),
+                    "money_flow": _money_flows(high, low, close, volume)
+                }
+            for i, ticker in enumerate(tickers):
+                report = {"date": today}
+                report.update({key: values[i] for key, values in columns.items()})
+                reports[ticker] = report
+
+        return {ticker: reports[ticker] for ticker in hists}
+
     def detect_abnormal_volume(self, data):
         """成交量异动检测"""
-        avg_volume = data['Volume'].rolling(5).mean().iloc[-1]
-        latest_volume = data['Volume'].iloc[-1]
-        
-        if latest_volume > avg_volume * 2:
-            return "成交量突破：当前成交量是5日均值的2倍以上"
-        elif latest_volume < avg_volume * 0.5:
-            return "交易清淡：当前成交量不足5日均值一半"
-        else:
-            return "成交量处于正常波动区间"
+        return _volume_alerts(_column(data, 'Volume'))[0]
 
     def generate_technical_signals(self, data):
         """生成技术信号"""
-        signals = []
-        
-        # 计算MACD
-        exp1 = data['Close'].ewm(span=12, adjust=False).mean()
-        exp2 = data['Close'].ewm(span=26, adjust=False).mean()
-        macd = exp1 - exp2
-        signal = macd.ewm(span=9, adjust=False).mean()
-        
-        if macd.iloc[-1] > signal.iloc[-1] and macd.iloc[-2] <= signal.iloc[-2]:
-            signals.append("MACD金叉")
-        elif macd.iloc[-1] < signal.iloc[-1] and macd.iloc[-2] >= signal.iloc[-2]:
-            signals.append("MACD死叉")
-            
-        # 计算RSI
-        delta = data['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        rsi = 100 - (100 / (1 + rs))
-        
-        if rsi.iloc[-1] > 70:
-            signals.append(f"RSI超买 ({rsi.iloc[-1]:.1f})")
-        elif rsi.iloc[-1] < 30:
-            signals.append(f"RSI超卖 ({rsi.iloc[-1]:.1f})")
-            
-        return signals
+        return _technical_signals(_column(data, 'Close'))[0]
 
     def volatility_cluster_alert(self, data):
         """波动率聚类分析"""
-        returns = data['Close'].pct_change().dropna()
-        clusters = []
-        threshold = returns.std() * 1.5
-        
-        for r in returns[-5:]:
-            if abs(r) > threshold:
-                clusters.append(1)
-            else:
-                clusters.append(0)
-        
-        if sum(clusters) >= 3:
-            return "波动率聚集预警：近期出现3次以上异常波动"
-        return "波动率正常"
+        return _volatility_alerts(_column(data, 'Close'))[0]
 
     def money_flow_analysis(self, data):
         """
         更敏感的资金流向分析，快速响应市场变化
         """
         try:
-            # 计算价格变化率
-            price_change = data['Close'].pct_change() * 100
-            
-            # 计算成交量变化率
-            volume_change = data['Volume'].pct_change() * 100
-            
-            # 计算典型价格
-            typical_price = (data['High'] + data['Low'] + data['Close']) / 3
-            
-            # 计算 Money Flow
-            raw_money_flow = typical_price * data['Volume']
-            
-            # 使用更短期的资金流指标
-            positive_flow = raw_money_flow.where(typical_price > typical_price.shift(1), 0).rolling(window=10).sum()
-            negative_flow = raw_money_flow.where(typical_price < typical_price.shift(1), 0).rolling(window=10).sum()
-            
-            # 计算 MFI（使用更短的周期）
-            mfi = 100 - (100 / (1 + positive_flow / negative_flow))
-            
-            # 计算 OBV 和短期变化
-            obv = (data['Volume'] * (~data['Close'].diff().le(0) * 2 - 1)).cumsum()
-            obv_change = obv.diff(3) / obv.abs().mean() * 100  # 缩短为3天
-            
-            # 获取最新值
-            current_price_change = price_change.iloc[-1]
-            current_volume_change = volume_change.iloc[-1]
-            current_mfi = mfi.iloc[-1]
-            current_obv_change = obv_change.iloc[-1]
-            
-            # 更敏感的上涨特征判断
-            is_strong_uptrend = (
-                current_price_change > 2 and  # 降低到2%
-                current_volume_change > 30 and  # 降低到30%
-                current_obv_change > 3  # 降低到3%
-            )
-            
-            # 更敏感的下跌特征判断
-            is_strong_downtrend = (
-                current_price_change < -2 and  # 提高到-2%
-                current_volume_change > 30 and  # 降低到30%
-                current_obv_change < -3  # 提高到-3%
-            )
-            
-            # 综合分析（更敏感的判断标准）
-            if is_strong_uptrend:
-                if current_mfi > 70:  # 降低阈值
-                    return "主力资金大量涌入：强势上涨"
-                else:
-                    return "资金加速流入：看涨信号"
-            elif is_strong_downtrend:
-                if current_mfi < 30:  # 提高阈值
-                    return "资金加速流出：看空信号"
-                else:
-                    return "资金持续流出：注意风险"
-            else:
-                if current_mfi > 70 and current_obv_change < -3:
-                    return "资金流出警告：获利回吐"
-                elif current_mfi < 30 and current_obv_change > 3:
-                    return "资金流入信号：低位吸筹"
-                elif current_mfi > 55 and current_obv_change > 2:  # 降低阈值
-                    return "资金持续流入：多头占优"
-                elif current_mfi < 45 and current_obv_change < -2:  # 提高阈值
-                    return "资金逐步流出：空头占优"
-                elif current_price_change > 0.5 and current_volume_change > 10:  # 更敏感的短期判断
-                    return "资金小幅流入：短线看多"
-                elif current_price_change < -0.5 and current_volume_change > 10:
-                    return "资金小幅流出：短线谨慎"
-                else:
-                    return "资金流向观望：等待信号"
-            
+            return _money_flows(_column(data, 'High'), _column(data, 'Low'),
+                                _column(data, 'Close'), _column(data, 'Volume'))[0]
         except Exception as e:
             logger.error(f"Error in money flow analysis: {str(e)}")
             return "资金流向分析异常"
 
+    def _backtest_cache_parts(self, kind, ticker, start_date, end_date):
+        """回测缓存键：结果类型、数据源、股票、日期区间和指标参数（代码版本由缓存自身加入）"""
+        return {
+            'kind': kind,
+            'provider': self.provider.name,
+            'symbol': ticker.upper(),
+            'start_date': pd.to_datetime(start_date).isoformat(),
+            'end_date': pd.to_datetime(end_date).isoformat(),
+            'money_flow_thresholds': MONEY_FLOW_THRESHOLDS
+        }
+
+    def backtest_cache_get(self, kind, ticker, start_date, end_date):
+        """读取回测缓存（kind 为 day 或 range），未命中时返回 None"""
+        return self.result_cache.get(self._backtest_cache_parts(kind, ticker, start_date, end_date))
+
+    def backtest_cache_put(self, kind, ticker, start_date, end_date, result):
+        """缓存回测结果：只缓存成功的结果，且所用数据 [start-7天, end+5天] 已全部收盘（结果不会再变化）"""
+        if not result or "error" in result:
+            return
+        window_end = pd.to_datetime(end_date) + pd.Timedelta(days=6)
+        if int(window_end.timestamp()) > self.provider.clock():
+            return
+        self.result_cache.put(self._backtest_cache_parts(kind, ticker, start_date, end_date), result)
+
     def backtest_analysis(self, ticker: str, start_date: str, end_date: str):
         """获取指定日期的分析报告并验证其准确性"""
         try:
@@ -280,13 +397,143 @@ class StockAnalyzer:
             start_date_pd = pd.to_datetime(start_date)
             end_date_pd = pd.to_datetime(end_date)
 
+            # 历史结果不会变化，命中缓存时不再拉取数据和计算
+            cached = self.backtest_cache_get('day', ticker, start_date, end_date)
+            if cached is not None:
+                return cached
+
             # 获取指定日期范围内的数据
             hist = self.get_stock_data(
                 ticker, 
                 start=start_date_pd - pd.Timedelta(days=7),  # 多取7天用于技术指标计算
                 end=end_date_pd + pd.Timedelta(days=5)      # 确保包含 end_date
             )
-            
+            report = self._backtest_report(ticker, hist, start_date, end_date)
+            self.backtest_cache_put('day', ticker, start_date, end_date, report)
+            return report
+
+        except Exception as e:
+            logger.error(f"Unexpected error in backtest analysis for {ticker}: {str(e)}")
+            return {"error": str(e)}
+
+    async def backtest_analysis_async(self, ticker: str, start_date: str, end_date: str):
+        """backtest_analysis 的异步版本"""
+        try:
+            start_date_pd = pd.to_datetime(start_date)
+            end_date_pd = pd.to_datetime(end_date)
+            cached = await run_blocking(self.backtest_cache_get, 'day', ticker, start_date, end_date)
+            if cached is not None:
+                return cached
+            hist = await self.get_stock_data_async(
+                ticker,
+                start=start_date_pd - pd.Timedelta(days=7),
+                end=end_date_pd + pd.Timedelta(days=5)
+            )
+            report = await run_cpu(self._backtest_report, ticker, hist, start_date, end_date)
+            await run_blocking(self.backtest_cache_put, 'day', ticker, start_date, end_date, report)
+            return report
+        except Exception as e:
+            logger.error(f"Unexpected error in backtest analysis for {ticker}: {str(e)}")
+            return {"error": str(e)}
+
+    def backtest_range(self, ticker: str, start_date: str, end_date: str):
+        """区间回测：一次拉取数据，对区间内每个交易日生成回测报告
+
+        第 D 天的报告与 backtest_analysis(ticker, start_date, D) 的结果相同（只使用 D 及之前的K线），
+        但所有交易日的指标在一次向量化计算中得到。
+        """
+        try:
+            start_date_pd = pd.to_datetime(start_date)
+            end_date_pd = pd.to_datetime(end_date)
+            cached = self.backtest_cache_get('range', ticker, start_date, end_date)
+            if cached is not None:
+                return cached
+            bars = self.get_bars(
+                ticker,
+                start=start_date_pd - pd.Timedelta(days=7),
+                end=end_date_pd + pd.Timedelta(days=5)
+            )
+            report = self._backtest_range_report(ticker, bars, start_date, end_date)
+            self.backtest_cache_put('range', ticker, start_date, end_date, report)
+            return report
+        except Exception as e:
+            logger.error(f"Unexpected error in range backtest for {ticker}: {str(e)}")
+            return {"error": str(e)}
+
+    async def backtest_range_async(self, ticker: str, start_date: str, end_date: str):
+        """backtest_range 的异步版本"""
+        try:
+            start_date_pd = pd.to_datetime(start_date)
+            end_date_pd = pd.to_datetime(end_date)
+            cached = await run_blocking(self.backtest_cache_get, 'range', ticker, start_date, end_date)
+            if cached is not None:
+                return cached
+            bars = await self.get_bars_async(
+                ticker,
+                start=start_date_pd - pd.Timedelta(days=7),
+                end=end_date_pd + pd.Timedelta(days=5)
+            )
+            report = await run_cpu(self._backtest_range_report, ticker, bars, start_date, end_date)
+            await run_blocking(self.backtest_cache_put, 'range', ticker, start_date, end_date, report)
+            return report
+        except Exception as e:
+            logger.error(f"Unexpected error in range backtest for {ticker}: {str(e)}")
+            return {"error": str(e)}
+
+    @staticmethod
+    def _backtest_range_report(ticker, bars, start_date, end_date):
+        """根据K线数据生成区间内每个交易日的回测报告
+
+        单日回测报错的交易日（前面不足2根K线、5天内没有下一个交易日）不出现在结果中。
+        """
+        if bars is None or len(bars) == 0:
+            logger.error(f"No data available for {ticker}")
+            return {"error": "无法获取历史数据"}
+
+        days, targets = range_targets(bars, start_date, end_date)
+        if targets is None:
+            logger.error(f"数据范围不足: {days[0]} 至 {days[-1]}")
+            return {"error": "数据未覆盖指定日期范围"}
+
+        open_, high, low, close, volume = bars.open, bars.high, bars.low, bars.close, bars.volume
+        signals = _technical_signal_series(close, targets)
+        volatility = _volatility_alert_series(close, targets)
+        money_flow = _money_flow_series(high, low, close, volume, targets)
+        volume_alert = _volume_alert_series(volume, targets)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change = (close - open_) / open_ * 100
+
+        reports = []
+        for i, t in enumerate(targets):
+            reports.append({
+                "date": str(days[t]),
+                "price": close[t],
+                "change": change[t],
+                "volume": volume[t] / 1e6,  # 转换为百万单位
+                "technical_signals": signals[i],
+                "volatility_alert": volatility[i],
+                "money_flow": money_flow[i],
+                "volume_alert": volume_alert[i],
+                "next_day": {
+                    "date": str(days[t + 1]),
+                    "price": close[t + 1],
+                    "change": change[t + 1]
+                }
+            })
+
+        return {
+            "symbol": ticker,
+            "start_date": start_date,
+            "end_date": end_date,
+            "days": reports
+        }
+
+    def _backtest_report(self, ticker, hist, start_date, end_date):
+        """根据K线数据生成指定日期的回测报告"""
+        try:
+            start_date_pd = pd.to_datetime(start_date)
+            end_date_pd = pd.to_datetime(end_date)
+
             if hist is None or hist.empty:
                 logger.error(f"No data available for {ticker}")
                 return {"error": "无法获取历史数据"}
@@ -308,6 +555,11 @@ class StockAnalyzer:
                 return {"error": f"{end_date} 无交易数据"}
 
             target_idx = hist.index.get_loc(matching_dates[0])
+
+            # 技术信号需要目标日期及之前至少2根K线
+            if target_idx < 1:
+                logger.error(f"{ticker} 在 {end_date} 之前没有足够的历史数据")
+                return {"error": f"{end_date} 之前的历史数据不足"}
             
             # 检查是否有下一个交易日数据
             if target_idx >= len(hist) - 1:
@@ -355,4 +607,259 @@ class StockAnalyzer:
 
         except Exception as e:
             logger.error(f"Unexpected error in backtest analysis for {ticker}: {str(e)}")
-            return {"error": str(e)}
\ No newline at end of file
+            return {"error": str(e)}
+
+
+def _frame(bars):
+    """Bars 转换为DataFrame；返回浅拷贝，共享同一结果的调用方修改索引或增删列时互不影响"""
+    return bars.frame().copy(deep=False) if bars is not None else None
+
+
+def _column(data, name):
+    """取DataFrame列为 (1, K线数) 的数组，与批量计算共用同一套函数"""
+    return data[name].to_numpy(dtype=float)[None, :]
+
+
+def _volume_alerts(volume):
+    """成交量异动检测（每行一只股票）"""
+    return _classify_volume(volume[:, -1], indicators.rolling_mean(volume, 5)[:, -1]).tolist()
+
+
+def _classify_volume(latest_volume, avg_volume):
+    return np.select(
+        [latest_volume > avg_volume * 2, latest_volume < avg_volume * 0.5],
+        ["成交量突破：当前成交量是5日均值的2倍以上", "交易清淡：当前成交量不足5日均值一半"],
+        "成交量处于正常波动区间"
+    )
+
+
+def _technical_signals(close):
+    """MACD金叉/死叉与RSI超买/超卖信号（每行一只股票）"""
+    if close.shape[1] < 2:
+        raise ValueError("数据不足：技术信号至少需要2根K线")
+    macd, signal = indicators.macd(close)
+    golden = (macd[:, -1] > signal[:, -1]) & (macd[:, -2] <= signal[:, -2])
+    dead = (macd[:, -1] < signal[:, -1]) & (macd[:, -2] >= signal[:, -2])
+    rsi = indicators.rsi(close, 14)[:, -1]
+
+    signals = []
+    for i in range(len(close)):
+        row = []
+        if golden[i]:
+            row.append("MACD金叉")
+        elif dead[i]:
+            row.append("MACD死叉")
+        if rsi[i] > 70:
+            row.append(f"RSI超买 ({rsi[i]:.1f})")
+        elif rsi[i] < 30:
+            row.append(f"RSI超卖 ({rsi[i]:.1f})")
+        signals.append(row)
+    return signals
+
+
+def _volatility_alerts(close):
+    """波动率聚类：近5日收益率超过1.5倍标准差的次数（每行一只股票）"""
+    returns = indicators.pct_change(close)[:, 1:]
+    if returns.shape[1] > 1:
+        threshold = returns.std(axis=1, ddof=1) * 1.5
+    else:
+        threshold = np.full(len(close), np.nan)
+    clusters = (np.abs(returns[:, -5:]) > threshold[:, None]).sum(axis=1)
+    return np.where(clusters >= 3, "波动率聚集预警：近期出现3次以上异常波动", "波动率正常").tolist()
+
+
+def _money_flows(high, low, close, volume):
+    """资金流向分析（每行一只股票）"""
+    price_change = indicators.pct_change(close)[:, -1] * 100
+    volume_change = indicators.pct_change(volume)[:, -1] * 100
+
+    # 使用更短期的资金流指标
+    mfi = indicators.mfi(high, low, close, volume, window=10)[:, -1]
+
+    # 计算 OBV 的3日变化（相对OBV绝对值均值）
+    obv = indicators.obv(close, volume)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        obv_change = indicators.diff(obv, 3)[:, -1] / np.abs(obv).mean(axis=1) * 100
+
+    return _classify_money_flow(price_change, volume_change, mfi, obv_change).tolist()
+
+
+# 资金流向分类的阈值（涨跌幅、量比变化、OBV变化为百分比）
+MONEY_FLOW_THRESHOLDS = {
+    'price_strong': 2.0,    # 强势涨跌幅
+    'volume_strong': 30.0,  # 强势放量
+    'obv_strong': 3.0,      # OBV 显著变化
+    'obv_weak': 2.0,        # OBV 温和变化
+    'mfi_high': 70.0,       # MFI 超买
+    'mfi_low': 30.0,        # MFI 超卖
+    'mfi_bull': 55.0,       # MFI 偏多
+    'mfi_bear': 45.0,       # MFI 偏空
+    'price_weak': 0.5,      # 小幅涨跌幅
+    'volume_weak': 10.0     # 小幅放量
+}
+
+MONEY_FLOW_LABELS = (
+    "主力资金大量涌入：强势上涨",
+    "资金加速流入：看涨信号",
+    "资金加速流出：看空信号",
+    "资金持续流出：注意风险",
+    "资金流出警告：获利回吐",
+    "资金流入信号：低位吸筹",
+    "资金持续流入：多头占优",
+    "资金逐步流出：空头占优",
+    "资金小幅流入：短线看多",
+    "资金小幅流出：短线谨慎",
+    "资金流向观望：等待信号"
+)
+
+# 各分类对应的看多(1)/看空(-1)/观望(0)方向
+MONEY_FLOW_DIRECTIONS = np.array([1, 1, -1, -1, -1, 1, 1, -1, 1, -1, 0])
+
+
+def money_flow_codes(price_change, volume_change, mfi, obv_change, thresholds=MONEY_FLOW_THRESHOLDS):
+    """按 money_flow_analysis 的判断顺序返回 MONEY_FLOW_LABELS 中的编号
+
+    阈值可以是数组（如 (参数组数, 1)），与指标数组广播后一次得到所有参数组合的分类。
+    """
+    t = thresholds
+    is_strong_uptrend = (price_change > t['price_strong']) & (volume_change > t['volume_strong']) \
+        & (obv_change > t['obv_strong'])
+    is_strong_downtrend = (price_change < -t['price_strong']) & (volume_change > t['volume_strong']) \
+        & (obv_change < -t['obv_strong'])
+    return np.select(
+        [
+            is_strong_uptrend & (mfi > t['mfi_high']),
+            is_strong_uptrend,
+            is_strong_downtrend & (mfi < t['mfi_low']),
+            is_strong_downtrend,
+            (mfi > t['mfi_high']) & (obv_change < -t['obv_strong']),
+            (mfi < t['mfi_low']) & (obv_change > t['obv_strong']),
+            (mfi > t['mfi_bull']) & (obv_change > t['obv_weak']),
+            (mfi < t['mfi_bear']) & (obv_change < -t['obv_weak']),
+            (price_change > t['price_weak']) & (volume_change > t['volume_weak']),
+            (price_change < -t['price_weak']) & (volume_change > t['volume_weak'])
+        ],
+        np.arange(len(MONEY_FLOW_LABELS) - 1),
+        len(MONEY_FLOW_LABELS) - 1
+    )
+
+
+def _classify_money_flow(price_change, volume_change, mfi, obv_change):
+    """按 money_flow_analysis 的判断顺序对数组批量分类"""
+    return np.array(MONEY_FLOW_LABELS)[money_flow_codes(price_change, volume_change, mfi, obv_change)]
+
+
+# ---- 区间回测：对每个交易日 t 计算只使用前 t+1 根K线时的结果 ----
+
+# 扩展窗口统计量用累计和计算，与单日回测的逐段求和仅有舍入误差；
+# 与判断阈值的差距小于该相对误差时，回退到单日算法重新计算，保证结果完全一致
+_BORDERLINE_TOLERANCE = 1e-9
+
+
+def _near(values, thresholds):
+    values = np.asarray(values, dtype=float)
+    thresholds = np.asarray(thresholds, dtype=float)
+    with np.errstate(invalid='ignore'):
+        return np.abs(values - thresholds) <= _BORDERLINE_TOLERANCE * np.maximum(np.abs(thresholds), 1.0)
+
+
+def range_targets(bars, start_date, end_date):
+    """区间回测中可以生成报告的交易日下标
+
+    返回 (每根K线的日期, 下标数组)；数据未覆盖开始日期时下标为 None。
+    """
+    start_day = pd.to_datetime(start_date).date()
+    end_day = pd.to_datetime(end_date).date()
+    days = bars.timestamp.astype('datetime64[s]').astype('datetime64[D]')
+    if days[0].item() > start_day:
+        return days, None
+
+    # 单日回测截取 [start-7天, D+5天] 的数据，下一个交易日必须落在这个范围内
+    next_limit = (days + np.timedelta64(5, 'D')).astype('datetime64[s]').astype(np.int64)
+    index = np.arange(len(bars))
+    in_range = (days >= np.datetime64(start_day)) & (days <= np.datetime64(end_day))
+    has_next = np.zeros(len(bars), dtype=bool)
+    has_next[:-1] = bars.timestamp[1:] <= next_limit[:-1]
+    return days, index[in_range & has_next & (index >= 1)]
+
+
+def _technical_signal_series(close, targets):
+    """每个目标交易日的 MACD/RSI 信号（EMA与滑动窗口只依赖之前的K线，全序列计算一次即可）"""
+    macd, signal = indicators.macd(close)
+    above = macd > signal
+    golden = np.zeros(len(close), dtype=bool)
+    dead = np.zeros(len(close), dtype=bool)
+    golden[1:] = above[1:] & (macd[:-1] <= signal[:-1])
+    dead[1:] = (macd[1:] < signal[1:]) & (macd[:-1] >= signal[:-1])
+    rsi = indicators.rsi(close, 14)
+
+    signals = []
+    for t in targets:
+        row = []
+        if golden[t]:
+            row.append("MACD金叉")
+        elif dead[t]:
+            row.append("MACD死叉")
+        if rsi[t] > 70:
+            row.append(f"RSI超买 ({rsi[t]:.1f})")
+        elif rsi[t] < 30:
+            row.append(f"RSI超卖 ({rsi[t]:.1f})")
+        signals.append(row)
+    return signals
+
+
+def _volatility_alert_series(close, targets):
+    """每个目标交易日的波动率聚类预警：阈值为截至当日全部收益率标准差的1.5倍（扩展窗口）"""
+    returns = indicators.pct_change(close)
+    returns[0] = np.nan
+    count = np.arange(len(close))  # 第 t 天可用的收益率个数
+
+    # 以第一个收益率为基准平移后累计，减小方差公式的抵消误差
+    base = returns[1] if len(close) > 1 else 0.0
+    shifted = np.nan_to_num(returns - base)
+    s1, s2 = np.cumsum(shifted), np.cumsum(shifted * shifted)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = (s2 - s1 * s1 / count) / (count - 1)
+    threshold = np.where(count > 1, np.sqrt(np.maximum(variance, 0.0)), np.nan) * 1.5
+
+    # 最近5个收益率（第0天没有收益率，用NaN填充，比较结果为False）
+    recent = sliding_window_view(np.concatenate([np.full(4, np.nan), np.abs(returns)]), 5)
+    recent, limit = recent[targets], threshold[targets]
+    with np.errstate(invalid='ignore'):
+        clusters = (recent > limit[:, None]).sum(axis=1)
+    alerts = np.where(clusters >= 3, "波动率聚集预警：近期出现3次以上异常波动", "波动率正常").tolist()
+
+    for i in np.flatnonzero(_near(recent, limit[:, None]).any(axis=1)):
+        alerts[i] = _volatility_alerts(close[None, :targets[i] + 1])[0]
+    return alerts
+
+
+def money_flow_features(high, low, close, volume):
+    """资金流向分类使用的指标序列：涨跌幅、量比变化、MFI(10)、OBV 3日变化（相对截至当日 |OBV| 均值）"""
+    price_change = indicators.pct_change(close) * 100
+    volume_change = indicators.pct_change(volume) * 100
+    mfi = indicators.mfi(high, low, close, volume, window=10)
+    obv = indicators.obv(close, volume)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_abs = np.cumsum(np.abs(obv)) / np.arange(1, len(obv) + 1)
+        obv_change = indicators.diff(obv, 3) / mean_abs * 100
+    return price_change, volume_change, mfi, obv_change
+
+
+def _money_flow_series(high, low, close, volume, targets):
+    """每个目标交易日的资金流向：OBV变化相对截至当日 |OBV| 均值（扩展窗口）"""
+    price_change, volume_change, mfi, obv_change = money_flow_features(high, low, close, volume)
+    obv_change = obv_change[targets]
+    flows = _classify_money_flow(price_change[targets], volume_change[targets], mfi[targets], obv_change).tolist()
+
+    obv_thresholds = np.array([MONEY_FLOW_THRESHOLDS['obv_strong'], MONEY_FLOW_THRESHOLDS['obv_weak']])
+    borderline = _near(np.abs(obv_change)[:, None], obv_thresholds).any(axis=1)
+    for i in np.flatnonzero(borderline):
+        t = targets[i] + 1
+        flows[i] = _money_flows(high[None, :t], low[None, :t], close[None, :t], volume[None, :t])[0]
+    return flows
+
+
+def _volume_alert_series(volume, targets):
+    """每个目标交易日的成交量异动（5日滑动均值）"""
+    return _classify_volume(volume[targets], indicators.rolling_mean(volume, 5)[targets]).tolist()
@@ -1,98 +1,139 @@
 from typing import List, Dict
-import yfinance as yf
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 import logging
-from cachetools import TTLCache
+import threading
+from services.alert_log import AlertLog
+from services.alert_rules import AlertRuleEngine
+from services.extremes_index import ExtremesIndex
+from services.intraday_cache import IntradayCache, bar_start
+from services.market_data import get_provider
+from services.streaming_indicators import IndicatorSet, IndicatorStateStore
 
 logger = logging.getLogger(__name__)
 
 class StockMonitor:
-    def __init__(self):
-        self.alert_thresholds = {
-            'daily_change': 5.0,  # 5%
-            'rapid_rise': 3.0,    # 3%
-            'volume_surge': 300   # 300%
-        }
-        self.alerts_history = {}  # 用于存储已触发的预警，避免重复通知
-        # 添加缓存，数据在60秒内有效
-        self.data_cache = TTLCache(maxsize=100, ttl=60)
+    def __init__(self, rules: AlertRuleEngine = None):
+        # 预警条件由规则引擎评估，规则可在运行时修改
+        self.rules = rules or AlertRuleEngine()
+        # 预警记录：内存中只保留最近的预警，全部历史写入磁盘，规则冷却时间内重复的预警只记录一次
+        self.alert_log = AlertLog(cooldown=self.rules.cooldown)
+        # 盘中流式指标：每只股票只用新到的K线增量更新，状态持久化到本地
+        self.indicator_interval = '15m'
+        # 日K缓存到下一次收盘，盘中K线按K线周期增量刷新
+        self.data_cache = IntradayCache(self.indicator_interval)
+        self.indicator_sets = {}
+        # 同一股票的流式指标可能被调度器的计算线程和 /api/alerts 请求同时推进，按股票加锁
+        self._indicator_locks = {}
+        self._indicator_locks_guard = threading.Lock()
+        self.indicator_store = IndicatorStateStore(get_provider().cache_dir / 'indicators')
+        # 52周及N日高低点：每根新日K更新一次，预警判断时直接查表
+        self.extremes = ExtremesIndex()
         
     def get_stock_data(self, symbol: str) -> Dict:
-        """获取股票数据，使用缓存"""
-        cache_key = f"{symbol}_{datetime.now().strftime('%Y%m%d_%H%M')}"
-        
-        if cache_key in self.data_cache:
-            return self.data_cache[cache_key]
-            
-        stock = yf.Ticker(symbol)
-        data = {
-            'hist': stock.history(period='1d', interval='15m'),
-            'daily_data': stock.history(period='1y'),
+        """获取股票数据，使用缓存
+
+        extremes 为当前交易日之前的高低点（已收盘日K），当天的高低点由盘中K线给出。
+        """
+        hist = self.data_cache.intraday(symbol)
+        daily = self.data_cache.daily(symbol)
+        if len(hist):
+            daily = daily.between(end=bar_start(hist.timestamp[-1], 86400) - 1)
+        return {
+            'hist': hist.frame(),
+            'extremes': self.extremes.update(symbol, daily),
             'timestamp': datetime.now()
         }
-        self.data_cache[cache_key] = data
-        return data
         
+    def update_indicators(self, symbol: str, hist: pd.DataFrame) -> Dict:
+        """用盘中K线推进该股票的流式指标，返回最新指标值（尚未形成的指标为None）"""
+        timestamps = hist.index.values.astype('datetime64[s]').astype(np.int64)
+        with self._indicator_lock(symbol):
+            indicator_set = self.indicator_sets.get(symbol)
+            if indicator_set is None:
+                indicator_set = self.indicator_store.load(symbol, self.indicator_interval) or IndicatorSet()
+                self.indicator_sets[symbol] = indicator_set
+
+            if indicator_set.seed(timestamps, hist['High'].to_numpy(), hist['Low'].to_numpy(),
+                                  hist['Close'].to_numpy(), hist['Volume'].to_numpy()):
+                self.indicator_store.save(symbol, self.indicator_interval, indicator_set)
+            snapshot = indicator_set.snapshot()
+
+        return {key: (value if value == value else None) for key, value in snapshot.items()}
+
+    def _indicator_lock(self, symbol: str):
+        with self._indicator_locks_guard:
+            if symbol not in self._indicator_locks:
+                self._indicator_locks[symbol] = threading.Lock()
+            return self._indicator_locks[symbol]
+
     def check_alerts(self, symbol: str) -> Dict:
         """检查所有预警条件"""
         try:
-            current_time = datetime.now()
-            
             # 使用缓存获取数据
             data = self.get_stock_data(symbol)
-            hist = data['hist']
-            daily_data = data['daily_data']
-            
-            if hist.empty or daily_data.empty:
+        except Exception as e:
+            logger.error(f"Error checking alerts for {symbol}: {str(e)}")
+            return {
+                'symbol': symbol,
+                'alerts': [],
+                'timestamp': datetime.now().isoformat(),
+                'error': str(e)
+            }
+        return self.evaluate_alerts(symbol, data['hist'], data['extremes'])
+
+    def compute_features(self, symbol: str, hist: pd.DataFrame, extremes: Dict) -> Dict:
+        """由盘中K线（15分钟）和此前日K的高低点计算规则引擎使用的特征，同时推进盘中流式指标"""
+        indicators = self.update_indicators(symbol, hist)
+        close = hist['Close'].to_numpy()
+        session_high, session_low = hist['High'].max(), hist['Low'].min()
+        features = {
+            'price': close[-1],
+            'daily_change': (close[-1] - hist['Open'].iloc[0]) / hist['Open'].iloc[0] * 100,
+            'change_15m': (close[-1] - close[-2]) / close[-2] * 100 if len(close) >= 2 else np.nan,
+            'volume': hist['Volume'].sum(),
+            'session_high': session_high,
+            'session_low': session_low,
+            # 52周高低点包含当天盘中的高低点；没有日K时无法判断
+            'high_52w': max(extremes['high_52w'], session_high) if extremes.get('high_52w') is not None else np.nan,
+            'low_52w': min(extremes['low_52w'], session_low) if extremes.get('low_52w') is not None else np.nan
+        }
+        for name, value in extremes.items():
+            features.setdefault(name, value if value is not None else np.nan)
+        for name in ('volume_ma', 'rsi', 'mfi', 'macd', 'macd_signal'):
+            features[name] = indicators[name] if indicators[name] is not None else np.nan
+        return {'features': features, 'indicators': indicators}
+
+    def record_alerts(self, symbol: str, alerts: List[Dict]):
+        """写入预警记录，返回实际写入（未被冷却期去重）的记录"""
+        if not alerts:
+            return []
+        return self.alert_log.record([dict(alert, symbol=symbol) for alert in alerts])
+
+    def evaluate_alerts(self, symbol: str, hist: pd.DataFrame, extremes: Dict) -> Dict:
+        """根据已获取的盘中K线和此前日K的高低点评估预警规则（不检查冷却），不发起请求"""
+        current_time = datetime.now()
+        try:
+            if hist.empty:
                 return {
                     'symbol': symbol,
                     'alerts': [],
                     'timestamp': current_time.isoformat()
                 }
-            
-            alerts = []
-            
-            # 1. 检查单日涨幅
-            daily_change = ((hist['Close'][-1] - hist['Open'][0]) / hist['Open'][0]) * 100
-            if daily_change > self.alert_thresholds['daily_change']:
-                alerts.append({
-                    'type': 'daily_surge',
-                    'message': f'单日涨幅达到 {daily_change:.2f}%',
-                    'value': daily_change,
-                    'threshold': self.alert_thresholds['daily_change']
-                })
-            
-            # 2. 检查15分钟急涨
-            if len(hist) >= 2:
-                fifteen_min_change = ((hist['Close'][-1] - hist['Close'][-2]) / hist['Close'][-2]) * 100
-                if fifteen_min_change > self.alert_thresholds['rapid_rise']:
-                    alerts.append({
-                        'type': 'rapid_rise',
-                        'message': f'15分钟涨幅达到 {fifteen_min_change:.2f}%',
-                        'value': fifteen_min_change,
-                        'threshold': self.alert_thresholds['rapid_rise']
-                    })
-            
-            # 3. 检查52周新高
-            fifty_two_week_high = daily_data['High'].max()
-            current_price = hist['Close'][-1]
-            if current_price >= fifty_two_week_high:
-                alerts.append({
-                    'type': 'new_high',
-                    'message': f'突破52周新高: {current_price:.2f}',
-                    'value': current_price,
-                    'threshold': fifty_two_week_high
-                })
-            
-            # 更新预警历史
-            alert_key = f"{symbol}_{current_time.strftime('%Y%m%d_%H%M')}"
-            if alerts and alert_key not in self.alerts_history:
-                self.alerts_history[alert_key] = alerts
-            
+
+            computed = self.compute_features(symbol, hist, extremes)
+            active, _ = self.rules.evaluate(
+                [symbol], {name: [value] for name, value in computed['features'].items()}, cooldown=False
+            )
+            alerts = [{key: value for key, value in alert.items() if key != 'symbol'} for alert in active]
+            self.record_alerts(symbol, alerts)
+
             return {
                 'symbol': symbol,
                 'alerts': alerts,
+                'indicators': computed['indicators'],
+                'extremes': extremes,
                 'timestamp': current_time.isoformat()
             }
         except Exception as e:
@@ -102,4 +143,4 @@ class StockMonitor:
                 'alerts': [],
                 'timestamp': current_time.isoformat(),
                 'error': str(e)
-            } 
\ No newline at end of file
+            }
@@ -1,6 +1,6 @@
 import logging
-import yfinance as yf
 import pandas as pd
+from services.market_data import get_provider
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -50,7 +50,7 @@ def get_market_prices():
         for name, ticker in tickers.items():
             try:
                 logger.info(f"Fetching data for {name} ({ticker})")
-                data = yf.Ticker(ticker).history(period='1d')
+                data = get_provider().history(ticker, period='1d')
                 if not data.empty:
                     # Convert to float to ensure JSON serialization works
                     prices[name] = {
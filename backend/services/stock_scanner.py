@@ -1,70 +1,371 @@
 from typing import List, Dict
-import yfinance as yf
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import requests
 from bs4 import BeautifulSoup
+from services.async_data import run_cpu
+from services.fundamentals import fundamentals
+from services.market_data import DATA_DIR, get_provider
+from services import indicators
+from services.screen_query import compile_query
+from services.screening import FeatureTable, ScreenContext, ScreenPipeline, _institutional_ownership
+from services.single_flight import SingleFlight
+from services.stock_analyzer import StockAnalyzer
+
+logger = logging.getLogger(__name__)
+
+# 全市场扫描的股票池
+UNIVERSE_FILE = DATA_DIR / 'us_stocks.json'
+
+# 同时拉取的股票数和单只股票的超时（秒）
+SCAN_CONCURRENCY = int(os.getenv('SCAN_CONCURRENCY', 16))
+SCAN_TIMEOUT = float(os.getenv('SCAN_TIMEOUT', 15))
+
+# 放量阈值：成交量超过30日均量的百分比
+VOLUME_SURGE_THRESHOLD = 300
+
+# 筛选使用最近60根日K（均值、均线、RSI的最长窗口为30）
+SCAN_PERIOD = '3mo'
+SCAN_BARS = 60
+
+# 查询使用的特征表在此时间（秒）内复用，最多缓存的股票池数
+FEATURE_TABLE_TTL = float(os.getenv('FEATURE_TABLE_TTL', 300))
+MAX_FEATURE_TABLES = 8
+
+# 流式扫描的进度事件间隔（秒）
+PROGRESS_INTERVAL = 0.2
+
+# 扫描报告使用的指标
+REPORT_METRICS = (
+    'market_cap', 'institutional_ownership', 'current_volume', 'avg_volume_30d',
+    'price', 'price_change', 'volume_change'
+)
+
+
+def load_universe(path=UNIVERSE_FILE) -> List[str]:
+    """读取股票池中的全部股票代码"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return list(json.load(f))
+    except Exception as e:
+        logger.error(f"Error loading stock universe: {str(e)}")
+        return []
+
 
 class StockScanner:
-    def __init__(self):
+    def __init__(self, analyzer: StockAnalyzer = None, concurrency=SCAN_CONCURRENCY, timeout=SCAN_TIMEOUT):
         self.market_cap_threshold = 5_000_000_000  # 50亿美元
-        self.volume_surge_threshold = 300  # 300%
+        self.volume_surge_threshold = VOLUME_SURGE_THRESHOLD  # 300%
         self.institutional_ownership_threshold = 5.0  # 5%
+        # K线通过分析器的本地K线存储获取，重复扫描只拉取增量
+        self.analyzer = analyzer or StockAnalyzer()
+        self.concurrency = concurrency
+        self.timeout = timeout
+        # 筛选条件按成本排序：热门榜 → 基本面 → 成交量 → 技术指标
+        self.pipeline = ScreenPipeline([
+            ('not_trending', 'symbol', self._screen_not_trending),
+            ('small_cap', 'info', self._screen_small_cap),
+            ('low_institutional', 'info', self._screen_low_institutional),
+            ('volume_surge', 'bars', self._screen_volume_surge),
+            ('technical_breakout', 'bars', self._screen_technical_breakout)
+        ])
+        # 查询语言使用的特征表，按股票池缓存
+        self.table_flight = SingleFlight('feature_table')
+        self._tables = {}
+        # 单只股票的条件检查，与流水线的各阶段一一对应
+        self.checks = {
+            'not_trending': lambda stock_data: self.check_not_trending(stock_data['symbol']),
+            'small_cap': self.check_market_cap,
+            'low_institutional': self.check_institutional_ownership,
+            'volume_surge': self.check_volume_surge,
+            'technical_breakout': self.check_technical_breakout
+        }
         
-    def scan_market(self) -> List[Dict]:
-        """扫描整个市场寻找符合条件的股票"""
-        # 获取纳斯达克所有股票列表（示例使用部分股票）
-        symbols = ["AAPL", "MSFT", "NVDA", "AMD", "TSLA", "MARA", "RIOT", "COIN"]
-        results = []
-        
-        for symbol in symbols:
+    def scan_market(self, symbols: List[str] = None) -> Dict:
+        """扫描整个市场寻找符合条件的股票
+
+        按流水线顺序逐阶段筛选：先用基本面淘汰，只为剩下的股票拉取K线并计算指标。
+        线程池并发拉取数据（最多 concurrency 只同时进行），单只股票失败不影响其余股票；
+        单只股票的超时只在异步版本中生效。
+        """
+        started = time.perf_counter()
+        ctx = ScreenContext(self._resolve_symbols(symbols))
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='scan') as pool:
+            self.pipeline.run(ctx, 'symbol')
+            self._load(ctx, 'fetch_fundamentals', ctx.infos, self._fetch_all(pool, fundamentals.get, ctx))
+            self.pipeline.run(ctx, 'info')
+            self._load(ctx, 'fetch_bars', ctx.bars, self._fetch_all(pool, self._fetch_bars, ctx))
+        return self._finish(ctx, started)
+
+    async def scan_market_async(self, symbols: List[str] = None, timeout: float = None) -> Dict:
+        """scan_market 的异步版本：信号量限制并发，每只股票单独计时，超时或失败的股票记入 failed 后继续"""
+        started = time.perf_counter()
+        ctx = ScreenContext(self._resolve_symbols(symbols))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        timeout = timeout or self.timeout
+        self.pipeline.run(ctx, 'symbol')
+        self._load(ctx, 'fetch_fundamentals', ctx.infos,
+                   await self._gather(semaphore, timeout, fundamentals.get_async, ctx))
+        self.pipeline.run(ctx, 'info')
+        self._load(ctx, 'fetch_bars', ctx.bars, await self._gather(semaphore, timeout, self._fetch_bars_async, ctx))
+        return await run_cpu(self._finish, ctx, started)
+
+    async def query_async(self, text: str, symbols: List[str] = None, timeout: float = None) -> Dict:
+        """用查询语言筛选股票池，如 "rsi14 between 50 and 70 and volume / avg30 > 3 and mcap < 5e9"
+
+        查询编译一次后缓存，对特征表做一次向量化计算；返回符合条件的股票及查询用到的字段值。
+        """
+        query = compile_query(text)  # 语法错误在拉取数据之前抛出
+        table = await self.feature_table_async(symbols, timeout)
+        started = time.perf_counter()
+        rows = np.flatnonzero(query(table.columns, len(table)))
+        fields = sorted(query.fields)
+        return {
+            'query': text,
+            'fields': fields,
+            'results': [
+                {'symbol': table.symbols[i], **{field: _finite(table.columns[field][i]) for field in fields}}
+                for i in rows
+            ],
+            'matched': len(rows),
+            'total': len(table) + len(table.failed),
+            'failed': table.failed,
+            'table_age': time.time() - table.built_at,
+            'elapsed': time.perf_counter() - started
+        }
+
+    async def feature_table_async(self, symbols: List[str] = None, timeout: float = None) -> FeatureTable:
+        """股票池的特征表：全部股票的基本面和K线指标，FEATURE_TABLE_TTL 内复用，并发请求只构建一次"""
+        symbols = self._resolve_symbols(symbols)
+        key = tuple(symbols)
+        table = self._tables.get(key)
+        if table is not None and time.time() - table.built_at < FEATURE_TABLE_TTL:
+            return table
+        table = await self.table_flight.do_async(key, self._build_table_async, symbols, timeout or self.timeout)
+        self._tables[key] = table
+        while len(self._tables) > MAX_FEATURE_TABLES:
+            self._tables.pop(min(self._tables, key=lambda k: self._tables[k].built_at))
+        return table
+
+    async def _build_table_async(self, symbols, timeout):
+        ctx = ScreenContext(symbols)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        self._load(ctx, 'fetch_fundamentals', ctx.infos,
+                   await self._gather(semaphore, timeout, fundamentals.get_async, ctx))
+        self._load(ctx, 'fetch_bars', ctx.bars, await self._gather(semaphore, timeout, self._fetch_bars_async, ctx))
+        return await run_cpu(FeatureTable.from_context, ctx)
+
+    @staticmethod
+    def _resolve_symbols(symbols):
+        """未指定股票时扫描整个股票池；代码统一大写并去重"""
+        symbols = symbols or load_universe()
+        return list(dict.fromkeys(symbol.upper() for symbol in symbols))
+
+    @staticmethod
+    def _fetch_all(pool, func, ctx):
+        """为仍存活的股票并发获取数据，返回 (股票列表, 结果或异常列表, 耗时)"""
+        started = time.perf_counter()
+        symbols = ctx.alive_symbols()
+        futures = [pool.submit(func, symbol) for symbol in symbols]
+        outcomes = []
+        for future in futures:
             try:
-                stock_data = self.analyze_stock(symbol)
-                if stock_data and self.check_conditions(stock_data):
-                    results.append(self.generate_report(stock_data))
+                outcomes.append(future.result())
             except Exception as e:
-                print(f"Error analyzing {symbol}: {str(e)}")
-                continue
-                
+                outcomes.append(e)
+        return symbols, outcomes, time.perf_counter() - started
+
+    @staticmethod
+    async def _gather(semaphore, timeout, func, ctx):
+        """_fetch_all 的异步版本，每只股票单独计时"""
+        started = time.perf_counter()
+        symbols = ctx.alive_symbols()
+
+        async def fetch(symbol):
+            async with semaphore:
+                return await asyncio.wait_for(func(symbol), timeout)
+
+        outcomes = await asyncio.gather(*(fetch(symbol) for symbol in symbols), return_exceptions=True)
+        return symbols, outcomes, time.perf_counter() - started
+
+    @staticmethod
+    def _load(ctx, stage, target, fetched):
+        symbols, outcomes, seconds = fetched
+        ctx.load(stage, symbols, outcomes, target, seconds)
+
+    def _fetch_bars(self, symbol):
+        """获取一只股票最近的K线，数据不可用时抛出异常"""
+        bars = self.analyzer.get_bars(symbol, SCAN_PERIOD)
+        if bars is None or len(bars) < 2:
+            raise ValueError("无法获取历史数据")
+        return bars.tail(SCAN_BARS)
+
+    async def _fetch_bars_async(self, symbol):
+        bars = await self.analyzer.get_bars_async(symbol, SCAN_PERIOD)
+        if bars is None or len(bars) < 2:
+            raise ValueError("无法获取历史数据")
+        return bars.tail(SCAN_BARS)
+
+    def _finish(self, ctx, started):
+        """执行K线阶段并为通过全部条件的股票生成报告，附带各阶段的耗时和淘汰数"""
+        self.pipeline.run(ctx, 'bars')
+        if ctx.failed:
+            logger.warning(f"扫描中 {len(ctx.failed)}/{len(ctx.symbols)} 只股票获取失败")
+
+        return {
+            'results': self._reports(ctx, ctx.rows()),
+            'total': len(ctx.symbols),
+            'failed': ctx.failed,
+            'stages': ctx.stages,
+            'elapsed': time.perf_counter() - started
+        }
+
+    def _reports(self, ctx, rows):
+        """为通过全部条件的股票生成报告"""
+        metrics = {name: ctx.value(name, rows) for name in REPORT_METRICS}
+        results = []
+        for j, i in enumerate(rows):
+            symbol = ctx.symbols[i]
+            stock_data = {name: values[j].item() for name, values in metrics.items()}
+            stock_data.update({
+                'symbol': symbol,
+                'history': ctx.bars[symbol].frame(),
+                'info': ctx.infos[symbol],
+                # 流水线已判断过的条件直接复用
+                'conditions': {name: True for name in self.pipeline.names}
+            })
+            results.append(self.generate_report(stock_data))
         return results
+
+    async def scan_market_stream(self, symbols: List[str] = None, timeout: float = None):
+        """逐只股票流式扫描的异步生成器：每只股票拉取完成后立即执行流水线，符合条件即产出报告
+
+        产出的事件：
+        - {'type': 'result', 'data': 报告}
+        - {'type': 'progress', 'processed', 'remaining', 'matched'}，最多每 PROGRESS_INTERVAL 秒一次
+        - 最后一个为 {'type': 'done', 'total', 'matched', 'failed', 'stages', 'elapsed'}，
+          stages 中的耗时为各股票耗时之和
+        报告产出后不再保留，调用方中途停止迭代时取消尚未完成的拉取。
+        """
+        started = time.perf_counter()
+        ctx = ScreenContext(self._resolve_symbols(symbols))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        timeout = timeout or self.timeout
+        self.pipeline.run(ctx, 'symbol')
+
+        total = len(ctx.symbols)
+        processed = total - len(ctx.rows())
+        matched = 0
+        reported_at = 0.0
+        tasks = [asyncio.ensure_future(self._stream_symbol(ctx, i, semaphore, timeout)) for i in ctx.rows()]
+        try:
+            for task in asyncio.as_completed(tasks):
+                report = await task
+                processed += 1
+                if report is not None:
+                    matched += 1
+                    yield {'type': 'result', 'data': report}
+                now = time.perf_counter()
+                if now - reported_at >= PROGRESS_INTERVAL or processed == total:
+                    reported_at = now
+                    yield {'type': 'progress', 'processed': processed, 'remaining': total - processed,
+                           'matched': matched}
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        yield {
+            'type': 'done',
+            'total': total,
+            'matched': matched,
+            'failed': ctx.failed,
+            'stages': ctx.stages,
+            'elapsed': time.perf_counter() - started
+        }
+
+    async def _stream_symbol(self, ctx, i, semaphore, timeout):
+        """单只股票走完整条流水线，符合条件时返回报告，否则返回 None"""
+        symbol = ctx.symbols[i]
+        rows = np.array([i])
+        for stage, target, fetch, requires in (
+            ('fetch_fundamentals', ctx.infos, fundamentals.get_async, 'info'),
+            ('fetch_bars', ctx.bars, self._fetch_bars_async, 'bars')
+        ):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    outcome = await asyncio.wait_for(fetch(symbol), timeout)
+                except Exception as e:
+                    outcome = e
+            ctx.load(stage, [symbol], [outcome], target, time.perf_counter() - started)
+            self.pipeline.run(ctx, requires, rows)
+            if not ctx.alive[i]:
+                return None
+        return self._reports(ctx, rows)[0]
+
+    # ---- 流水线各阶段（对 rows 中的股票一次向量化判断） ----
+
+    def _screen_not_trending(self, ctx, rows):
+        return ~np.isin([ctx.symbols[i] for i in rows], self.get_trending_stocks())
+
+    def _screen_small_cap(self, ctx, rows):
+        return ctx.value('market_cap', rows) < self.market_cap_threshold
+
+    def _screen_low_institutional(self, ctx, rows):
+        return ctx.value('institutional_ownership', rows) < self.institutional_ownership_threshold
+
+    def _screen_volume_surge(self, ctx, rows):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = ctx.value('current_volume', rows) / ctx.value('avg_volume_30d', rows) * 100
+        return ratio > self.volume_surge_threshold
+
+    def _screen_technical_breakout(self, ctx, rows):
+        price, rsi = ctx.value('price', rows), ctx.value('rsi14', rows)
+        return (price > ctx.value('ma20', rows)) & (rsi > 50) & (rsi < 70) \
+            & (ctx.value('current_volume', rows) > ctx.value('avg_volume_20d', rows))
     
     def analyze_stock(self, symbol: str) -> Dict:
         """分析单个股票的所有相关数据"""
-        stock = yf.Ticker(symbol)
+        provider = get_provider()
         
         # 获取历史数据
-        hist = stock.history(period='60d')  # 获取60天数据用于计算均值
+        hist = provider.history(symbol, period='60d')  # 获取60天数据用于计算均值
         if hist.empty:
             return None
             
-        # 获取公司信息
-        info = stock.info
+        # 获取公司信息（每日快照）
+        info = fundamentals.get(symbol)
         
         return {
             'symbol': symbol,
             'history': hist,
             'info': info,
-            'institutional_ownership': self.get_institutional_ownership(symbol),
+            'institutional_ownership': _institutional_ownership(info),
             'market_cap': info.get('marketCap', float('inf')),
-            'current_volume': hist['Volume'][-1],
+            'current_volume': hist['Volume'].iloc[-1],
             'avg_volume_30d': hist['Volume'][-30:].mean(),
-            'price': hist['Close'][-1],
-            'price_change': ((hist['Close'][-1] - hist['Close'][-2]) / hist['Close'][-2]) * 100,
-            'volume_change': ((hist['Volume'][-1] - hist['Volume'][-2]) / hist['Volume'][-2]) * 100
+            'price': hist['Close'].iloc[-1],
+            'price_change': ((hist['Close'].iloc[-1] - hist['Close'].iloc[-2]) / hist['Close'].iloc[-2]) * 100,
+            'volume_change': ((hist['Volume'].iloc[-1] - hist['Volume'].iloc[-2]) / hist['Volume'].iloc[-2]) * 100
         }
     
     def check_conditions(self, stock_data: Dict) -> bool:
-        """检查股票是否满足所有条件"""
-        conditions = {
-            'volume_surge': self.check_volume_surge(stock_data),
-            'not_trending': self.check_not_trending(stock_data['symbol']),
-            'low_institutional': self.check_institutional_ownership(stock_data),
-            'small_cap': self.check_market_cap(stock_data),
-            'technical_breakout': self.check_technical_breakout(stock_data)
-        }
-        
-        return all(conditions.values())
+        """检查股票是否满足所有条件：按流水线的成本顺序判断，有一项不满足即返回"""
+        return all(self.condition(stock_data, name) for name in self.pipeline.names)
+
+    def condition(self, stock_data: Dict, name: str) -> bool:
+        """单项条件的结果，记录在 stock_data['conditions'] 中，同一只股票不重复计算"""
+        conditions = stock_data.setdefault('conditions', {})
+        if name not in conditions:
+            conditions[name] = bool(self.checks[name](stock_data))
+        return conditions[name]
     
     def check_volume_surge(self, stock_data: Dict) -> bool:
         """检查成交量是否突增300%以上"""
@@ -89,9 +390,8 @@ class StockScanner:
     def get_institutional_ownership(self, symbol: str) -> float:
         """获取机构持股比例"""
         try:
-            stock = yf.Ticker(symbol)
             # 实际应该从更可靠的数据源获取
-            return stock.info.get('institutionalOwnership', 0) * 100
+            return _institutional_ownership(fundamentals.get(symbol))
         except:
             return 0
     
@@ -103,21 +403,20 @@ class StockScanner:
         """检查技术面是否突破"""
         hist = stock_data['history']
         
+        close = hist['Close'].to_numpy(dtype=float)
+        volume = hist['Volume'].to_numpy(dtype=float)
+        
         # 计算技术指标
         # 1. 突破20日均线
-        ma20 = hist['Close'].rolling(window=20).mean()
-        price_above_ma = hist['Close'][-1] > ma20[-1]
+        ma20 = indicators.sma(close, 20)
+        price_above_ma = close[-1] > ma20[-1]
         
         # 2. RSI指标
-        delta = hist['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        rsi = 100 - (100 / (1 + rs))
+        rsi = indicators.rsi(close, 14)
         rsi_bullish = rsi[-1] > 50 and rsi[-1] < 70
         
         # 3. 成交量确认
-        volume_confirmation = hist['Volume'][-1] > hist['Volume'][-20:].mean()
+        volume_confirmation = volume[-1] > volume[-20:].mean()
         
         return price_above_ma and rsi_bullish and volume_confirmation
     
@@ -142,7 +441,7 @@ class StockScanner:
         """获取技术面分析"""
         hist = stock_data['history']
         return {
-            'ma_analysis': '突破20日均线' if self.check_technical_breakout(stock_data) else '未突破',
+            'ma_analysis': '突破20日均线' if self.condition(stock_data, 'technical_breakout') else '未突破',
             'volume_analysis': f"成交量较30日均值增加{((stock_data['current_volume']/stock_data['avg_volume_30d'])-1)*100:.2f}%",
             'price_momentum': '上升趋势' if stock_data['price_change'] > 0 else '下降趋势'
         }
@@ -170,10 +469,16 @@ class StockScanner:
     def get_alerts(self, stock_data: Dict) -> List[str]:
         """生成警报信息"""
         alerts = []
-        if self.check_volume_surge(stock_data):
+        if self.condition(stock_data, 'volume_surge'):
             alerts.append(f"成交量突增{((stock_data['current_volume']/stock_data['avg_volume_30d'])-1)*100:.2f}%")
-        if self.check_technical_breakout(stock_data):
+        if self.condition(stock_data, 'technical_breakout'):
             alerts.append("技术面突破")
         if stock_data['institutional_ownership'] < self.institutional_ownership_threshold:
             alerts.append(f"机构持股较低({stock_data['institutional_ownership']:.2f}%)")
-        return alerts 
\ No newline at end of file
+        return alerts
+
+
+def _finite(value):
+    """JSON输出：NaN和无穷大转换为None"""
+    value = float(value)
+    return value if np.isfinite(value) else None
@@ -0,0 +1,455 @@
+"""增量（流式）技术指标
+
+每个指标对象保存计算所需的最小状态，用历史K线初始化一次后，每根新K线 O(1) 更新，
+不再对全部历史重新计算。状态可通过 to_dict/from_dict 序列化，重启后从磁盘恢复继续计算。
+数值与 services.indicators 的批量实现一致（EMA 逐位一致，滑动窗口在浮点舍入误差内一致）。
+"""
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import deque
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+NAN = float('nan')
+
+_STATE_TYPES = {}
+
+
+def _register(cls):
+    _STATE_TYPES[cls.__name__] = cls
+    return cls
+
+
+def state_from_dict(data):
+    """根据 to_dict 中记录的类型还原指标对象"""
+    return _STATE_TYPES[data['type']].from_dict(data)
+
+
+def _strength_index(up, down):
+    """100 - 100 / (1 + up/down)，除零语义与 NumPy 相同（down 为0时为100，均为0时为NaN）"""
+    if down == 0:
+        return 100.0 if up > 0 else NAN
+    return 100 - (100 / (1 + up / down))
+
+
+class StreamingIndicator:
+    """流式指标基类：update 接收一根K线的数值并返回最新指标值"""
+
+    def update(self, *values):
+        raise NotImplementedError
+
+    def seed(self, *series):
+        """用历史序列初始化（逐根调用 update），返回最后一个指标值"""
+        value = NAN
+        for row in zip(*series):
+            value = self.update(*row)
+        return value
+
+    def to_dict(self):
+        data = {key: value for key, value in self.__dict__.items()}
+        data['type'] = type(self).__name__
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls.__new__(cls)
+        state.__dict__.update({key: value for key, value in data.items() if key != 'type'})
+        return state
+
+
+@_register
+class RollingWindow(StreamingIndicator):
+    """滑动窗口求和/均值：维护窗口内数值与累计和，窗口未满时均值为NaN
+
+    为避免累计和长期加减产生的误差，每滑过一个完整窗口重新求和一次（均摊仍为 O(1)）。
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.total = 0.0
+        self._since_resum = 0
+
+    def update(self, value):
+        if len(self.values) == self.window:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+        self._since_resum += 1
+        if self._since_resum >= self.window:
+            self.total = math.fsum(self.values)
+            self._since_resum = 0
+        return self.mean
+
+    @property
+    def full(self):
+        return len(self.values) == self.window
+
+    @property
+    def sum(self):
+        return self.total if self.full else NAN
+
+    @property
+    def mean(self):
+        return self.total / self.window if self.full else NAN
+
+    def to_dict(self):
+        return {
+            'type': type(self).__name__,
+            'window': self.window,
+            'values': list(self.values),
+            'total': self.total,
+            '_since_resum': self._since_resum
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls(data['window'])
+        state.values.extend(data['values'])
+        state.total = data['total']
+        state._since_resum = data['_since_resum']
+        return state
+
+
+@_register
+class EMA(StreamingIndicator):
+    """指数移动平均，与 ewm(adjust=False).mean() 的递推相同（NaN 跳过，权重继续衰减）"""
+
+    def __init__(self, span=None, alpha=None):
+        self.alpha = alpha if alpha is not None else 1.0 / (1.0 + (span - 1) / 2.0)
+        self.value = NAN
+        self.old_wt = 1.0
+
+    def update(self, value):
+        alpha = self.alpha
+        started = self.value == self.value
+        observed = value == value
+        if started:
+            self.old_wt *= 1.0 - alpha
+            if observed:
+                if self.value != value:
+                    self.value = (self.old_wt * self.value + alpha * value) / (self.old_wt + alpha)
+                self.old_wt = 1.0
+        elif observed:
+            self.value = value
+        return self.value
+
+
+@_register
+class MACD(StreamingIndicator):
+    """MACD：value 为 (macd线, 信号线)"""
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal = EMA(signal)
+        self.value = (NAN, NAN)
+
+    def update(self, close):
+        line = self.fast.update(close) - self.slow.update(close)
+        self.value = (line, self.signal.update(line))
+        return self.value
+
+    def to_dict(self):
+        return {
+            'type': type(self).__name__,
+            'fast': self.fast.to_dict(),
+            'slow': self.slow.to_dict(),
+            'signal': self.signal.to_dict(),
+            'value': list(self.value)
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls.__new__(cls)
+        state.fast = EMA.from_dict(data['fast'])
+        state.slow = EMA.from_dict(data['slow'])
+        state.signal = EMA.from_dict(data['signal'])
+        state.value = tuple(data['value'])
+        return state
+
+
+@_register
+class RSI(StreamingIndicator):
+    """RSI：method='sma' 为简单移动平均（项目原有算法），'wilder' 为 Wilder 平滑"""
+
+    def __init__(self, window=14, method='sma'):
+        self.window = window
+        self.method = method
+        if method == 'wilder':
+            self.gain = EMA(alpha=1.0 / window)
+            self.loss = EMA(alpha=1.0 / window)
+        else:
+            self.gain = RollingWindow(window)
+            self.loss = RollingWindow(window)
+        self.prev_close = NAN
+        self.value = NAN
+
+    def update(self, close):
+        # 第一根K线没有前收，涨跌均计为0
+        delta = close - self.prev_close if self.prev_close == self.prev_close else 0.0
+        gain = self.gain.update(delta if delta > 0 else 0.0)
+        loss = self.loss.update(-delta if delta < 0 else 0.0)
+        self.prev_close = close
+        self.value = _strength_index(gain, loss) if gain == gain and loss == loss else NAN
+        return self.value
+
+    def to_dict(self):
+        return {
+            'type': type(self).__name__,
+            'window': self.window,
+            'method': self.method,
+            'gain': self.gain.to_dict(),
+            'loss': self.loss.to_dict(),
+            'prev_close': self.prev_close,
+            'value': self.value
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls.__new__(cls)
+        state.window = data['window']
+        state.method = data['method']
+        state.gain = state_from_dict(data['gain'])
+        state.loss = state_from_dict(data['loss'])
+        state.prev_close = data['prev_close']
+        state.value = data['value']
+        return state
+
+
+@_register
+class OBV(StreamingIndicator):
+    """能量潮 OBV：收盘价不高于前一日记为流出，首根K线记为流入"""
+
+    def __init__(self):
+        self.prev_close = NAN
+        self.value = 0.0
+
+    def update(self, close, volume):
+        rising = not (close - self.prev_close <= 0)
+        self.value += volume if rising else -volume
+        self.prev_close = close
+        return self.value
+
+
+@_register
+class MFI(StreamingIndicator):
+    """资金流量指标 MFI"""
+
+    def __init__(self, window=14):
+        self.window = window
+        self.positive = RollingWindow(window)
+        self.negative = RollingWindow(window)
+        self.prev_tp = NAN
+        self.value = NAN
+
+    def update(self, high, low, close, volume):
+        tp = (high + low + close) / 3
+        raw_money_flow = tp * volume
+        self.positive.update(raw_money_flow if tp > self.prev_tp else 0.0)
+        self.negative.update(raw_money_flow if tp < self.prev_tp else 0.0)
+        self.prev_tp = tp
+        if self.positive.full:
+            self.value = _strength_index(self.positive.sum, self.negative.sum)
+        return self.value
+
+    def to_dict(self):
+        return {
+            'type': type(self).__name__,
+            'window': self.window,
+            'positive': self.positive.to_dict(),
+            'negative': self.negative.to_dict(),
+            'prev_tp': self.prev_tp,
+            'value': self.value
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls.__new__(cls)
+        state.window = data['window']
+        state.positive = RollingWindow.from_dict(data['positive'])
+        state.negative = RollingWindow.from_dict(data['negative'])
+        state.prev_tp = data['prev_tp']
+        state.value = data['value']
+        return state
+
+
+@_register
+class RollingExtreme(StreamingIndicator):
+    """滑动窗口最大值（mode='max'）或最小值（mode='min'）
+
+    单调队列保存窗口内可能成为极值的 (序号, 数值)，每次更新均摊 O(1)；
+    窗口未满时返回已有数据的极值，NaN 占用窗口位置但不参与比较。
+    """
+
+    def __init__(self, window, mode='max'):
+        self.window = window
+        self.mode = mode
+        self.count = 0
+        self.queue = deque()
+
+    def update(self, value):
+        if value == value:
+            if self.mode == 'max':
+                while self.queue and self.queue[-1][1] <= value:
+                    self.queue.pop()
+            else:
+                while self.queue and self.queue[-1][1] >= value:
+                    self.queue.pop()
+            self.queue.append((self.count, value))
+        self.count += 1
+        while self.queue and self.queue[0][0] < self.count - self.window:
+            self.queue.popleft()
+        return self.value
+
+    @property
+    def value(self):
+        return self.queue[0][1] if self.queue else NAN
+
+    def to_dict(self):
+        return {
+            'type': type(self).__name__,
+            'window': self.window,
+            'mode': self.mode,
+            'count': self.count,
+            'queue': [list(item) for item in self.queue]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls(data['window'], data['mode'])
+        state.count = data['count']
+        state.queue.extend(tuple(item) for item in data['queue'])
+        return state
+
+
+class IndicatorSet:
+    """单只股票/周期的一组流式指标，按K线时间戳推进
+
+    时间戳早于最后一根的K线直接忽略；与最后一根相同时视为该K线的修正（盘中未收盘的K线），
+    先回退到这根K线之前的状态再重新计算，因此同一根K线可以反复更新。
+    """
+
+    def __init__(self, rsi_window=14, rsi_method='sma', mfi_window=14, volume_window=5):
+        self.macd = MACD()
+        self.rsi = RSI(rsi_window, rsi_method)
+        self.mfi = MFI(mfi_window)
+        self.obv = OBV()
+        self.volume = RollingWindow(volume_window)
+        self.last_timestamp = None
+        self.last_bar = None
+        self._previous = None
+
+    def _states(self):
+        return {
+            'macd': self.macd.to_dict(),
+            'rsi': self.rsi.to_dict(),
+            'mfi': self.mfi.to_dict(),
+            'obv': self.obv.to_dict(),
+            'volume': self.volume.to_dict()
+        }
+
+    def _restore(self, states):
+        for name, data in states.items():
+            setattr(self, name, state_from_dict(data))
+
+    def update(self, timestamp, high, low, close, volume):
+        """推进一根K线，返回是否改变了状态"""
+        timestamp = int(timestamp)
+        if self.last_timestamp is not None:
+            if timestamp < self.last_timestamp:
+                return False
+            if timestamp == self.last_timestamp:
+                if self.last_bar == [high, low, close, volume]:
+                    return False
+                self._restore(self._previous)
+            else:
+                self._previous = self._states()
+        else:
+            self._previous = self._states()
+
+        self.macd.update(close)
+        self.rsi.update(close)
+        self.mfi.update(high, low, close, volume)
+        self.obv.update(close, volume)
+        self.volume.update(volume)
+        self.last_timestamp = timestamp
+        self.last_bar = [high, low, close, volume]
+        return True
+
+    def seed(self, timestamps, high, low, close, volume):
+        """用历史K线推进（已处理过的K线自动跳过），返回是否有新K线"""
+        changed = False
+        for timestamp, *values in zip(timestamps, high, low, close, volume):
+            changed = self.update(timestamp, *(float(value) for value in values)) or changed
+        return changed
+
+    def snapshot(self):
+        """当前指标值"""
+        macd, signal = self.macd.value
+        return {
+            'macd': macd,
+            'macd_signal': signal,
+            'rsi': self.rsi.value,
+            'mfi': self.mfi.value,
+            'obv': self.obv.value,
+            'volume_ma': self.volume.mean
+        }
+
+    def to_dict(self):
+        return {
+            'states': self._states(),
+            'previous': self._previous,
+            'last_timestamp': self.last_timestamp,
+            'last_bar': self.last_bar
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        indicator_set = cls.__new__(cls)
+        indicator_set._restore(data['states'])
+        indicator_set._previous = data['previous']
+        indicator_set.last_timestamp = data['last_timestamp']
+        indicator_set.last_bar = data['last_bar']
+        return indicator_set
+
+
+class IndicatorStateStore:
+    """流式指标状态的本地持久化：每个 股票/周期 一个JSON文件
+
+    state_type 为状态类（需实现 to_dict/from_dict），默认为 IndicatorSet。
+    """
+
+    def __init__(self, root, state_type=None):
+        self.root = Path(root)
+        self.state_type = state_type or IndicatorSet
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def path(self, symbol, interval):
+        safe = re.sub(r'[^A-Za-z0-9._\-=^]', '_', symbol.upper())
+        return self.root / f"{safe}_{interval}.state.json"
+
+    def load(self, symbol, interval):
+        """读取状态，不存在或损坏时返回 None"""
+        try:
+            with open(self.path(symbol, interval), 'r', encoding='utf-8') as f:
+                return self.state_type.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"读取{symbol}指标状态失败: {str(e)}")
+            return None
+
+    def save(self, symbol, interval, state):
+        path = self.path(symbol, interval)
+        tmp = path.with_suffix(f'.{threading.get_ident()}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state.to_dict(), f)
+        with self._lock:
+            os.replace(tmp, path)
@@ -0,0 +1,182 @@
+"""向量化实现与原 pandas 实现 / 单日回测的一致性测试（使用离线回放数据源，不访问网络）
+
+运行：在 backend 目录下执行 python -m pytest -q tests
+"""
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault('MARKET_DATA_PROVIDER', 'replay')
+os.environ.setdefault('REPLAY_NOW', '2024-06-28T21:00:00')
+
+from services.stock_analyzer import _money_flows, _technical_signals, _volatility_alerts, _volume_alerts  # noqa: E402
+
+
+# ---- 原 StockAnalyzer 中的 pandas 实现（基准） ----
+
+def baseline_volume_alert(data):
+    avg_volume = data['Volume'].rolling(5).mean().iloc[-1]
+    latest_volume = data['Volume'].iloc[-1]
+    if latest_volume > avg_volume * 2:
+        return "成交量突破：当前成交量是5日均值的2倍以上"
+    elif latest_volume < avg_volume * 0.5:
+        return "交易清淡：当前成交量不足5日均值一半"
+    return "成交量处于正常波动区间"
+
+
+def baseline_technical_signals(data):
+    signals = []
+    exp1 = data['Close'].ewm(span=12, adjust=False).mean()
+    exp2 = data['Close'].ewm(span=26, adjust=False).mean()
+    macd = exp1 - exp2
+    signal = macd.ewm(span=9, adjust=False).mean()
+    if macd.iloc[-1] > signal.iloc[-1] and macd.iloc[-2] <= signal.iloc[-2]:
+        signals.append("MACD金叉")
+    elif macd.iloc[-1] < signal.iloc[-1] and macd.iloc[-2] >= signal.iloc[-2]:
+        signals.append("MACD死叉")
+    delta = data['Close'].diff()
+    gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
+    rsi = 100 - (100 / (1 + gain / loss))
+    if rsi.iloc[-1] > 70:
+        signals.append(f"RSI超买 ({rsi.iloc[-1]:.1f})")
+    elif rsi.iloc[-1] < 30:
+        signals.append(f"RSI超卖 ({rsi.iloc[-1]:.1f})")
+    return signals
+
+
+def baseline_volatility_alert(data):
+    returns = data['Close'].pct_change().dropna()
+    threshold = returns.std() * 1.5
+    clusters = [1 if abs(r) > threshold else 0 for r in returns[-5:]]
+    if sum(clusters) >= 3:
+        return "波动率聚集预警：近期出现3次以上异常波动"
+    return "波动率正常"
+
+
+def baseline_money_flow(data):
+    price_change = data['Close'].pct_change() * 100
+    volume_change = data['Volume'].pct_change() * 100
+    typical_price = (data['High'] + data['Low'] + data['Close']) / 3
+    raw_money_flow = typical_price * data['Volume']
+    positive_flow = raw_money_flow.where(typical_price > typical_price.shift(1), 0).rolling(window=10).sum()
+    negative_flow = raw_money_flow.where(typical_price < typical_price.shift(1), 0).rolling(window=10).sum()
+    mfi = 100 - (100 / (1 + positive_flow / negative_flow))
+    obv = (data['Volume'] * (~data['Close'].diff().le(0) * 2 - 1)).cumsum()
+    obv_change = obv.diff(3) / obv.abs().mean() * 100
+
+    current_price_change = price_change.iloc[-1]
+    current_volume_change = volume_change.iloc[-1]
+    current_mfi = mfi.iloc[-1]
+    current_obv_change = obv_change.iloc[-1]
+    is_strong_uptrend = current_price_change > 2 and current_volume_change > 30 and current_obv_change > 3
+    is_strong_downtrend = current_price_change < -2 and current_volume_change > 30 and current_obv_change < -3
+    if is_strong_uptrend:
+        return "主力资金大量涌入：强势上涨" if current_mfi > 70 else "资金加速流入：看涨信号"
+    if is_strong_downtrend:
+        return "资金加速流出：看空信号" if current_mfi < 30 else "资金持续流出：注意风险"
+    if current_mfi > 70 and current_obv_change < -3:
+        return "资金流出警告：获利回吐"
+    if current_mfi < 30 and current_obv_change > 3:
+        return "资金流入信号：低位吸筹"
+    if current_mfi > 55 and current_obv_change > 2:
+        return "资金持续流入：多头占优"
+    if current_mfi < 45 and current_obv_change < -2:
+        return "资金逐步流出：空头占优"
+    if current_price_change > 0.5 and current_volume_change > 10:
+        return "资金小幅流入：短线看多"
+    if current_price_change < -0.5 and current_volume_change > 10:
+        return "资金小幅流出：短线谨慎"
+    return "资金流向观望：等待信号"
+
+
+# ---- 测试数据 ----
+
+def random_frames(seed, count, length):
+    """随机K线：收盘价和成交量包含重复值（平盘、等量），覆盖比较运算的相等情况"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(count):
+        steps = rng.normal(0, rng.uniform(0.005, 0.05), length)
+        steps[rng.random(length) < 0.1] = 0.0
+        close = np.round(50 * np.exp(np.cumsum(steps)), 2)
+        spread = np.abs(rng.normal(0, 0.01, length)) * close
+        volume = rng.choice([1e5, 2e5, 3e5, 8e5], length) * rng.integers(1, 4, length)
+        frames.append(pd.DataFrame({
+            'Open': close, 'High': close + spread, 'Low': close - spread, 'Close': close, 'Volume': volume
+        }, index=pd.bdate_range('2024-01-01', periods=length)))
+    return frames
+
+
+def stacked(frames):
+    return tuple(np.vstack([frame[column].to_numpy(dtype=float) for frame in frames])
+                 for column in ('High', 'Low', 'Close', 'Volume'))
+
+
+@pytest.mark.parametrize('length', [2, 3, 6, 15, 30, 60])
+def test_vectorized_reports_match_pandas(length):
+    frames = random_frames(length, 200, length)
+    high, low, close, volume = stacked(frames)
+    assert _technical_signals(close) == [baseline_technical_signals(frame) for frame in frames]
+    assert _volatility_alerts(close) == [baseline_volatility_alert(frame) for frame in frames]
+    assert _money_flows(high, low, close, volume) == [baseline_money_flow(frame) for frame in frames]
+    assert _volume_alerts(volume) == [baseline_volume_alert(frame) for frame in frames]
+
+
+def test_volume_alert_ties():
+    # 最新成交量恰好等于5日均量的2倍 / 一半时不触发
+    volume = np.array([[3.0, 3.0, 3.0, 3.0, 8.0], [9.0, 9.0, 9.0, 9.0, 4.0]])
+    frames = [pd.DataFrame({'Volume': row}) for row in volume]
+    assert _volume_alerts(volume) == [baseline_volume_alert(frame) for frame in frames]
+
+
+def test_replay_series_match_pandas():
+    from services.stock_analyzer import StockAnalyzer
+
+    analyzer = StockAnalyzer()
+    for symbol in ('AAPL', 'MSFT', 'NVDA', 'TSLA'):
+        hist = analyzer.get_stock_data(symbol, '1y')
+        for end in range(30, len(hist), 7):
+            window = hist.iloc[:end]
+            assert analyzer.generate_technical_signals(window) == baseline_technical_signals(window)
+            assert analyzer.volatility_cluster_alert(window) == baseline_volatility_alert(window)
+            assert analyzer.money_flow_analysis(window) == baseline_money_flow(window)
+            assert analyzer.detect_abnormal_volume(window) == baseline_volume_alert(window)
+
+
+def test_insufficient_data_is_reported():
+    with pytest.raises(ValueError):
+        _technical_signals(np.array([[1.0]]))
+
+
+@pytest.mark.parametrize('symbol, start_date, end_date', [
+    ('AAPL', '2024-01-02', '2024-03-29'),
+    ('NVDA', '2024-02-10', '2024-04-30'),
+    ('TSLA', '2024-05-01', '2024-06-28'),
+])
+def test_range_backtest_matches_single_day(monkeypatch, symbol, start_date, end_date):
+    """区间回测第 D 天的报告与 backtest_analysis(symbol, start_date, D) 相同，单日报错的日期不出现在区间结果中"""
+    from services.stock_analyzer import StockAnalyzer
+
+    analyzer = StockAnalyzer()
+    # 比较计算结果本身，不经过结果缓存
+    monkeypatch.setattr(analyzer, 'backtest_cache_get', lambda *args: None)
+    monkeypatch.setattr(analyzer, 'backtest_cache_put', lambda *args: None)
+
+    result = analyzer.backtest_range(symbol, start_date, end_date)
+    assert 'error' not in result
+    by_date = {report['date']: report for report in result['days']}
+    assert by_date
+
+    for day in pd.date_range(start_date, end_date).strftime('%Y-%m-%d'):
+        single = analyzer.backtest_analysis(symbol, start_date, day)
+        if 'error' in single:
+            assert day not in by_date
+        else:
+            assert by_date.pop(day) == single
+    assert not by_date